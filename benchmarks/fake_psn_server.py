@@ -0,0 +1,249 @@
+"""Local PSN emulation for end-to-end load tests of the plugin
+
+The server answers the endpoints the plugin uses (OAuth redirects, gamelist, trophyTitles,
+trophies, profiles, accounts and store) with paginated records of a synthetic account from
+sync_scale.FakePSN. Requests are routed by the host kept as the first path segment, which is
+how HttpClient sends them when pointed at the server with PSN_PLUGIN_BASE_URL (see rebase_url).
+
+Every response is delayed by a latency drawn from a log-normal distribution, and a share of
+requests can be failed with 503 or throttled with 429.
+
+Usage:
+    python benchmarks/fake_psn_server.py serve [--port 8080] [options]
+        serves until interrupted; run the plugin with PSN_PLUGIN_BASE_URL=http://127.0.0.1:8080
+    python benchmarks/fake_psn_server.py run [options]
+        syncs a plugin against a server in the same process and reports throughput and latency
+Options: --account "1k titles" --latency 0.05 --sigma 0.5 --error-rate 0.01 --throttle-rate 0.01
+    --rate-limits (keeps the plugin's PSN rate limits, which cap the throughput by design)
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from unittest.mock import MagicMock
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from galaxy.api.errors import ApplicationError  # noqa: E402
+from endpoints import endpoint_name  # noqa: E402
+from http_client import BASE_URL_ENV, OAUTH_LOGIN_REDIRECT_URL, OAUTH_URL_BASE  # noqa: E402
+from plugin import PSNPlugin  # noqa: E402
+from rate_limit import RateLimiters  # noqa: E402
+from sync_scale import ACCOUNTS, Account, FakePSN, sync_operations  # noqa: E402
+
+
+@dataclass
+class Latency:
+    """Log-normal latency given by its median in seconds; sigma 0 makes it constant"""
+    median: float = 0.0
+    sigma: float = 0.0
+
+    def sample(self, rnd: random.Random) -> float:
+        if not self.sigma:
+            return self.median
+        return self.median * math.exp(rnd.gauss(0, self.sigma))
+
+
+@dataclass
+class Faults:
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: int = 1
+
+
+@dataclass
+class FakePSNServer:
+    account: Account
+    latency: Latency = field(default_factory=Latency)
+    # per endpoint name overrides of latency
+    latencies: Dict[str, Latency] = field(default_factory=dict)
+    faults: Faults = field(default_factory=Faults)
+    seed: int = 0
+
+    def __post_init__(self):
+        self.psn = FakePSN(self.account)
+        self.requests: Counter = Counter()
+        self.injected: Counter = Counter()
+        self._random = random.Random(self.seed)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts serving, returns the base url to point the plugin at"""
+        app = web.Application()
+        app.router.add_route("*", "/{host}/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return "http://{}:{}".format(host, port)
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        url = "https://{}/{}".format(request.match_info["host"], request.match_info["path"])
+        if request.query_string:
+            url += "?" + request.query_string
+        endpoint = endpoint_name(url)
+        self.requests[endpoint] += 1
+        await asyncio.sleep(self.latencies.get(endpoint, self.latency).sample(self._random))
+
+        chance = self._random.random()
+        if chance < self.faults.throttle_rate:
+            self.injected[(endpoint, 429)] += 1
+            return web.Response(status=429, headers={"Retry-After": str(self.faults.retry_after)})
+        if chance < self.faults.throttle_rate + self.faults.error_rate:
+            self.injected[(endpoint, 503)] += 1
+            return web.Response(status=503)
+
+        if endpoint == "OAUTH_URL":
+            return self._oauth(request)
+        if request.method == "POST":
+            # store session
+            return web.json_response({})
+        if not self.psn.handles(endpoint):
+            return web.Response(status=404)
+        return web.Response(body=json.dumps(self.psn.respond(url)).encode(), content_type="application/json")
+
+    @staticmethod
+    def _oauth(request: web.Request) -> web.Response:
+        # two hops, like the authorize endpoint redirecting to itself before handing out the token
+        if "hop" not in request.query:
+            response = web.Response(status=302, headers={"Location": OAUTH_URL_BASE + "&hop=2"})
+            response.set_cookie("session", "fake session")
+            return response
+        return web.Response(status=302, headers={
+            "Location": OAUTH_LOGIN_REDIRECT_URL + "#access_token=fake-access-token&token_type=bearer&expires_in=3600"
+        })
+
+
+def _percentile(samples: List[float], percentile: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+async def run_sync(server: FakePSNServer, rate_limits: bool = False) -> Dict[str, Dict]:
+    """Syncs a plugin created with BASE_URL_ENV pointing at the running server; per operation wall time, requests, failures
+    and p50/p95 latency of the GETs as seen by the plugin
+    """
+    plugin = PSNPlugin(MagicMock(), MagicMock(), None)
+    if not rate_limits:
+        plugin._http_client.rate_limiters = RateLimiters({})
+    latencies: List[float] = []
+    sync_latencies: List[float] = []
+    get = plugin._http_client.get
+
+    async def timed_get(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await get(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    plugin._http_client.get = timed_get
+    results = {}
+    try:
+        await plugin.authenticate({"npsso": "npsso"})
+        for name, operation in sync_operations(plugin, server.psn):
+            requests = sum(server.requests.values())
+            del latencies[:]
+            start = time.perf_counter()
+            error = None
+            try:
+                await operation()
+            except ApplicationError as exc:
+                error = repr(exc)
+            wall_time = time.perf_counter() - start
+            sent = sum(server.requests.values()) - requests
+            sync_latencies.extend(latencies)
+            results[name] = {
+                "wall_time": wall_time,
+                "requests": sent,
+                "throughput": sent / wall_time if wall_time else 0.0,
+                "latency_p50": _percentile(latencies, 50),
+                "latency_p95": _percentile(latencies, 95),
+                "error": error,
+            }
+        wall_time = sum(result["wall_time"] for result in results.values())
+        sent = sum(result["requests"] for result in results.values())
+        results["full sync"] = {
+            "wall_time": wall_time,
+            "requests": sent,
+            "throughput": sent / wall_time if wall_time else 0.0,
+            "latency_p50": _percentile(sync_latencies, 50),
+            "latency_p95": _percentile(sync_latencies, 95),
+            "error": None,
+        }
+    finally:
+        await plugin.shutdown()
+    return results
+
+
+def _server_from_args(args) -> FakePSNServer:
+    return FakePSNServer(
+        ACCOUNTS[args.account],
+        latency=Latency(args.latency, args.sigma),
+        faults=Faults(error_rate=args.error_rate, throttle_rate=args.throttle_rate)
+    )
+
+
+async def _serve(args):
+    server = _server_from_args(args)
+    base_url = await server.start(args.host, args.port)
+    print("Serving {} at {}".format(args.account, base_url))
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await server.stop()
+
+
+async def _run(args):
+    server = _server_from_args(args)
+    os.environ[BASE_URL_ENV] = await server.start(args.host, args.port)
+    try:
+        results = await run_sync(server, args.rate_limits)
+    finally:
+        await server.stop()
+    print("{:<30}{:>10}{:>10}{:>10}{:>10}{:>10}  {}".format(
+        "operation", "wall [s]", "requests", "req/s", "p50 [s]", "p95 [s]", "error"))
+    for name, result in results.items():
+        print("{:<30}{:>10.3f}{:>10}{:>10.0f}{:>10.3f}{:>10.3f}  {}".format(
+            name, result["wall_time"], result["requests"], result["throughput"],
+            result["latency_p50"], result["latency_p95"], result["error"] or ""))
+    print("Injected faults: {}".format(dict(server.injected) or "none"))
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("serve", "run"))
+    parser.add_argument("--account", default="100 titles", choices=list(ACCOUNTS))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.02, help="median latency in seconds")
+    parser.add_argument("--sigma", type=float, default=0.5, help="spread of the log-normal latency")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limits", action="store_true")
+    args = parser.parse_args()
+    if args.command == "serve" and not args.port:
+        args.port = 8080
+    asyncio.get_event_loop().run_until_complete(_serve(args) if args.command == "serve" else _run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Estimates bandwidth saved per full sync by requesting only the fields each parser consumes
+
+Sample records hold everything an endpoint can return. They are projected to the field sets
+requested by the URLs in psn_client and by the URLs used before the projection, so the saving
+follows any change to psn_client.FIELDS. What "@default" expands to is listed per resource.
+
+Trophy titles and communication id lookups keep @default and are not listed.
+
+Usage: python benchmarks/payload_size.py [titles] [earned trophies] [friends]
+"""
+import json
+import os
+import re
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from psn_client import EARNED_TROPHIES_PAGE, FRIENDS_WITH_PRESENCE_URL, GAME_LIST_URL  # noqa: E402
+
+# fields query parameters of the URLs before the projection
+PREVIOUS_FIELDS = {
+    "owned games": "@default",
+    "earned trophies": "@default,trophyRare,trophyEarnedRate,trophySmallIconUrl,groupId",
+    "friends presences": "accountId,onlineId,primaryOnlineStatus,presences(@titleInfo,lastOnlineDate)",
+}
+CURRENT_URLS = {
+    "owned games": GAME_LIST_URL,
+    "earned trophies": EARNED_TROPHIES_PAGE,
+    "friends presences": FRIENDS_WITH_PRESENCE_URL,
+}
+
+SAMPLE_IMAGE_URL = "https://image.api.playstation.com/cdn/EP0002/CUSA04607_00/" \
+    "FREE_CONTENTaXoPj6IK8uCtvv2rlRY0/PREVIEW_SCREENSHOT1_138025.jpg?w=240&h=240"
+SAMPLE_ICON_URL = "https://image.api.np.km.playstation.net/images/?format=png&w=440&h=440&image=" \
+    "https%3A%2F%2Fkfscdn.api.np.km.playstation.net%2F0000000000000000%2F000000000000000.PNG&sign=0123456789abcdef"
+
+SAMPLES = {
+    "owned games": {
+        "titleId": "CUSA07917_00",
+        "name": "Tooth and Tail",
+        "image": SAMPLE_IMAGE_URL,
+        "category": "ps4_game",
+        "lastPlayedDate": "2019-05-07T17:29:29.780Z",
+        "playCount": 21,
+        "playDuration": "PT27H38M45S",
+    },
+    "earned trophies": {
+        "trophyId": 42,
+        "trophyHidden": False,
+        "trophyType": "bronze",
+        "trophyName": "Taking the Plunge",
+        "trophyDetail": "Complete the first chapter of the story.",
+        "trophyIconUrl": SAMPLE_ICON_URL,
+        "fromUser": {"onlineId": "user-id", "earned": True, "earnedDate": "2019-05-07T17:29:29Z"},
+        "trophyRare": 3,
+        "trophyEarnedRate": "64.5",
+        "trophySmallIconUrl": SAMPLE_ICON_URL,
+        "groupId": "default",
+    },
+    "friends presences": {
+        "accountId": "1234567890123456789",
+        "onlineId": "some-friend",
+        "primaryOnlineStatus": "online",
+        "presences": [{
+            "onlineStatus": "online",
+            "platform": "PS4",
+            "npTitleId": "CUSA07917_00",
+            "titleName": "Tooth and Tail",
+            "lastOnlineDate": "2019-05-07T17:29:29Z",
+        }],
+    },
+}
+
+# what the field groups expand to
+FIELD_GROUPS = {
+    ("owned games", "@default"): ("titleId", "name", "image", "category", "lastPlayedDate", "playCount", "playDuration"),
+    ("earned trophies", "@default"): (
+        "trophyId", "trophyHidden", "trophyType", "trophyName", "trophyDetail", "trophyIconUrl", "fromUser"
+    ),
+    ("friends presences", "@titleInfo"): ("onlineStatus", "platform", "npTitleId", "titleName"),
+}
+
+
+def split_fields(fields):
+    """Splits a fields parameter on top level commas: "a,b(c,d)" -> ["a", "b(c,d)"]"""
+    return [field for field in re.split(r",(?![^(]*\))", fields) if field]
+
+
+def project(resource, record, fields):
+    projected = {}
+    for field in split_fields(fields):
+        nested = re.fullmatch(r"(\w+)\((.*)\)", field)
+        if nested:
+            name, subfields = nested.groups()
+            projected[name] = [project(resource, item, subfields) for item in record[name]]
+        elif field.startswith("@"):
+            projected.update({key: record[key] for key in FIELD_GROUPS[(resource, field)]})
+        else:
+            projected[field] = record[field]
+    return projected
+
+
+def url_fields(url):
+    return parse_qs(urlsplit(url).query)["fields"][0]
+
+
+def size(record):
+    return len(json.dumps(record, separators=(",", ":")).encode())
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:4]] + [1000, 30000, 300][len(sys.argv[1:4]):]
+    total_before = total_after = 0
+    print("{:<20}{:>10}{:>14}{:>14}{:>8}".format("endpoint", "records", "before [kB]", "after [kB]", "saved"))
+    for resource, count in zip(SAMPLES, counts):
+        sample = SAMPLES[resource]
+        before = count * size(project(resource, sample, PREVIOUS_FIELDS[resource]))
+        after = count * size(project(resource, sample, url_fields(CURRENT_URLS[resource])))
+        total_before += before
+        total_after += after
+        print("{:<20}{:>10}{:>14.1f}{:>14.1f}{:>7.0%}".format(
+            resource, count, before / 1024, after / 1024, 1 - after / before))
+    print("{:<20}{:>10}{:>14.1f}{:>14.1f}{:>7.0%}".format(
+        "full sync", "", total_before / 1024, total_after / 1024, 1 - total_after / total_before))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Performance regression gate: compares benchmark runs with a stored baseline
+
+Every account of sync_scale is synced in a fresh process, once offline (sync_scale) and once
+against the fake PSN server (fake_psn_server) with a fixed seed. Recorded per account:
+    requests      requests per full sync, counted offline
+    cpu_time      CPU seconds of the offline sync
+    latency_p50   median and 95th percentile of GET latencies against the fake server
+    latency_p95
+    peak_rss      peak resident set size of the process in kB (needs psutil on Windows)
+
+Every account is measured RUNS times and the median of each metric is kept. A metric regresses
+when it exceeds the baseline by more than its threshold, a share of the baseline value, and by
+more than its absolute floor, so that noise of a few milliseconds can not fail the gate. CPU time,
+latency and RSS depend on the machine, so the baseline is saved and compared on the same one.
+
+Usage:
+    python benchmarks/regression_gate.py --save [account ...]    records the baseline
+    python benchmarks/regression_gate.py [account ...]           exits with 1 on a regression
+Options: --baseline path (benchmarks/baseline.json), --threshold metric=share (e.g. cpu_time=0.5),
+    --runs n (5)
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fake_psn_server import FakePSNServer, Latency, run_sync  # noqa: E402
+from http_client import BASE_URL_ENV  # noqa: E402
+from sync_scale import ACCOUNTS, sync_account  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_ACCOUNTS = ["100 titles", "1k titles"]
+# allowed increase over the baseline; requests are deterministic, so any extra one fails
+THRESHOLDS = {
+    "requests": 0.0,
+    "cpu_time": 0.25,
+    "latency_p50": 0.25,
+    "latency_p95": 0.5,
+    "peak_rss": 0.2,
+}
+# increase below which a metric never regresses, in its own unit
+FLOORS = {
+    "requests": 0,
+    "cpu_time": 0.05,
+    "latency_p50": 0.002,
+    "latency_p95": 0.005,
+    "peak_rss": 4096,
+}
+RUNS = 5
+FAKE_SERVER_LATENCY = Latency(median=0.005, sigma=0.5)
+
+
+async def _measure(account_name: str) -> Dict[str, float]:
+    account = ACCOUNTS[account_name]
+    cpu_start = time.process_time()
+    offline = await sync_account(account, trace_memory=False)
+    cpu_time = time.process_time() - cpu_start
+
+    server = FakePSNServer(account, latency=FAKE_SERVER_LATENCY, seed=0)
+    os.environ[BASE_URL_ENV] = await server.start()
+    try:
+        online = await run_sync(server)
+    finally:
+        await server.stop()
+    return {
+        "requests": sum(result["requests"] for result in offline.values()),
+        "cpu_time": cpu_time,
+        "latency_p50": online["full sync"]["latency_p50"],
+        "latency_p95": online["full sync"]["latency_p95"],
+        "peak_rss": _peak_rss(),
+    }
+
+
+def _peak_rss() -> Optional[float]:
+    """Peak resident set size of the process in kB, None where it can not be measured"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kB elsewhere
+        return peak / 1024 if sys.platform == "darwin" else peak
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().peak_wset / 1024
+
+
+def measure(account_name: str) -> Dict[str, float]:
+    """Runs in a fresh process, so peak RSS belongs to this account only"""
+    logging.basicConfig(level=logging.ERROR)
+    return asyncio.get_event_loop().run_until_complete(_measure(account_name))
+
+
+def run(account_names: List[str], runs: int = RUNS) -> Dict[str, Dict[str, float]]:
+    """Median of every metric over runs, each run in a fresh process"""
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for name in account_names:
+        samples = []
+        for _ in range(runs):
+            with context.Pool(1) as pool:
+                samples.append(pool.apply(measure, (name,)))
+        results[name] = {
+            metric: statistics.median(sample[metric] for sample in samples)
+            for metric in samples[0]
+            if samples[0][metric] is not None
+        }
+    return results
+
+
+def compare(baseline: Dict, results: Dict, thresholds: Dict[str, float]) -> List[str]:
+    """Prints the comparison, returns the regressions"""
+    regressions = []
+    print("{:<12}{:<14}{:>12}{:>12}{:>10}{:>10}".format("account", "metric", "baseline", "current", "change", "limit"))
+    for account, metrics in results.items():
+        if account not in baseline:
+            print("{:<12}not in the baseline, skipped".format(account))
+            continue
+        for metric, value in metrics.items():
+            reference = baseline[account].get(metric)
+            if reference is None:
+                continue
+            change = (value - reference) / reference if reference else 0.0
+            regressed = value > reference * (1 + thresholds[metric]) and value - reference > FLOORS[metric]
+            print("{:<12}{:<14}{:>12.4g}{:>12.4g}{:>+10.1%}{:>+10.0%}{}".format(
+                account, metric, reference, value, change, thresholds[metric], "  REGRESSED" if regressed else ""))
+            if regressed:
+                regressions.append("{} {}".format(account, metric))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("accounts", nargs="*", default=DEFAULT_ACCOUNTS, help=", ".join(ACCOUNTS))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="records the run as the baseline")
+    parser.add_argument("--threshold", action="append", default=[], metavar="METRIC=SHARE")
+    parser.add_argument("--runs", type=int, default=RUNS, help="runs per account, their median is compared")
+    args = parser.parse_args()
+
+    unknown = set(args.accounts) - set(ACCOUNTS)
+    if unknown:
+        parser.error("unknown accounts {}".format(", ".join(sorted(unknown))))
+    thresholds = dict(THRESHOLDS)
+    for threshold in args.threshold:
+        metric, share = threshold.split("=")
+        if metric not in thresholds:
+            parser.error("unknown metric {}".format(metric))
+        thresholds[metric] = float(share)
+
+    results = run(args.accounts, args.runs)
+    if args.save:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print("Baseline saved to {}".format(args.baseline))
+        return
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare(baseline, results, thresholds)
+    if regressions:
+        print("Regressed: {}".format(", ".join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Offline benchmark of full syncs of synthetic PSN accounts
+
+Every account is served by FakePSN, which answers PSNClient requests in place of
+AuthenticatedHttpClient.get. The numbers cover the plugin, PSNClient and the parsers;
+connection handling, rate limiting and hedging of the HTTP layer are left out.
+
+For each operation it reports wall time, requests sent, peak traced memory, the time
+the event loop was blocked for longer than the monitor threshold, the longest lag and
+the time parsers blocked the loop. Memory is traced in a separate run of the same account,
+as tracemalloc slows everything down.
+
+Usage: python benchmarks/sync_scale.py [account ...] [--json results.json]
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, List
+from unittest.mock import MagicMock
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from endpoints import endpoint_name  # noqa: E402
+from loop_monitor import LoopLagMonitor  # noqa: E402
+from plugin import PSNPlugin  # noqa: E402
+
+
+@dataclass
+class Account:
+    titles: int
+    trophies: int
+    friends: int
+
+
+ACCOUNTS = {
+    "100 titles": Account(titles=100, trophies=5000, friends=100),
+    "1k titles": Account(titles=1000, trophies=30000, friends=500),
+    "10k titles": Account(titles=10000, trophies=100000, friends=2000),
+}
+EARNED_DATE = "2019-05-07T17:29:29Z"
+LAST_UPDATE_DATE = "2020-01-01T00:00:00Z"
+
+
+class FakePSN:
+    """Answers PSNClient GET requests with records of a synthetic account"""
+
+    def __init__(self, account: Account):
+        self.account = account
+        self.requests = 0
+        self._trophies_per_title = max(1, account.trophies // account.titles)
+        self._handlers = {
+            "USER_INFO_URL": lambda query, path: {"profile": {"accountId": "1", "onlineId": "bench"}},
+            "GAME_LIST_URL": self._game_list,
+            "GAME_DETAILS_URL": self._game_details,
+            "TROPHY_TITLES_URL": self._trophy_titles,
+            "EARNED_TROPHIES_PAGE": self._earned_trophies,
+            "FRIENDS_WITH_PRESENCE_URL": self._friends_with_presence,
+            "FRIENDS_URL": self._friends,
+            "USER_INFO_PSPLUS_URL": lambda query, path: {"profile": {"plus": 1}},
+            "ACCOUNTS_URL": lambda query, path: {
+                "region": "SCEE", "legalCountry": "PL", "language": "pl-PL", "dateOfBirth": "1990-01-01"
+            },
+            "PSPLUS_GAMES_CONTAINER_URL": self._psplus_games,
+            "PSNOW_GAMES_URL": self._psnow_games,
+        }
+
+    def handles(self, endpoint: str) -> bool:
+        return endpoint in self._handlers
+
+    def respond(self, url: str):
+        parts = urlsplit(url)
+        return self._handlers[endpoint_name(url)](parse_qs(parts.query), parts.path)
+
+    @staticmethod
+    def title_id(index: int) -> str:
+        return "CUSA{:05}_00".format(index)
+
+    @staticmethod
+    def comm_id(index: int) -> str:
+        return "NPWR{:05}_00".format(index)
+
+    async def access_token(self, refresh_token):
+        return "access token"
+
+    async def get(self, url, *args, **kwargs):
+        self.requests += 1
+        await asyncio.sleep(0)
+        return self.respond(url)
+
+    @staticmethod
+    def _page(query, total):
+        offset = int(query.get("offset", ["0"])[0])
+        limit = int(query.get("limit", [str(total)])[0])
+        return range(offset, min(total, offset + limit))
+
+    def _game_list(self, query, path):
+        return {
+            "titles": [{"titleId": self.title_id(i), "name": "Title {}".format(i)} for i in self._page(query, self.account.titles)],
+            "totalResults": self.account.titles,
+        }
+
+    def _game_details(self, query, path):
+        title_ids = query["npTitleIds"][0].split(",")
+        return {"apps": [
+            {"npTitleId": title_id, "trophyTitles": [{"npCommunicationId": "NPWR" + title_id[4:]}]}
+            for title_id in title_ids
+        ]}
+
+    def _trophy_titles(self, query, path):
+        return {
+            "trophyTitles": [
+                {"npCommunicationId": self.comm_id(i), "fromUser": {"lastUpdateDate": LAST_UPDATE_DATE}}
+                for i in self._page(query, self.account.titles)
+            ],
+            "totalResults": self.account.titles,
+        }
+
+    def _earned_trophies(self, query, path):
+        return {"trophies": [
+            {"trophyId": i, "trophyName": "Trophy {}".format(i), "fromUser": {"earned": True, "earnedDate": EARNED_DATE}}
+            for i in range(self._trophies_per_title)
+        ]}
+
+    def _friends_with_presence(self, query, path):
+        return {
+            "profiles": [
+                {
+                    "accountId": str(i),
+                    "primaryOnlineStatus": "online" if i % 3 else "offline",
+                    "presences": [{
+                        "onlineStatus": "online", "platform": "PS4",
+                        "npTitleId": self.title_id(i % self.account.titles), "titleName": "Title"
+                    }],
+                }
+                for i in self._page(query, self.account.friends)
+            ],
+            "totalResults": self.account.friends,
+        }
+
+    def _friends(self, query, path):
+        return {
+            "profiles": [
+                {"accountId": str(i), "onlineId": "friend{}".format(i), "avatarUrls": [{"avatarUrl": "https://a/{}.png".format(i)}]}
+                for i in self._page(query, self.account.friends)
+            ],
+            "totalResults": self.account.friends,
+        }
+
+    def _psplus_games(self, query, path):
+        return {"included": [
+            {"id": "EP0001-{}-GAME".format(self.title_id(i)), "type": "game", "attributes": {"name": "Title {}".format(i)}}
+            for i in range(min(self.account.titles, 50))
+        ]}
+
+    def _psnow_games(self, query, path):
+        return {"categories": [
+            {"name": letter, "games": [
+                {"id": "EP0001-{}-GAME".format(self.title_id(i)), "name": "Title {}".format(i)} for i in range(30)
+            ]}
+            for letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+        ]}
+
+
+def sync_operations(plugin: PSNPlugin, fake: FakePSN):
+    """Galaxy operations in the order of a first sync, as (name, coroutine function) pairs"""
+    game_ids: List[str] = []
+    context = None
+    presence_context = None
+
+    async def owned_games():
+        game_ids.extend(game.game_id for game in await plugin.get_owned_games())
+
+    async def achievements_context():
+        nonlocal context
+        context = await plugin.prepare_achievements_context(game_ids)
+        await asyncio.gather(*plugin._background_tasks)
+
+    async def unlocked_achievements():
+        for game_id in game_ids:
+            await plugin.get_unlocked_achievements(game_id, context)
+
+    async def presence():
+        nonlocal presence_context
+        user_ids = [str(i) for i in range(fake.account.friends)]
+        presence_context = await plugin.prepare_user_presence_context(user_ids)
+        for user_id in user_ids:
+            await plugin.get_user_presence(user_id, presence_context)
+
+    return [
+        ("get_owned_games", owned_games),
+        ("prepare_achievements_context", achievements_context),
+        ("get_unlocked_achievements", unlocked_achievements),
+        ("user_presence", presence),
+    ]
+
+
+async def sync_account(account: Account, trace_memory: bool) -> Dict[str, Dict]:
+    fake = FakePSN(account)
+    plugin = PSNPlugin(MagicMock(), MagicMock(), None)
+    plugin._http_client.get = fake.get
+    plugin._http_client.get_access_token = fake.access_token
+    results = {}
+    try:
+        await plugin.authenticate({"npsso": "npsso"})
+        for name, operation in sync_operations(plugin, fake):
+            requests = fake.requests
+            parse_blocking_time = plugin._psn_client.parse_blocking_time
+            monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+            if trace_memory:
+                tracemalloc.start()
+            else:
+                monitor.start()
+            start = time.perf_counter()
+            try:
+                await operation()
+            finally:
+                wall_time = time.perf_counter() - start
+                monitor.stop()
+            result = {"wall_time": wall_time, "requests": fake.requests - requests}
+            if trace_memory:
+                result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                report = monitor.report()
+                result["loop_lag_max"] = report["lag_max"]
+                result["loop_blocked"] = report["blocked"]
+                result["parse_blocking"] = plugin._psn_client.parse_blocking_time - parse_blocking_time
+            results[name] = result
+    finally:
+        await plugin.shutdown()
+    return results
+
+
+def run_account(account: Account) -> Dict[str, Dict]:
+    """Wall time, requests and loop blocking of each operation, merged with peak memory of a traced run"""
+    results = asyncio.get_event_loop().run_until_complete(sync_account(account, trace_memory=False))
+    traced = asyncio.get_event_loop().run_until_complete(sync_account(account, trace_memory=True))
+    for name, result in results.items():
+        result["peak_memory"] = traced[name]["peak_memory"]
+    return results
+
+
+def run_suite(names: List[str]) -> Dict[str, Dict[str, Dict]]:
+    return {name: run_account(ACCOUNTS[name]) for name in names}
+
+
+def print_results(results: Dict[str, Dict[str, Dict]]):
+    print("{:<12}{:<30}{:>10}{:>10}{:>12}{:>12}{:>12}{:>12}".format(
+        "account", "operation", "wall [s]", "requests", "peak [MB]", "blocked [s]", "max lag [s]", "parsing [s]"))
+    for account, operations in results.items():
+        for name, result in operations.items():
+            print("{:<12}{:<30}{:>10.3f}{:>10}{:>12.1f}{:>12.3f}{:>12.3f}{:>12.3f}".format(
+                account, name, result["wall_time"], result["requests"], result["peak_memory"] / 2 ** 20,
+                result["loop_blocked"], result["loop_lag_max"], result["parse_blocking"]))
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    args = sys.argv[1:]
+    output = None
+    if "--json" in args:
+        index = args.index("--json")
+        output = args[index + 1]
+        del args[index:index + 2]
+    results = run_suite(args or list(ACCOUNTS))
+    print_results(results)
+    if output:
+        with open(output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Micro-benchmark of psn_client.parse_timestamp against the strptime based implementation
+
+Usage: python benchmarks/timestamp_parser.py [number of timestamps]
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from psn_client import _parse_timestamp_slow, parse_timestamp, parse_timestamps  # noqa: E402
+
+
+def generate_dates(count, distinct):
+    rnd = random.Random(42)
+    pool = [
+        "{:04}-{:02}-{:02}T{:02}:{:02}:{:02}Z".format(
+            rnd.randint(2013, 2020), rnd.randint(1, 12), rnd.randint(1, 28),
+            rnd.randint(0, 23), rnd.randint(0, 59), rnd.randint(0, 59)
+        )
+        for _ in range(distinct)
+    ]
+    return [rnd.choice(pool) for _ in range(count)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    # trophies of one title are often unlocked at the same second, so values repeat
+    dates = generate_dates(count, distinct=max(count // 25, 1))
+
+    expected = [_parse_timestamp_slow(date) for date in dates]
+    assert expected == [parse_timestamp(date) for date in dates], "fast parser differs from strptime"
+    assert expected == parse_timestamps(dates), "batch parser differs from strptime"
+
+    def fast_cold():
+        parse_timestamp.cache_clear()
+        parse_timestamps(dates)
+
+    timings = [
+        ("strptime", lambda: [_parse_timestamp_slow(date) for date in dates]),
+        ("fast (cold memo)", fast_cold),
+        ("fast (warm memo)", lambda: parse_timestamps(dates)),
+    ]
+    print("Parsing {} timestamps, results identical to strptime".format(count))
+    for name, func in timings:
+        best = min(timeit.repeat(func, number=1, repeat=5))
+        print("{:<20}{:>10.4f}s".format(name, best))
+
+
+if __name__ == "__main__":
+    main()
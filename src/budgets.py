@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from typing import Dict, Optional
+
+
+@dataclass
+class Budget:
+    """Requests a Galaxy operation is expected to send: over soft is logged,
+    at hard the operation hands the rest of its work to the background where it can
+    """
+    soft: Optional[int] = None
+    hard: Optional[int] = None
+
+
+# a steady-state sync of an unchanged library; first syncs of big libraries exceed them by design
+REQUEST_BUDGETS = {
+    "authenticate": Budget(soft=5),
+    "pass_login_credentials": Budget(soft=5),
+    "get_owned_games": Budget(soft=20),
+    "prepare_achievements_context": Budget(soft=20, hard=300),
+    "get_unlocked_achievements": Budget(soft=2),
+    "prepare_user_presence_context": Budget(soft=5),
+    "get_friends": Budget(soft=5),
+    "get_subscriptions": Budget(soft=3),
+}
+
+_current_operation: ContextVar = ContextVar("operation", default=None)
+
+
+@dataclass
+class OperationSummary:
+    calls: int = 0
+    requests: int = 0
+    max_requests: int = 0
+    over_soft_budget: int = 0
+    over_hard_budget: int = 0
+    background_requests: int = 0
+
+
+class OperationRequests:
+    """Requests of one call of a Galaxy operation; those sent after it returned,
+    by work it left running in the background, are counted apart
+    """
+
+    def __init__(self, name: str, budget: Budget, summary: OperationSummary):
+        self.name = name
+        self.budget = budget
+        self._summary = summary
+        self.requests = 0
+        self.finished = False
+        # set once the hard budget is spent
+        self.exhausted = asyncio.Event()
+
+    def count(self):
+        if self.finished:
+            self._summary.background_requests += 1
+            return
+        self.requests += 1
+        if self.requests == self.budget.soft:
+            logging.warning("%s reached its budget of %d requests", self.name, self.budget.soft)
+        if self.requests == self.budget.hard:
+            logging.warning("%s spent its hard budget of %d requests, deferring the rest", self.name, self.budget.hard)
+            self.exhausted.set()
+
+
+def current_operation() -> Optional[OperationRequests]:
+    return _current_operation.get()
+
+
+def count_request():
+    """Charges a request to the Galaxy operation it is sent for, if any"""
+    operation = _current_operation.get()
+    if operation is not None:
+        operation.count()
+
+
+class RequestAccounting:
+    def __init__(self, budgets: Dict[str, Budget] = None):
+        self._budgets = REQUEST_BUDGETS if budgets is None else budgets
+        self._summaries: Dict[str, OperationSummary] = defaultdict(OperationSummary)
+
+    @contextmanager
+    def operation(self, name: str):
+        operation = OperationRequests(name, self._budgets.get(name, Budget()), self._summaries[name])
+        token = _current_operation.set(operation)
+        try:
+            yield operation
+        finally:
+            _current_operation.reset(token)
+            operation.finished = True
+            self._record(operation)
+
+    def _record(self, operation: OperationRequests):
+        summary = self._summaries[operation.name]
+        summary.calls += 1
+        summary.requests += operation.requests
+        summary.max_requests = max(summary.max_requests, operation.requests)
+        if operation.budget.soft is not None and operation.requests > operation.budget.soft:
+            summary.over_soft_budget += 1
+        if operation.exhausted.is_set():
+            summary.over_hard_budget += 1
+        logging.debug("%s sent %d requests", operation.name, operation.requests)
+
+    def summary(self) -> Dict[str, Dict]:
+        return {
+            name: {
+                "calls": summary.calls,
+                "requests": summary.requests,
+                "max_requests": summary.max_requests,
+                "background_requests": summary.background_requests,
+                "over_soft_budget": summary.over_soft_budget,
+                "over_hard_budget": summary.over_hard_budget,
+            }
+            for name, summary in self._summaries.items()
+        }
+
+    def log(self):
+        for name, summary in sorted(self.summary().items()):
+            logging.info(
+                "%s: %d calls, %d requests (max %d per call, %d more in background), "
+                "over soft budget %d times, over hard budget %d times",
+                name, summary["calls"], summary["requests"], summary["max_requests"],
+                summary["background_requests"], summary["over_soft_budget"], summary["over_hard_budget"]
+            )
+
+
+def accounted(method):
+    """Charges requests sent by a plugin method to the operation named after it"""
+    @wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        with self.request_accounting.operation(method.__name__):
+            return await method(self, *args, **kwargs)
+    return wrapper
@@ -1,5 +1,11 @@
+import asyncio
+import logging
+import time
+from collections import Counter
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from enum import Enum
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
 
 from psn_client import UnixTimestamp
 
@@ -29,6 +35,119 @@ class Cache:
                 entry.value = value
                 entry.timestamp = timestamp
 
+    def __contains__(self, key: Any) -> bool:
+        return key in self._entries
+
     def __iter__(self):
         for key, entry in self._entries.items():
             yield key, entry.value
+
+
+class CacheStats:
+    """Lookups (hits, misses, stale), imported entries, evictions (entries replaced by newer data)
+    and the serialized size of a cache, per sync and over the session
+    """
+
+    def __init__(self):
+        self.sync: Counter = Counter()
+        self.session: Counter = Counter()
+        self.serialized_size: Optional[int] = None
+
+    def record(self, event: str, count: int = 1):
+        if not count:
+            return
+        self.sync[event] += count
+        self.session[event] += count
+
+    @staticmethod
+    def hit_ratio(counts: Dict[str, int]) -> Optional[float]:
+        lookups = sum(counts.get(event, 0) for event in ("hits", "misses", "stale"))
+        return counts.get("hits", 0) / lookups if lookups else None
+
+    def take_sync_report(self) -> Dict[str, int]:
+        """Events since the previous report"""
+        report = dict(self.sync)
+        self.sync.clear()
+        return report
+
+
+class Freshness(Enum):
+    Fresh = "fresh"
+    Stale = "stale"
+    Expired = "expired"
+
+
+@dataclass
+class FreshnessPolicy:
+    """max_age: seconds an entry is served as is,
+    max_stale: seconds past max_age an entry is still served while being refreshed in background
+    """
+    max_age: float
+    max_stale: float
+
+    def freshness(self, age: float) -> Freshness:
+        if age <= self.max_age:
+            return Freshness.Fresh
+        if age <= self.max_age + self.max_stale:
+            return Freshness.Stale
+        return Freshness.Expired
+
+
+class StaleWhileRevalidateCache:
+    """serve_expired_on: errors of a failed refresh on which an expired entry is served instead of raising"""
+
+    def __init__(
+        self,
+        policy: FreshnessPolicy,
+        clock: Callable[[], float] = time.time,
+        serve_expired_on: Tuple[Type[Exception], ...] = ()
+    ):
+        self._policy = policy
+        self._clock = clock
+        self._serve_expired_on = serve_expired_on
+        self._entries: Dict[Any, CacheEntry] = {}
+        self._refreshes: Dict[Any, asyncio.Future] = {}
+
+    def freshness(self, key: Any) -> Freshness:
+        entry: Optional[CacheEntry] = self._entries.get(key)
+        if entry is None:
+            return Freshness.Expired
+        return self._policy.freshness(self._clock() - entry.timestamp)
+
+    async def get(self, key: Any, fetch: Callable[[], Awaitable]) -> Any:
+        freshness = self.freshness(key)
+        if freshness == Freshness.Fresh:
+            return self._entries[key].value
+        refresh = self.refresh(key, fetch)
+        if freshness == Freshness.Stale:
+            return self._entries[key].value
+        try:
+            return await asyncio.shield(refresh)
+        except self._serve_expired_on as error:
+            if key not in self._entries:
+                raise
+            logging.warning("Serving expired %s, refresh failed: %r", key, error)
+            return self._entries[key].value
+
+    def refresh(self, key: Any, fetch: Callable[[], Awaitable]) -> asyncio.Future:
+        """Starts fetching the value unless it is already in flight"""
+        refresh = self._refreshes.get(key)
+        if refresh is None:
+            refresh = self._refreshes[key] = asyncio.ensure_future(self._fetch(key, fetch))
+            refresh.add_done_callback(partial(self._refresh_done, key))
+        return refresh
+
+    async def _fetch(self, key: Any, fetch: Callable[[], Awaitable]) -> Any:
+        value = await fetch()
+        self._entries[key] = CacheEntry(value, self._clock())
+        return value
+
+    def _refresh_done(self, key: Any, refresh: asyncio.Future):
+        del self._refreshes[key]
+        # background refreshes have nobody awaiting them
+        if not refresh.cancelled() and refresh.exception() is not None:
+            logging.warning("Refresh of %s failed: %r", key, refresh.exception())
+
+    def cancel(self):
+        for refresh in list(self._refreshes.values()):
+            refresh.cancel()
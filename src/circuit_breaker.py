@@ -0,0 +1,110 @@
+import logging
+import time
+from enum import Enum
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+# consecutive failed requests opening the circuit, and seconds it stays open before a probe request is let through
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+
+class CircuitState(Enum):
+    Closed = "closed"
+    Open = "open"
+    HalfOpen = "half-open"
+
+
+class Admission(Enum):
+    """Outcome of CircuitBreaker.allow, handed back when the request ends; false when rejected"""
+    Rejected = "rejected"
+    Request = "request"
+    Probe = "probe"
+
+    def __bool__(self):
+        return self is not Admission.Rejected
+
+
+class CircuitBreaker:
+    """Stops sending requests to a failing host; after reset_timeout a single probe decides whether to close again"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = CircuitState.Closed
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> CircuitState:
+        if self._state == CircuitState.Open and self._clock() - self._opened_at >= self._reset_timeout:
+            self._state = CircuitState.HalfOpen
+        return self._state
+
+    def allow(self) -> Admission:
+        state = self.state
+        if state == CircuitState.Closed:
+            return Admission.Request
+        if state == CircuitState.HalfOpen and not self._probing:
+            self._probing = True
+            return Admission.Probe
+        self.rejected += 1
+        return Admission.Rejected
+
+    def _end(self, admission: Admission):
+        # only the probe's own end lets another probe through
+        if admission == Admission.Probe:
+            self._probing = False
+
+    def record_success(self, admission: Admission = Admission.Request):
+        self._end(admission)
+        if self._state != CircuitState.Closed:
+            logging.info("Circuit for %s closed", self.name)
+        self._state = CircuitState.Closed
+        self._failures = 0
+
+    def record_failure(self, admission: Admission = Admission.Request):
+        self._end(admission)
+        self._failures += 1
+        if self._state == CircuitState.HalfOpen or self._failures >= self._failure_threshold:
+            if self._state != CircuitState.Open:
+                self.opened += 1
+                logging.warning("Circuit for %s opened after %d failures", self.name, self._failures)
+            self._state = CircuitState.Open
+            self._opened_at = self._clock()
+
+    def release(self, admission: Admission):
+        """The request ended without telling anything about the host, e.g. it was cancelled"""
+        self._end(admission)
+
+
+class HostCircuitBreakers:
+    """One circuit breaker per host"""
+
+    def __init__(self, **breaker_kwargs):
+        self._breaker_kwargs = breaker_kwargs
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def __call__(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).hostname
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(host, **self._breaker_kwargs)
+        return breaker
+
+    def report(self) -> Dict[str, Dict]:
+        return {
+            host: {"state": breaker.state.value, "opened": breaker.opened, "rejected": breaker.rejected}
+            for host, breaker in self._breakers.items()
+        }
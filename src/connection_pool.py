@@ -0,0 +1,128 @@
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict
+from urllib.parse import urlsplit
+
+import aiohttp
+from galaxy.http import DEFAULT_LIMIT, create_tcp_connector
+
+from priorities import FairSemaphore
+
+# simultaneous connections kept per PSN host; trophies are imported with many parallel requests
+HOST_POOL_SIZES = {
+    "pl-tpy.np.community.playstation.net": 16,
+    "gamelist.api.playstation.com": 4,
+    "pl-prof.np.community.playstation.net": 2,
+    "us-prof.np.community.playstation.net": 4,
+    "accounts.api.playstation.com": 2,
+    "store.playstation.com": 2,
+    "auth.api.sonyentertainmentnetwork.com": 2,
+}
+DEFAULT_HOST_POOL_SIZE = 4
+DNS_CACHE_TTL = 10 * 60
+KEEPALIVE_TIMEOUT = 60
+
+
+def create_connector() -> aiohttp.TCPConnector:
+    return create_tcp_connector(
+        limit=max(DEFAULT_LIMIT, sum(HOST_POOL_SIZES.values())),
+        limit_per_host=max(HOST_POOL_SIZES.values()),
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT
+    )
+
+
+class HostSlots:
+    """Bounds the number of simultaneous requests, and so connections, per host;
+    waiting requests get freed slots by the weights of their priority classes
+    """
+
+    def __init__(self, sizes: Dict[str, int] = None, default_size: int = DEFAULT_HOST_POOL_SIZE):
+        self._sizes = HOST_POOL_SIZES if sizes is None else sizes
+        self._default_size = default_size
+        self._semaphores: Dict[str, FairSemaphore] = {}
+
+    def __call__(self, url: str) -> FairSemaphore:
+        host = urlsplit(url).hostname
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = FairSemaphore(self._sizes.get(host, self._default_size))
+        return semaphore
+
+
+@dataclass
+class HostConnectionStats:
+    # running totals, a long session opens connections for its whole lifetime
+    connections: int = 0
+    connect_time_total: float = 0.0
+    connect_time_max: float = 0.0
+    dns_resolves: int = 0
+    dns_time_total: float = 0.0
+    reused: int = 0
+
+    def record_connect(self, duration: float):
+        self.connections += 1
+        self.connect_time_total += duration
+        self.connect_time_max = max(self.connect_time_max, duration)
+
+    def record_dns(self, duration: float):
+        self.dns_resolves += 1
+        self.dns_time_total += duration
+
+    def report(self) -> Dict:
+        return {
+            "connections": self.connections,
+            "reused": self.reused,
+            "connect_time_avg": self.connect_time_total / self.connections if self.connections else 0.0,
+            "connect_time_max": self.connect_time_max,
+            "dns_resolves": self.dns_resolves,
+            "dns_time_avg": self.dns_time_total / self.dns_resolves if self.dns_resolves else 0.0,
+        }
+
+
+class ConnectionStats:
+    """Collects connect and DNS resolution times per host from aiohttp tracing signals"""
+
+    def __init__(self):
+        self._hosts: Dict[str, HostConnectionStats] = defaultdict(HostConnectionStats)
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_connection_create_start.append(self._on_connection_create_start)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        trace_config.on_dns_resolvehost_start.append(self._on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(self._on_dns_resolvehost_end)
+        return trace_config
+
+    async def _on_request_start(self, _session, context, params):
+        context.host = params.url.host
+
+    async def _on_connection_create_start(self, _session, context, _params):
+        context.connect_start = time.perf_counter()
+
+    async def _on_connection_create_end(self, _session, context, _params):
+        self._hosts[context.host].record_connect(time.perf_counter() - context.connect_start)
+
+    async def _on_connection_reuseconn(self, _session, context, _params):
+        self._hosts[context.host].reused += 1
+
+    async def _on_dns_resolvehost_start(self, _session, context, _params):
+        context.dns_start = time.perf_counter()
+
+    async def _on_dns_resolvehost_end(self, _session, context, params):
+        self._hosts[params.host].record_dns(time.perf_counter() - context.dns_start)
+
+    def report(self) -> Dict[str, Dict]:
+        return {host: stats.report() for host, stats in self._hosts.items()}
+
+    def log(self):
+        for host, report in self.report().items():
+            logging.info(
+                "%s: %d connections (%d reused), connect avg %.3fs max %.3fs, %d DNS resolves avg %.3fs",
+                host, report["connections"], report["reused"], report["connect_time_avg"],
+                report["connect_time_max"], report["dns_resolves"], report["dns_time_avg"]
+            )
@@ -0,0 +1,20 @@
+import re
+from typing import List, Pattern, Tuple
+from urllib.parse import urlsplit
+
+_ENDPOINTS: List[Tuple[str, Pattern]] = []
+
+
+def register_endpoint(name: str, url_template: str):
+    """Names requests matching url_template; format fields of the template match any path or query value"""
+    pattern = re.sub(r"\\\{\w*\\\}", "[^/?&]*", re.escape(url_template))
+    _ENDPOINTS.append((name, re.compile(pattern)))
+
+
+def endpoint_name(url: str) -> str:
+    """Name of the endpoint the url belongs to, host and path for not registered ones"""
+    for name, pattern in _ENDPOINTS:
+        if pattern.match(url):
+            return name
+    parts = urlsplit(url)
+    return parts.netloc + parts.path
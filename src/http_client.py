@@ -1,20 +1,41 @@
 import aiohttp
+import json
 import logging
 import asyncio
+import time
 
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.cookies import SimpleCookie
+from typing import Dict, List
+from contextvars import ContextVar
 from urllib.parse import parse_qsl, urlsplit
 
 from galaxy.api.errors import (
+    ApplicationError,
     AuthenticationRequired,
     BackendError,
     BackendNotAvailable,
     BackendTimeout,
     NetworkError,
     InvalidCredentials,
+    TooManyRequests,
     UnknownBackendResponse
 )
 from galaxy.http import handle_exception, create_client_session
 
+from budgets import count_request
+from circuit_breaker import HostCircuitBreakers
+from connection_pool import ConnectionStats, HostSlots, create_connector
+from endpoints import endpoint_name, register_endpoint
+from latency import HedgeBudget, LatencyTracker
+from log_events import Truncated, event_log
+from metrics import MetricsRegistry
+from rate_limit import RateLimiters
+from timeouts import AdaptiveTimeouts, timeout_phase
+from tracing import tracer
+
 
 OAUTH_LOGIN_REDIRECT_URL = "https://my.playstation.com/auth/response.html"
 
@@ -56,47 +77,280 @@ OAUTH_TOKEN_URL = OAUTH_URL_BASE + "?requestID=iframe_request_c37ac45d-d6f2-4585
     "&targetOrigin=https://my.playstation.com" \
     "&prompt=none"
 
+register_endpoint("OAUTH_URL", OAUTH_URL_BASE)
+MAX_AUTH_REDIRECTS = 10
+
+# session-wide fallback; requests get per-endpoint deadlines from AdaptiveTimeouts
 DEFAULT_TIMEOUT = 30
 
+# bodies bigger than that are decoded in the offload executor instead of the event loop
+JSON_OFFLOAD_BYTES = 256 * 1024
+
+# errors telling the host is unhealthy; any other response means it is up
+CIRCUIT_BREAKER_FAILURES = (BackendTimeout, BackendNotAvailable, BackendError, NetworkError)
+# breaker guarding the whole exchange (request and body read) in progress in the current task
+_guarding_breaker: ContextVar = ContextVar("guarding_breaker", default=None)
+
+
+@dataclass
+class _LocalWait:
+    """Time the GET in progress waited on local rate limits, left out of its latency"""
+    seconds: float = 0.0
+
+
+_local_wait: ContextVar = ContextVar("local_wait", default=None)
+
+# a duplicate of a slow GET is sent after the endpoint's p95 latency, for at most 5% of requests
+HEDGE_PERCENTILE = 95
+HEDGE_BUDGET_RATIO = 0.05
+HEDGE_BUDGET_BURST = 3
+
+
+@dataclass
+class AuthHop:
+    endpoint: str
+    status: int
+    duration: float
+
 
 def paginate_url(url, limit, offset=0):
     return url + "&limit={limit}&offset={offset}".format(limit=limit, offset=offset)
 
 
+# points the plugin at a local PSN emulation, e.g. benchmarks/fake_psn_server.py
+BASE_URL_ENV = "PSN_PLUGIN_BASE_URL"
+
+
+def rebase_url(base_url, url):
+    """Points a PSN url at base_url, keeping its host as the first path segment:
+    https://host/path?query -> base_url/host/path?query
+    """
+    parts = urlsplit(url)
+    return "{}/{}{}".format(base_url.rstrip("/"), parts.netloc, url[len(parts.scheme) + 3 + len(parts.netloc):])
+
+
 class HttpClient:
-    def __init__(self):
-        self._session = create_client_session(timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT))
+    def __init__(self, base_url=None, executor=None):
+        # every request is sent to base_url instead of PSN when set, see rebase_url
+        self._base_url = base_url
+        # bounded pool shared with the parsers of PSNClient; the default executor when None
+        self._executor = executor
+        self.connection_stats = ConnectionStats()
+        self.latency = LatencyTracker()
+        self.first_byte_latency = LatencyTracker()
+        self.timeouts = AdaptiveTimeouts(self.first_byte_latency, self.latency)
+        self.timeouts.set_classes({"OAUTH_URL": "small"})
+        self.hedge_budget = HedgeBudget(HEDGE_BUDGET_RATIO, HEDGE_BUDGET_BURST)
+        self._hedged_endpoints = frozenset()
+        self._host_slots = HostSlots()
+        self.circuit_breakers = HostCircuitBreakers()
+        self.json_blocking_time = 0.0
+        self.metrics = MetricsRegistry()
+        self._session = create_client_session(
+            connector=create_connector(),
+            timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT),
+            trace_configs=[self.connection_stats.trace_config()]
+        )
 
-    async def request(self, method, *args, **kwargs):
-        with handle_exception():
-            return await self._session.request(method, *args, **kwargs)
+    async def request(self, method, url, *args, **kwargs):
+        count_request()
+        endpoint = endpoint_name(url)
+        deadlines = self.timeouts.deadlines(endpoint)
+        kwargs.setdefault("timeout", deadlines.client_timeout())
+        start = time.perf_counter()
+        try:
+            with tracer.span(endpoint, "http", method=method), self._circuit(url), \
+                    self._timeouts_counted(endpoint, "first_byte"), handle_exception():
+                # the request returns as soon as the response headers are read
+                target = url if self._base_url is None else rebase_url(self._base_url, url)
+                response = await asyncio.wait_for(
+                    self._session.request(method, target, *args, **kwargs), deadlines.first_byte
+                )
+        except ApplicationError as error:
+            # handle_exception keeps the aiohttp error, which holds the status of error responses
+            self.metrics.record_status(endpoint, getattr(error.__context__, "status", None) or type(error).__name__)
+            raise
+        self.metrics.record_status(endpoint, response.status)
+        self.first_byte_latency.record(endpoint, time.perf_counter() - start)
+        return response
+
+    @contextmanager
+    def _circuit(self, url):
+        """Fails fast while the host's circuit is open, otherwise records the outcome of the block;
+        nested blocks for the same host are part of the outer exchange"""
+        breaker = self.circuit_breakers(url)
+        if _guarding_breaker.get() is breaker:
+            yield
+            return
+        admission = breaker.allow()
+        if not admission:
+            raise BackendNotAvailable("Circuit for {} is open".format(breaker.name))
+        token = _guarding_breaker.set(breaker)
+        try:
+            yield
+        except CIRCUIT_BREAKER_FAILURES:
+            breaker.record_failure(admission)
+            raise
+        except ApplicationError:
+            breaker.record_success(admission)
+            raise
+        except BaseException:
+            breaker.release(admission)
+            raise
+        else:
+            breaker.record_success(admission)
+        finally:
+            _guarding_breaker.reset(token)
+
+    @contextmanager
+    def _timeouts_counted(self, endpoint, phase):
+        try:
+            yield
+        except BackendTimeout as error:
+            # handle_exception raises BackendTimeout while handling the original aiohttp/asyncio error
+            expired = timeout_phase(error.__context__, phase)
+            self.timeouts.record_timeout(endpoint, expired)
+            self.metrics.record_timeout(endpoint, expired)
+            raise
+
+    def set_timeout_classes(self, classes):
+        """Maps endpoint names to timeout policy classes, see timeouts.TIMEOUT_POLICIES"""
+        self.timeouts.set_classes(classes)
+
+    def enable_hedging(self, endpoints):
+        """Opts idempotent GET endpoints in to hedged requests"""
+        self._hedged_endpoints = frozenset(endpoints)
 
     async def get(self, url, *args, **kwargs):
+        endpoint = endpoint_name(url)
+        self.hedge_budget.earn()
+        hedge_delay = self.latency.percentile(endpoint, HEDGE_PERCENTILE) \
+            if endpoint in self._hedged_endpoints else None
+        # the span includes waiting for a host slot, the nested request span only the exchange
+        with tracer.span("GET " + endpoint, "http"):
+            if hedge_delay is None:
+                return await self._get(url, endpoint, *args, **kwargs)
+            return await self._hedged_get(hedge_delay, url, endpoint, *args, **kwargs)
+
+    async def _hedged_get(self, hedge_delay, url, endpoint, *args, **kwargs):
+        """Sends a duplicate request when the first one is slower than usual, the first response wins"""
+        slot = self._host_slots(url)
+        async with slot:
+            # the delay is compared with latencies measured from sending, so it starts once a slot is taken
+            requests = {asyncio.ensure_future(self._fetch(url, endpoint, *args, **kwargs))}
+            try:
+                done, pending = await asyncio.wait(requests, timeout=hedge_delay)
+                # a duplicate waiting for a slot of a saturated host would not be sent any sooner
+                # nor would one waiting for a token of a throttled API family
+                if not done and not slot.locked() and not self._rate_limited(url) and self.hedge_budget.spend():
+                    logging.debug("Hedging request to %s after %.3fs", endpoint, hedge_delay)
+                    self.metrics.record_retry(endpoint)
+                    requests.add(asyncio.ensure_future(self._get(url, endpoint, *args, **kwargs)))
+                while True:
+                    done, pending = await asyncio.wait(requests, return_when=asyncio.FIRST_COMPLETED)
+                    succeeded = [request for request in done if request.exception() is None]
+                    if succeeded or not pending:
+                        return (succeeded or list(done))[0].result()
+                    requests = pending
+            finally:
+                for request in requests:
+                    request.cancel()
+
+    def _rate_limited(self, url) -> bool:
+        """Whether a request to url would wait on a local rate limit"""
+        return False
+
+    async def _get(self, url, endpoint, *args, **kwargs):
+        async with self._host_slots(url):
+            return await self._fetch(url, endpoint, *args, **kwargs)
+
+    async def _fetch(self, url, endpoint, *args, **kwargs):
         silent = kwargs.pop('silent', False)
-        response = await self.request("GET", *args, url=url, **kwargs)
+        start = time.perf_counter()
+        local_wait = _LocalWait()
+        with self._circuit(url):
+            token = _local_wait.set(local_wait)
+            try:
+                response = await self.request("GET", *args, url=url, **kwargs)
+            finally:
+                _local_wait.reset(token)
+            try:
+                with self._timeouts_counted(endpoint, "total"), handle_exception():
+                    body = await response.read()
+                    event_log.debug(
+                        "http.response", endpoint, method="GET", url=url, status=response.status, size=len(body),
+                        body="***" if silent else Truncated(body)
+                    )
+                    result = await self._decode_json(endpoint, body)
+            except ValueError:
+                logging.exception("Invalid response data for:\n%s", url)
+                raise UnknownBackendResponse()
+        latency = time.perf_counter() - start - local_wait.seconds
+        self.latency.record(endpoint, latency)
+        self.metrics.record_response(endpoint, latency, len(body))
+        return result
+
+    async def _decode_json(self, endpoint, body):
+        offload = len(body) > JSON_OFFLOAD_BYTES
+        start = time.perf_counter()
+        scheduled = None
         try:
-            raw_response = '***' if silent else await response.text()
-            logging.debug("Response for:\n{url}\n{data}".format(url=url, data=raw_response))
-            return await response.json()
-        except ValueError:
-            logging.exception("Invalid response data for:\n{url}".format(url=url))
-            raise UnknownBackendResponse()
+            if offload:
+                job = asyncio.get_running_loop().run_in_executor(self._executor, json.loads, body)
+                scheduled = time.perf_counter()
+                return await job
+            return json.loads(body)
+        finally:
+            # when offloaded, the loop is blocked only for scheduling the job
+            blocking_time = (scheduled or time.perf_counter()) - start
+            self.json_blocking_time += blocking_time
+            event_log.debug("json.decode", endpoint, size=len(body), offloaded=offload, blocking=round(blocking_time, 4))
 
     async def post(self, url, *args, **kwargs):
-        logging.debug("Sending data:\n{url}".format(url=url))
-        response = await self.request("POST", *args, url=url, **kwargs)
-        logging.debug("Response for post:\n{url}\n{data}".format(url=url, data=await response.text()))
-        return response
+        endpoint = endpoint_name(url)
+        async with self._host_slots(url):
+            start = time.perf_counter()
+            with self._circuit(url):
+                response = await self.request("POST", *args, url=url, **kwargs)
+            # the body is left to the caller
+            event_log.debug(
+                "http.response", endpoint, method="POST", url=url, status=response.status, size=response.content_length
+            )
+            self.metrics.record_response(endpoint, time.perf_counter() - start, response.content_length)
+            return response
+
+    async def prewarm(self, hosts):
+        """Opens connections ahead of time; hosts maps host name to the number of connections to open"""
+        async def connect(host):
+            try:
+                with handle_exception():
+                    url = "https://{}/".format(host)
+                    response = await self._session.head(
+                        url if self._base_url is None else rebase_url(self._base_url, url),
+                        allow_redirects=False, raise_for_status=False
+                    )
+                    response.release()
+            except ApplicationError as error:
+                logging.debug("Can not prewarm connection to %s: %r", host, error)
+
+        await asyncio.gather(*[connect(host) for host, count in hosts.items() for _ in range(count)])
 
 
 class AuthenticatedHttpClient(HttpClient):
-    def __init__(self, auth_lost_callback, store_credentials_callback):
+    def __init__(self, auth_lost_callback, store_credentials_callback, rate_limits=None, base_url=None, executor=None):
+        self.rate_limiters = RateLimiters(rate_limits)
         self._access_token = None
         self._refresh_token = None
         self._auth_lost_callback = auth_lost_callback
         self._store_credentials_callback = store_credentials_callback
         self.can_refresh = asyncio.Event()
-        super().__init__()
+        self.auth_hops: List[AuthHop] = []
+        self.auth_latency = 0.0
+        # bumped on every refresh; a 401 of an older generation is replayed on the current token
+        self._token_generation = 0
+        self.sync_auth_events: Counter = Counter()
+        self.session_auth_events: Counter = Counter()
+        super().__init__(base_url, executor)
 
     @property
     def is_authenticated(self):
@@ -119,31 +373,47 @@ class AuthenticatedHttpClient(HttpClient):
                 self._refresh_token = cookie.value
                 self._store_credentials_callback({"npsso": self._refresh_token})
 
-    async def get_access_token(self, refresh_token=None, url=OAUTH_TOKEN_URL, cookies=None):
+    async def get_access_token(self, refresh_token=None):
+        """Follows OAuth redirects until one of them carries the access token in its fragment"""
+        url = OAUTH_TOKEN_URL
+        # cookies are carried over all hops, received ones may hold a new npsso
+        cookies = SimpleCookie()
+        if refresh_token is not None:
+            cookies["npsso"] = refresh_token
+        received = SimpleCookie()
+        hops: List[AuthHop] = []
+        start = time.perf_counter()
         response = None
-        if cookies is None:
-            cookies = {"npsso": refresh_token}
         try:
-            response = await super().request(
-                "GET",
-                url=url,
-                cookies=cookies,
-                allow_redirects=False
-            )
-            location_params = urlsplit(response.headers["Location"])
-            self._validate_auth_response(location_params)
-            fragment = dict(parse_qsl(location_params.fragment))
-            if 'access_token' not in fragment:
-                return await self.get_access_token(url=response.headers['Location'], cookies=response.cookies)
-            self._store_new_npsso(cookies)
-            return fragment["access_token"]
+            for _ in range(MAX_AUTH_REDIRECTS):
+                hop_start = time.perf_counter()
+                response = await super().request("GET", url=url, cookies=cookies, allow_redirects=False)
+                try:
+                    hops.append(AuthHop(endpoint_name(url), response.status, time.perf_counter() - hop_start))
+                    location = response.headers["Location"]
+                    cookies.update(response.cookies)
+                    received.update(response.cookies)
+                finally:
+                    response.close()
+                location_params = urlsplit(location)
+                self._validate_auth_response(location_params)
+                fragment = dict(parse_qsl(location_params.fragment))
+                if "access_token" in fragment:
+                    self._store_new_npsso(received)
+                    return fragment["access_token"]
+                url = location
+            raise UnknownBackendResponse("No access token after {} redirects".format(MAX_AUTH_REDIRECTS))
         except AuthenticationRequired as e:
             raise InvalidCredentials(e.data)
         except (KeyError, IndexError):
             raise UnknownBackendResponse(str(response.headers))
         finally:
-            if response:
-                response.close()
+            self.auth_hops = hops
+            self.auth_latency = time.perf_counter() - start
+            logging.info(
+                "Access token request took %.3fs over %d hops: %s", self.auth_latency, len(hops),
+                ", ".join("{} {} {:.3f}s".format(hop.endpoint, hop.status, hop.duration) for hop in hops)
+            )
 
     async def authenticate(self, refresh_token):
         self._refresh_token = refresh_token
@@ -154,7 +424,10 @@ class AuthenticatedHttpClient(HttpClient):
         if not self._access_token:
             raise UnknownBackendResponse("Empty access token")
 
-    async def _refresh_access_token(self):
+    async def _refresh_access_token(self, generation=None):
+        if generation is not None and generation != self._token_generation:
+            # the token was refreshed after the failed request had been sent
+            return
         if not self.can_refresh.is_set():
             await self.can_refresh.wait()
             return
@@ -163,6 +436,8 @@ class AuthenticatedHttpClient(HttpClient):
             self._access_token = await self.get_access_token(self._refresh_token)
             if not self._access_token:
                 raise UnknownBackendResponse("Empty access token")
+            self._token_generation += 1
+            self._count_auth_event("refreshes")
         except (BackendNotAvailable, BackendTimeout, BackendError, NetworkError):
             logging.warning("Failed to refresh token for independent reasons")
             raise
@@ -174,19 +449,56 @@ class AuthenticatedHttpClient(HttpClient):
         finally:
             self.can_refresh.set()
 
+    def _count_auth_event(self, event: str):
+        self.sync_auth_events[event] += 1
+        self.session_auth_events[event] += 1
+
+    def take_sync_auth_report(self) -> Dict[str, int]:
+        """Token refreshes and replayed requests since the previous report"""
+        report = dict(self.sync_auth_events)
+        self.sync_auth_events.clear()
+        return report
+
     async def request(self, method, *args, **kwargs):
         if not self._access_token:
             raise AuthenticationRequired()
+        generation = self._token_generation
         try:
             return await self._oauth_request(method, *args, **kwargs)
         except AuthenticationRequired:
-            await self._refresh_access_token()
+            await self._refresh_access_token(generation)
+            self._count_auth_event("replays")
+            if "url" in kwargs:
+                self.metrics.record_retry(endpoint_name(kwargs["url"]))
             return await self._oauth_request(method, *args, **kwargs)
 
-    async def _oauth_request(self, method, *args, **kwargs):
+    def _rate_limited(self, url) -> bool:
+        family = self.rate_limiters.family(url)
+        return family is not None and not self.rate_limiters.available(family)
+
+    async def _oauth_request(self, method, url, *args, **kwargs):
+        family = self.rate_limiters.family(url)
+        if family is not None:
+            waited = await self.rate_limiters.acquire(family)
+            local_wait = _local_wait.get()
+            if local_wait is not None:
+                local_wait.seconds += waited
         headers = kwargs.setdefault("headers", {})
         headers["authorization"] = "Bearer " + self._access_token
-        return await super().request(method, *args, **kwargs)
+        try:
+            response = await super().request(method, url, *args, **kwargs)
+        except TooManyRequests:
+            if family is not None:
+                self.rate_limiters.throttle(family)
+            raise
+        if family is not None:
+            self.rate_limiters.succeeded(family)
+        return response
 
     async def logout(self):
+        self.connection_stats.log()
+        self.metrics.log()
+        for host, report in self.circuit_breakers.report().items():
+            if report["opened"]:
+                logging.info("Circuit for %s opened %d times, %d requests rejected", host, report["opened"], report["rejected"])
         await self._session.close()
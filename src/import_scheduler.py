@@ -0,0 +1,70 @@
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List
+
+DEFAULT_WORKERS = 8
+
+
+@dataclass
+class ImportRecord:
+    key: Any
+    queued_for: float
+    duration: float
+
+
+class ImportScheduler:
+    """Runs queued import jobs on a bounded pool of workers, highest priority first"""
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS):
+        self._max_workers = max_workers
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._counter = itertools.count()
+        self.completed: List[ImportRecord] = []
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def put(self, priority, job: Callable[[], Awaitable], key: Any = None):
+        # PriorityQueue pops the lowest item first; the counter keeps FIFO order for equal priorities
+        self._queue.put_nowait((-priority, next(self._counter), time.monotonic(), key, job))
+
+    def report(self) -> Dict:
+        """Summary of the imports run so far, readable after the scheduler has finished"""
+        queued_for = [record.queued_for for record in self.completed]
+        durations = [record.duration for record in self.completed]
+        return {
+            "completed": len(self.completed),
+            "queue_depth": self.queue_depth,
+            "queued_for_max": max(queued_for, default=0.0),
+            "duration_avg": sum(durations) / len(durations) if durations else 0.0,
+            "duration_max": max(durations, default=0.0),
+        }
+
+    async def run(self):
+        workers = min(self._max_workers, self._queue.qsize())
+        await asyncio.gather(*[self._worker() for _ in range(workers)])
+
+    async def _worker(self):
+        while True:
+            try:
+                _, _, queued_at, key, job = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started_at = time.monotonic()
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Import of %s failed", key)
+            finally:
+                finished_at = time.monotonic()
+                self.completed.append(ImportRecord(key, started_at - queued_at, finished_at - started_at))
+                logging.debug(
+                    "Imported %s in %.3fs (queued for %.3fs), %d left in queue",
+                    key, finished_at - started_at, started_at - queued_at, self.queue_depth
+                )
@@ -0,0 +1,44 @@
+from collections import defaultdict, deque
+from typing import Deque, Dict, Optional
+
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+
+
+class LatencyTracker:
+    """Rolling window of recent latencies per endpoint"""
+
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = MIN_SAMPLES):
+        self._min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, endpoint: str, latency: float):
+        self._samples[endpoint].append(latency)
+
+    def percentile(self, endpoint: str, percentile: float) -> Optional[float]:
+        """None until enough samples are collected for the endpoint"""
+        samples = self._samples.get(endpoint)
+        if not samples or len(samples) < self._min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+class HedgeBudget:
+    """Every request earns `ratio` of a hedge, so at most that share of requests is duplicated"""
+
+    def __init__(self, ratio: float, burst: float):
+        self._ratio = ratio
+        self._burst = burst
+        self._tokens = 0.0
+        self.hedged = 0
+
+    def earn(self):
+        self._tokens = min(self._burst, self._tokens + self._ratio)
+
+    def spend(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        self.hedged += 1
+        return True
@@ -0,0 +1,84 @@
+import logging
+import reprlib
+from collections import Counter
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# bytes of a response body, or characters of a parsed payload, kept in a log message
+BODY_LOG_LIMIT = 1024
+# every event is logged the first SAMPLE_FIRST times, then once per SAMPLE_EVERY occurrences
+SAMPLE_FIRST = 10
+SAMPLE_EVERY = 100
+
+_payload_repr = reprlib.Repr()
+_payload_repr.maxlevel = 4
+_payload_repr.maxdict = _payload_repr.maxlist = _payload_repr.maxtuple = 10
+_payload_repr.maxstring = _payload_repr.maxother = 80
+
+
+class Truncated:
+    """Body or payload rendered, up to the limit, only when a log record is formatted"""
+
+    def __init__(self, value: Any, limit: int = BODY_LOG_LIMIT):
+        self._value = value
+        self._limit = limit
+
+    def __str__(self) -> str:
+        if isinstance(self._value, (bytes, bytearray)):
+            text = self._value[:self._limit].decode("utf-8", errors="replace")
+            size = len(self._value)
+        else:
+            text = _payload_repr.repr(self._value)
+            size = len(text)
+        if size <= self._limit:
+            return text
+        return "{}... ({} {} in total)".format(
+            text[:self._limit], size, "bytes" if isinstance(self._value, (bytes, bytearray)) else "characters"
+        )
+
+    __repr__ = __str__
+
+
+class _Fields:
+    def __init__(self, fields: Dict[str, Any]):
+        self._fields = fields
+
+    def __str__(self) -> str:
+        return " ".join("{}={}".format(name, value) for name, value in self._fields.items())
+
+
+class EventLog:
+    """Structured log events for hot paths: fields are formatted only for records that get emitted,
+    and repeated events are sampled per event and key, reporting how many were suppressed
+    """
+
+    def __init__(self, sample_first: int = SAMPLE_FIRST, sample_every: int = SAMPLE_EVERY):
+        self._sample_first = sample_first
+        self._sample_every = sample_every
+        self._occurrences: Counter = Counter()
+        self._emitted: Dict[Tuple[str, Optional[Hashable]], int] = {}
+
+    def log(self, level: int, event: str, key: Optional[Hashable] = None, **fields):
+        if not logging.getLogger().isEnabledFor(level):
+            return
+        sample = (event, key)
+        self._occurrences[sample] += 1
+        occurrence = self._occurrences[sample]
+        if occurrence > self._sample_first and occurrence % self._sample_every:
+            return
+        suppressed = occurrence - self._emitted.get(sample, 0) - 1
+        self._emitted[sample] = occurrence
+        if key is not None:
+            fields = dict(key=key, **fields)
+        if suppressed:
+            fields["suppressed"] = suppressed
+        logging.log(level, "%s %s", event, _Fields(fields), extra={"event": event, "fields": fields})
+
+    def debug(self, event: str, key: Optional[Hashable] = None, **fields):
+        self.log(logging.DEBUG, event, key, **fields)
+
+    def reset(self):
+        self._occurrences.clear()
+        self._emitted.clear()
+
+
+event_log = EventLog()
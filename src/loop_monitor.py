@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from tracing import tracer
+
+# turns the monitor on from the plugin start
+LOOP_MONITOR_ENV = "PSN_PLUGIN_LOOP_MONITOR"
+SAMPLE_INTERVAL = 0.05
+# scheduling delay from which the loop counts as blocked
+BLOCKING_THRESHOLD = 0.1
+STACK_DEPTH = 3
+MAX_BLOCKING_EVENTS = 100
+
+
+@dataclass
+class BlockingEvent:
+    duration: float
+    task: str
+    span: Optional[str]
+    stack: List[str]
+
+
+def _task_name(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        # a plain loop callback, e.g. a protocol handler
+        return "callback"
+    coro = task._coro  # Task.get_coro() is not available before Python 3.8
+    return getattr(coro, "__qualname__", repr(coro))
+
+
+class LoopLagMonitor:
+    """Samples the scheduling delay of the event loop. A watchdog thread catches the loop while it is
+    blocked and attributes the blocking to the running task, its innermost tracing span and the call site
+    """
+
+    def __init__(
+        self,
+        interval: float = SAMPLE_INTERVAL,
+        threshold: float = BLOCKING_THRESHOLD,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable] = asyncio.sleep
+    ):
+        self._interval = interval
+        self._threshold = threshold
+        self._clock = clock
+        self._sleep = sleep
+        self._sampler: Optional[asyncio.Task] = None
+        # set to stop the running watchdog thread; every thread gets its own
+        self._watchdog_stopped: Optional[threading.Event] = None
+        self._heartbeat = 0.0
+        self._caught: Optional[BlockingEvent] = None
+        self.samples = 0
+        self.lag_max = 0.0
+        self.lag_total = 0.0
+        self.blocking_events: List[BlockingEvent] = []
+        self.blocking_time: Counter = Counter()
+
+    @property
+    def running(self) -> bool:
+        return self._sampler is not None
+
+    def start(self):
+        if self.running:
+            return
+        loop = asyncio.get_event_loop()
+        self._heartbeat = self._clock()
+        self._sampler = asyncio.ensure_future(self._sample())
+        self._watchdog_stopped = threading.Event()
+        threading.Thread(
+            target=self._watch, args=(loop, threading.get_ident(), self._watchdog_stopped),
+            name="loop-monitor", daemon=True
+        ).start()
+
+    def stop(self):
+        """Signals the watchdog without waiting for it, it exits within half a threshold"""
+        if not self.running:
+            return
+        self._watchdog_stopped.set()
+        self._watchdog_stopped = None
+        self._sampler.cancel()
+        self._sampler = None
+
+    async def _sample(self):
+        while True:
+            expected = self._clock() + self._interval
+            self._heartbeat = expected
+            await self._sleep(self._interval)
+            lag = max(0.0, self._clock() - expected)
+            self.samples += 1
+            self.lag_total += lag
+            self.lag_max = max(self.lag_max, lag)
+            if lag >= self._threshold:
+                self._record_blocking(lag)
+
+    def _record_blocking(self, lag: float):
+        event, self._caught = self._caught, None
+        if event is None:
+            # the loop was blocked for less than a watchdog period
+            event = BlockingEvent(lag, "unknown", None, [])
+        event.duration = lag
+        culprit = event.span or event.task
+        self.blocking_time[culprit] += lag
+        if len(self.blocking_events) < MAX_BLOCKING_EVENTS:
+            self.blocking_events.append(event)
+        logging.warning(
+            "Event loop blocked for %.3fs by %s (span %s) at %s", lag, event.task, event.span, " <- ".join(event.stack)
+        )
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread: int, stopped: threading.Event):
+        while not stopped.wait(self._threshold / 2):
+            self._check(loop, loop_thread)
+
+    def _check(self, loop: asyncio.AbstractEventLoop, loop_thread: int):
+        """Catches the loop thread in the act once the sampler missed its heartbeat by the threshold"""
+        if self._caught is not None or self._clock() - self._heartbeat < self._threshold:
+            return
+        task = asyncio.current_task(loop)
+        frame = sys._current_frames().get(loop_thread)
+        stack = traceback.extract_stack(frame, limit=None)[-STACK_DEPTH:] if frame is not None else []
+        self._caught = BlockingEvent(
+            duration=0.0,
+            task=_task_name(task),
+            span=tracer.task_span(task),
+            stack=["{}:{} {}".format(entry.filename, entry.lineno, entry.name) for entry in reversed(stack)]
+        )
+
+    def report(self) -> Dict:
+        return {
+            "samples": self.samples,
+            "lag_avg": self.lag_total / self.samples if self.samples else 0.0,
+            "lag_max": self.lag_max,
+            "blocked": sum(self.blocking_time.values()),
+            "blocked_by": dict(self.blocking_time.most_common()),
+        }
+
+    def log(self):
+        report = self.report()
+        logging.info(
+            "Event loop lag avg %.4fs max %.3fs over %d samples, blocked for %.3fs: %s",
+            report["lag_avg"], report["lag_max"], report["samples"], report["blocked"],
+            ", ".join("{} {:.3f}s".format(culprit, duration) for culprit, duration in report["blocked_by"].items())
+        )
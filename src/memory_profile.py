@@ -0,0 +1,156 @@
+import gc
+import logging
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+# comma separated checkpoints to profile, or "all"; turns tracemalloc on from the plugin start
+MEMORY_PROFILE_ENV = "PSN_PLUGIN_MEMORY_PROFILE"
+CHECKPOINTS = ("after_sync", "after_import", "after_presence", "shutdown")
+TRACEBACK_FRAMES = 5
+TOP_SITES = 10
+# allocations of the profiler itself
+_IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<unknown>")
+
+
+@dataclass
+class AllocationSite:
+    site: str
+    size: int
+    size_diff: int
+    count_diff: int
+
+
+@dataclass
+class MemoryReport:
+    checkpoint: str
+    traced: int
+    traced_peak: int
+    # growth since the previous checkpoint, largest first
+    top_sites: List[AllocationSite]
+    # deep sizes of the plugin's caches and contexts
+    structures: Dict[str, int]
+
+
+def parse_checkpoints(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    if value.strip() == "all":
+        return list(CHECKPOINTS)
+    checkpoints = [checkpoint.strip() for checkpoint in value.split(",") if checkpoint.strip()]
+    unknown = set(checkpoints) - set(CHECKPOINTS)
+    if unknown:
+        logging.warning("Unknown memory checkpoints %s, expected some of %s", ", ".join(sorted(unknown)), ", ".join(CHECKPOINTS))
+    return [checkpoint for checkpoint in checkpoints if checkpoint in CHECKPOINTS]
+
+
+def deep_sizeof(obj: Any) -> int:
+    """Bytes held by obj and everything reachable from it through containers and instance attributes;
+    shared objects are counted once, classes, functions and modules are not followed"""
+    seen = set()
+    size = 0
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, (type, type(sys), type(deep_sizeof))):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+        elif isinstance(item, (str, bytes, bytearray, int, float)):
+            continue
+        else:
+            if hasattr(item, "__dict__"):
+                pending.append(item.__dict__)
+            for slot in getattr(type(item), "__slots__", ()):
+                if hasattr(item, slot):
+                    pending.append(getattr(item, slot))
+    return size
+
+
+def _format_site(traceback: tracemalloc.Traceback) -> str:
+    # innermost frame first, it is the allocating line
+    return " <- ".join("{}:{}".format(frame.filename, frame.lineno) for frame in reversed(traceback))
+
+
+class MemoryProfiler:
+    """Takes tracemalloc snapshots at the enabled checkpoints and reports what grew since the previous one"""
+
+    def __init__(self, checkpoints: Iterable[str] = (), top: int = TOP_SITES, frames: int = TRACEBACK_FRAMES):
+        self.checkpoints = set(checkpoints)
+        self._top = top
+        self._frames = frames
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._started = False
+        # the last report of each checkpoint
+        self.reports: Dict[str, MemoryReport] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.checkpoints)
+
+    def start(self):
+        if not self.enabled or tracemalloc.is_tracing():
+            return
+        tracemalloc.start(self._frames)
+        self._started = True
+        self._snapshot = self._take_snapshot()
+
+    def stop(self):
+        self._snapshot = None
+        # tracing started by someone else is theirs to stop
+        if self._started:
+            self._started = False
+            tracemalloc.stop()
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        # garbage waiting for a collection would show up as growth
+        gc.collect()
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, filename) for filename in _IGNORED_FILES]
+        )
+
+    def checkpoint(self, name: str, structures: Dict[str, Any]) -> Optional[MemoryReport]:
+        """Reports allocation growth since the previous checkpoint and the size of structures, if name is enabled"""
+        if name not in self.checkpoints or not tracemalloc.is_tracing():
+            return None
+        snapshot = self._take_snapshot()
+        if self._snapshot is None:
+            statistics = snapshot.statistics("traceback")
+            top_sites = [AllocationSite(_format_site(stat.traceback), stat.size, stat.size, stat.count) for stat in statistics]
+        else:
+            statistics = snapshot.compare_to(self._snapshot, "traceback")
+            top_sites = [
+                AllocationSite(_format_site(stat.traceback), stat.size, stat.size_diff, stat.count_diff)
+                for stat in statistics
+                if stat.size_diff > 0
+            ]
+        self._snapshot = snapshot
+        traced, traced_peak = tracemalloc.get_traced_memory()
+        report = self.reports[name] = MemoryReport(
+            checkpoint=name,
+            traced=traced,
+            traced_peak=traced_peak,
+            top_sites=sorted(top_sites, key=lambda site: site.size_diff, reverse=True)[:self._top],
+            structures={structure: deep_sizeof(value) for structure, value in structures.items()}
+        )
+        self.log(report)
+        return report
+
+    @staticmethod
+    def log(report: MemoryReport):
+        logging.info(
+            "Memory at %s: %.1f kB traced (peak %.1f kB); %s", report.checkpoint,
+            report.traced / 1024, report.traced_peak / 1024,
+            ", ".join("{} {:.1f} kB".format(name, size / 1024) for name, size in sorted(report.structures.items()))
+        )
+        for site in report.top_sites:
+            logging.info(
+                "Memory at %s grew by %+.1f kB in %+d blocks (%.1f kB in total) at %s",
+                report.checkpoint, site.size_diff / 1024, site.count_diff, site.size / 1024, site.site
+            )
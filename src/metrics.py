@@ -0,0 +1,80 @@
+import bisect
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Union
+
+# upper bounds of the latency histogram buckets in seconds, the last bucket is unbounded
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> Dict:
+        buckets = {str(bound): count for bound, count in zip(self._bounds, self._counts)}
+        buckets["inf"] = self._counts[-1]
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.latency = Histogram()
+        self.bytes = 0
+        self.statuses: Counter = Counter()
+        self.retries = 0
+        self.timeouts: Counter = Counter()
+
+    def snapshot(self) -> Dict:
+        return {
+            "requests": sum(self.statuses.values()),
+            "latency": self.latency.snapshot(),
+            "bytes": self.bytes,
+            "statuses": dict(self.statuses),
+            "retries": self.retries,
+            "timeouts": dict(self.timeouts),
+        }
+
+
+class MetricsRegistry:
+    """Request metrics per endpoint name (see endpoints.register_endpoint), not per raw url"""
+
+    def __init__(self):
+        self._endpoints: Dict[str, EndpointMetrics] = defaultdict(EndpointMetrics)
+
+    def record_status(self, endpoint: str, status: Union[int, str]):
+        """HTTP status of a response, or the error name of a request which got none"""
+        self._endpoints[endpoint].statuses[status] += 1
+
+    def record_response(self, endpoint: str, latency: float, size: Optional[int]):
+        metrics = self._endpoints[endpoint]
+        metrics.latency.observe(latency)
+        if size is not None:
+            metrics.bytes += size
+
+    def record_retry(self, endpoint: str):
+        self._endpoints[endpoint].retries += 1
+
+    def record_timeout(self, endpoint: str, phase: str):
+        self._endpoints[endpoint].timeouts[phase] += 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {endpoint: metrics.snapshot() for endpoint, metrics in self._endpoints.items()}
+
+    def log(self):
+        snapshot = self.snapshot()
+        for endpoint in sorted(snapshot, key=lambda name: snapshot[name]["latency"]["sum"], reverse=True):
+            metrics = snapshot[endpoint]
+            logging.info(
+                "%s: %d requests, %.3fs total, %.1f kB, statuses %s, %d retries, timeouts %s",
+                endpoint, metrics["requests"], metrics["latency"]["sum"], metrics["bytes"] / 1024,
+                metrics["statuses"], metrics["retries"], metrics["timeouts"]
+            )
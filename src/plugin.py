@@ -2,25 +2,35 @@ import asyncio
 import binascii
 import json
 import logging
+import os
 import pickle
 import sys
+import time
 from collections import defaultdict
+from dataclasses import dataclass
+from functools import partial
+from urllib.parse import urlsplit
 
 from galaxy.api.plugin import Plugin, create_and_run_plugin
 from galaxy.api.types import Authentication, NextStep, Achievement, UserPresence, PresenceState, SubscriptionGame, Subscription
 from galaxy.api.consts import Platform, SubscriptionDiscovery
-from galaxy.api.errors import ApplicationError, InvalidCredentials, UnknownError
+from galaxy.api.errors import ApplicationError, BackendNotAvailable, BackendTimeout, InvalidCredentials, UnknownError
 from galaxy.api.jsonrpc import InvalidParams
 
 import serialization
-from cache import Cache
-from http_client import AuthenticatedHttpClient
+from budgets import RequestAccounting, accounted, current_operation
+from cache import Cache, CacheStats, Freshness, FreshnessPolicy, StaleWhileRevalidateCache
+from import_scheduler import ImportScheduler
+from loop_monitor import LOOP_MONITOR_ENV, LoopLagMonitor
+from memory_profile import MEMORY_PROFILE_ENV, MemoryProfiler, parse_checkpoints
+from http_client import AuthenticatedHttpClient, BASE_URL_ENV
+from tracing import TRACE_FILE_ENV, traced, tracer
 from psn_client import (
     CommunicationId, TitleId, TrophyTitles, UnixTimestamp,
     PSNClient, MAX_TITLE_IDS_PER_REQUEST, PLAYSTATION_PLUS,
-    PLAYSTATION_NOW
+    PLAYSTATION_NOW, EARNED_TROPHIES_PAGE, FRIENDS_URL, HEDGED_ENDPOINTS, TIMEOUT_CLASSES, create_offload_executor
 )
-from typing import Dict, List, Set, Iterable, Tuple, Optional, Any, AsyncGenerator
+from typing import Dict, List, Set, Iterable, Tuple, Optional, Any, AsyncGenerator, Awaitable, Callable
 from version import __version__
 
 from http_client import OAUTH_LOGIN_URL, OAUTH_LOGIN_REDIRECT_URL
@@ -39,28 +49,105 @@ _TID_TROPHIES_DICT = Dict[TitleId, List[Achievement]]
 
 TROPHIES_CACHE_KEY = "trophies"
 COMMUNICATION_IDS_CACHE_KEY = "communication_ids"
+COMMUNICATION_IDS_TIMESTAMPS_CACHE_KEY = "communication_ids_timestamps"
+
+OWNED_GAMES_WARM_UP = "owned_games"
+TROPHY_TITLES_WARM_UP = "trophy_titles"
+# connections opened on warm-up, for hosts the first sync hits with parallel requests
+WARM_UP_CONNECTIONS = {
+    urlsplit(EARNED_TROPHIES_PAGE).hostname: 4,
+    urlsplit(FRIENDS_URL).hostname: 1,
+}
+
+FRESHNESS_POLICIES = {
+    "communication_ids": FreshnessPolicy(max_age=7 * 24 * 60 * 60, max_stale=float("inf")),
+    "trophy_titles": FreshnessPolicy(max_age=60, max_stale=15 * 60),
+    "friends": FreshnessPolicy(max_age=5 * 60, max_stale=60 * 60),
+}
+
+# cache lookup counted for each freshness of the entry
+_LOOKUP_EVENTS = {Freshness.Fresh: "hits", Freshness.Stale: "stale", Freshness.Expired: "misses"}
+
+TROPHY_IMPORT_WORKERS = 8
+# seconds after which achievements context is returned and remaining imports continue in background
+ACHIEVEMENTS_CONTEXT_DEADLINE = 60
+
+@dataclass
+class _WarmUp:
+    future: asyncio.Future
+    started_at: float
+    finished_at: Optional[float] = None
+
+    def run_time(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+def _json_entry_size(title_id: TitleId, comm_ids: List[CommunicationId]) -> int:
+    """Length of the entry in the JSON serialized communication ids cache, with its ", " separator"""
+    return len(json.dumps(title_id)) + len(json.dumps(comm_ids)) + 4
+
 
 class PSNPlugin(Plugin):
     def __init__(self, reader, writer, token):
         super().__init__(Platform.Psn, __version__, reader, writer, token)
-        self._http_client = AuthenticatedHttpClient(self.lost_authentication, self.store_credentials)
-        self._psn_client = PSNClient(self._http_client)
+        # JSON decoding and parsing of big payloads share one bounded pool, shut down by PSNClient.close
+        offload_executor = create_offload_executor()
+        self._http_client = AuthenticatedHttpClient(
+            self.lost_authentication, self.store_credentials, base_url=os.environ.get(BASE_URL_ENV),
+            executor=offload_executor
+        )
+        self._http_client.enable_hedging(HEDGED_ENDPOINTS)
+        self._http_client.set_timeout_classes(TIMEOUT_CLASSES)
+        self._psn_client = PSNClient(self._http_client, executor=offload_executor)
         self._trophies_cache = Cache()
+        self.cache_stats = {TROPHIES_CACHE_KEY: CacheStats(), COMMUNICATION_IDS_CACHE_KEY: CacheStats()}
+        # JSON size of the communication ids cache entries with their separators, None until first measured
+        self._comm_ids_size: Optional[int] = None
+        # a host with an open circuit fails fast with BackendNotAvailable; last known data is better than nothing
+        self._trophy_titles_cache = StaleWhileRevalidateCache(
+            FRESHNESS_POLICIES["trophy_titles"], serve_expired_on=(BackendNotAvailable,)
+        )
+        self._friends_cache = StaleWhileRevalidateCache(
+            FRESHNESS_POLICIES["friends"], serve_expired_on=(BackendNotAvailable,)
+        )
+        self._comm_ids_requests: Dict[TitleId, asyncio.Future] = {}
+        self._background_tasks: Set[asyncio.Task] = set()
+        self._trophies_imports: Dict[CommunicationId, asyncio.Future] = {}
+        # scheduler of the last trophies import, kept for its queue depth and per title latencies
+        self.trophies_import: Optional[ImportScheduler] = None
+        self._authenticated = asyncio.Event()
+        self._warm_ups: Dict[str, _WarmUp] = {}
+        self.warm_up_savings: Dict[str, float] = {}
+        self._trace_file = os.environ.get(TRACE_FILE_ENV)
+        if self._trace_file:
+            tracer.enable()
+        # switched with set_loop_monitoring at runtime; on from the start when LOOP_MONITOR_ENV is set
+        self.loop_monitor = LoopLagMonitor()
+        self.request_accounting = RequestAccounting()
+        # tracemalloc slows everything down, so snapshots are taken only at checkpoints named in MEMORY_PROFILE_ENV
+        self.memory_profiler = MemoryProfiler(parse_checkpoints(os.environ.get(MEMORY_PROFILE_ENV)))
         logging.getLogger("urllib3").setLevel(logging.FATAL)
 
     @property
     def _comm_ids_cache(self):
         return self.persistent_cache.setdefault(COMMUNICATION_IDS_CACHE_KEY, {})
 
+    @property
+    def _comm_ids_timestamps(self):
+        return self.persistent_cache.setdefault(COMMUNICATION_IDS_TIMESTAMPS_CACHE_KEY, {})
+
     async def _do_auth(self, npsso):
         if not npsso:
             raise InvalidCredentials()
 
         await self._http_client.authenticate(npsso)
         user_id, user_name = await self._psn_client.async_get_own_user_info()
+        self._authenticated.set()
 
         return Authentication(user_id=user_id, user_name=user_name)
 
+    @traced("plugin")
+    @accounted
     async def authenticate(self, stored_credentials=None):
         stored_npsso = stored_credentials.get("npsso") if stored_credentials else None
         if not stored_npsso:
@@ -69,6 +156,8 @@ class PSNPlugin(Plugin):
         auth_info = await self._do_auth(stored_npsso)
         return auth_info
 
+    @traced("plugin")
+    @accounted
     async def pass_login_credentials(self, step, credentials, cookies):
         def get_npsso():
             for c in cookies:
@@ -95,30 +184,89 @@ class PSNPlugin(Plugin):
             for it in range(0, len(title_ids), MAX_TITLE_IDS_PER_REQUEST)
         ])
 
+        comm_ids_stats = self.cache_stats[COMMUNICATION_IDS_CACHE_KEY]
+        comm_ids_stats.record("imports", len(delta))
+        comm_ids_stats.record("evictions", sum(title_id in self._comm_ids_cache for title_id in delta))
+        if self._comm_ids_size is not None:
+            self._comm_ids_size += sum(
+                _json_entry_size(title_id, comm_ids) - (
+                    _json_entry_size(title_id, self._comm_ids_cache[title_id]) if title_id in self._comm_ids_cache else 0
+                )
+                for title_id, comm_ids in delta.items()
+            )
         self._comm_ids_cache.update(delta)
+        now = time.time()
+        self._comm_ids_timestamps.update({title_id: now for title_id in delta})
         self.push_cache()
         return delta
 
+    def _stamp_legacy_comm_ids(self):
+        """Entries cached before timestamps were stored were valid then; stamping them with the load time
+        spares the first sync a burst of revalidations"""
+        comm_ids = self.persistent_cache.get(COMMUNICATION_IDS_CACHE_KEY)
+        if not isinstance(comm_ids, dict):
+            return
+        legacy = comm_ids.keys() - self._comm_ids_timestamps.keys()
+        if legacy:
+            self._comm_ids_timestamps.update(dict.fromkeys(legacy, time.time()))
+
+    def _comm_ids_freshness(self, title_id: TitleId) -> Freshness:
+        fetched_at = self._comm_ids_timestamps.get(title_id)
+        if fetched_at is None:
+            # entries cached before timestamps were stored are stamped in handshake_complete
+            return Freshness.Fresh
+        return FRESHNESS_POLICIES["communication_ids"].freshness(time.time() - fetched_at)
+
+    def _request_communication_ids(self, title_ids: List[TitleId]) -> asyncio.Future:
+        request = asyncio.ensure_future(self.update_communication_id_cache(title_ids))
+        for title_id in title_ids:
+            self._comm_ids_requests[title_id] = request
+        request.add_done_callback(partial(self._communication_ids_request_done, title_ids))
+        return request
+
+    def _communication_ids_request_done(self, title_ids: List[TitleId], request: asyncio.Future):
+        for title_id in title_ids:
+            if self._comm_ids_requests.get(title_id) is request:
+                del self._comm_ids_requests[title_id]
+
+    @traced("plugin")
     async def get_game_communication_ids(self, title_ids: List[TitleId]) -> Dict[TitleId, List[CommunicationId]]:
         result: Dict[TitleId, List[CommunicationId]] = dict()
         misses: Set[TitleId] = set()
+        stale: Set[TitleId] = set()
         for title_id in title_ids:
             comm_ids: Optional[List[CommunicationId]] = self._comm_ids_cache.get(title_id)
-            if comm_ids is not None:
-                result[title_id] = comm_ids
-            else:
+            freshness = Freshness.Expired if comm_ids is None else self._comm_ids_freshness(title_id)
+            self.cache_stats[COMMUNICATION_IDS_CACHE_KEY].record(_LOOKUP_EVENTS[freshness])
+            if freshness == Freshness.Expired:
                 misses.add(title_id)
+                continue
+            result[title_id] = comm_ids
+            if freshness == Freshness.Stale and title_id not in self._comm_ids_requests:
+                stale.add(title_id)
+
+        if stale:
+            self._run_in_background(self._request_communication_ids(list(stale)))
 
         if misses:
-            result.update(await self.update_communication_id_cache(list(misses)))
+            # attach to requests already in flight, e.g. started by the warm-up
+            requests = {self._comm_ids_requests[title_id] for title_id in misses if title_id in self._comm_ids_requests}
+            not_requested = [title_id for title_id in misses if title_id not in self._comm_ids_requests]
+            if not_requested:
+                requests.add(self._request_communication_ids(not_requested))
+            for delta in await asyncio.gather(*[asyncio.shield(request) for request in requests]):
+                result.update({title_id: delta[title_id] for title_id in misses if title_id in delta})
 
         return result
 
+    @traced("plugin")
+    @accounted
     async def get_subscriptions(self) -> List[Subscription]:
         is_plus_active = await self._psn_client.get_psplus_status()
         return [Subscription(PLAYSTATION_PLUS, is_plus_active, None),
             Subscription(PLAYSTATION_NOW, None, None, SubscriptionDiscovery.USER_ENABLED)]
 
+    @traced("plugin")
     async def get_subscription_games(self, subscription_name: str, context: Any) -> AsyncGenerator[List[SubscriptionGame], None]:
         account_info = await self._psn_client.get_account_info()
         if subscription_name == PLAYSTATION_PLUS:
@@ -127,7 +275,7 @@ class PSNPlugin(Plugin):
         if subscription_name == PLAYSTATION_NOW:
             yield await self._psn_client.get_psnow_games(account_info)
 
-    async def get_owned_games(self):
+    async def _get_owned_games(self):
         async def filter_games(titles):
             comm_id_map = await self.get_game_communication_ids([t.game_id for t in titles])
             return [title for title in titles if self._is_game(comm_id_map[title.game_id])]
@@ -136,38 +284,197 @@ class PSNPlugin(Plugin):
             await self._psn_client.async_get_owned_games()
         )
 
+    @traced("plugin")
+    @accounted
+    async def get_owned_games(self):
+        try:
+            return await self._from_warm_up(OWNED_GAMES_WARM_UP, self._get_owned_games)
+        finally:
+            self._log_sync_stats("Owned games sync")
+            self._memory_checkpoint("after_sync")
+
+    @traced("plugin")
+    @accounted
     async def get_unlocked_achievements(self, game_id: str, context: Any) -> List[Achievement]:
         if not context:
             return []
         comm_ids: List[CommunicationId] = (await self.get_game_communication_ids([game_id]))[game_id]
         if not self._is_game(comm_ids):
             raise InvalidParams()
-        return self._get_game_trophies_from_cache(comm_ids, context)[0]
-
+        # lookups are counted once, by prepare_achievements_context
+        cached = self._get_game_trophies_from_cache(comm_ids, context, record=False)
+        importing = [comm_id for comm_id in cached[1] if comm_id in self._trophies_imports]
+        if importing:
+            # the context was returned at the deadline; an empty list would be taken for no achievements
+            raise BackendTimeout("Trophies of {} are still being imported".format(", ".join(sorted(importing))))
+        return cached[0]
+
+    @traced("plugin")
+    @accounted
     async def prepare_achievements_context(self, game_ids: List[str]) -> Any:
         games_cids = await self.get_game_communication_ids(game_ids)
-        trophy_titles = await self._psn_client.get_trophy_titles()
+        trophy_titles = await self._from_warm_up(TROPHY_TITLES_WARM_UP, partial(
+            self._trophy_titles_cache.get, "trophy_titles", self._psn_client.get_trophy_titles
+        ))
 
         pending_cid_tids, pending_tid_cids, tid_trophies = self._process_trophies_cache(games_cids, trophy_titles)
 
-        # process pending trophies
-        requests = []
-        for comm_id in pending_cid_tids.keys():
+        # process pending trophies, most recently updated titles first;
+        # titles still being imported for a previous call are waited for instead of requested again
+        scheduler = self.trophies_import = ImportScheduler(TROPHY_IMPORT_WORKERS)
+        queued: List[CommunicationId] = []
+        attached: Set[asyncio.Future] = set()
+        for comm_id, pending_tids in pending_cid_tids.items():
+            in_flight = self._trophies_imports.get(comm_id)
+            if in_flight is not None:
+                attached.add(in_flight)
+                continue
             timestamp = trophy_titles[comm_id]
-            pending_tids = pending_cid_tids[comm_id]
-            requests.append(self._import_trophies(comm_id, pending_tids, pending_tid_cids, tid_trophies, timestamp))
+            scheduler.put(timestamp, partial(
+                self._import_trophies, comm_id, pending_tids, pending_tid_cids, tid_trophies, timestamp
+            ), key=comm_id)
+            queued.append(comm_id)
+
+        import_task = asyncio.ensure_future(self._run_trophies_import(scheduler))
+        self._run_in_background(import_task)
+        for comm_id in queued:
+            self._trophies_imports[comm_id] = import_task
+        import_task.add_done_callback(partial(self._trophies_import_done, queued))
+
+        # imports go on in the background past the deadline or once the operation spent its hard budget
+        imports = asyncio.ensure_future(asyncio.wait(attached | {import_task}))
+        waiters = {imports}
+        operation = current_operation()
+        if operation is not None and operation.budget.hard is not None:
+            waiters.add(asyncio.ensure_future(operation.exhausted.wait()))
+        try:
+            done, _ = await asyncio.wait(waiters, timeout=ACHIEVEMENTS_CONTEXT_DEADLINE, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        if imports not in done:
+            logging.info(
+                "Trophies import %s, %d titles left to import in background",
+                "exceeded the request budget" if done else "exceeded {}s deadline".format(ACHIEVEMENTS_CONTEXT_DEADLINE),
+                len(self._trophies_imports)
+            )
 
-        await asyncio.gather(*requests)
+        return trophy_titles
+
+    def _trophies_import_done(self, comm_ids: List[CommunicationId], import_task: asyncio.Future):
+        for comm_id in comm_ids:
+            if self._trophies_imports.get(comm_id) is import_task:
+                del self._trophies_imports[comm_id]
+
+    @traced("plugin")
+    async def _run_trophies_import(self, scheduler: ImportScheduler):
+        await scheduler.run()
+        report = scheduler.report()
+        logging.info(
+            "Imported trophies of %d titles, %.3fs on average (max %.3fs), longest wait in queue %.3fs",
+            report["completed"], report["duration_avg"], report["duration_max"], report["queued_for_max"]
+        )
+        self._log_sync_stats("Trophies import")
 
         # update cache
-        if requests:
+        if scheduler.completed:
             try:
-                self.persistent_cache[TROPHIES_CACHE_KEY] = serialization.dumps(self._trophies_cache)
-                self.push_cache()
+                with tracer.span("serialize trophies cache", "cache"):
+                    self.persistent_cache[TROPHIES_CACHE_KEY] = serialization.dumps(self._trophies_cache)
+                self.cache_stats[TROPHIES_CACHE_KEY].serialized_size = len(self.persistent_cache[TROPHIES_CACHE_KEY])
+                with tracer.span("push_cache", "cache"):
+                    self.push_cache()
             except (pickle.PicklingError, binascii.Error):
                 logging.error("Can not serialize trophies cache")
+        self._memory_checkpoint("after_import")
+
+    def _log_sync_stats(self, sync: str):
+        waits = self._http_client.rate_limiters.take_sync_report()
+        if waits:
+            logging.info("%s waited on rate limits: %s", sync, ", ".join(
+                "{} {:.3f}s".format(family, wait_time) for family, wait_time in sorted(waits.items())
+            ))
+        auth_events = self._http_client.take_sync_auth_report()
+        if auth_events:
+            logging.info("%s refreshed the access token %d times, %d requests replayed", sync,
+                         auth_events.get("refreshes", 0), auth_events.get("replays", 0))
+        self._log_cache_stats(sync, {name: stats.take_sync_report() for name, stats in self.cache_stats.items()})
+
+    def _memory_checkpoint(self, checkpoint: str, **structures):
+        if checkpoint not in self.memory_profiler.checkpoints:
+            return
+        with tracer.span("memory checkpoint " + checkpoint, "memory"):
+            self.memory_profiler.checkpoint(checkpoint, dict(
+                structures,
+                trophies_cache=self._trophies_cache,
+                comm_ids_cache=self._comm_ids_cache,
+                trophy_titles_cache=self._trophy_titles_cache,
+                friends_cache=self._friends_cache,
+                persistent_cache=self.persistent_cache,
+            ))
+
+    def _log_cache_stats(self, period: str, reports: Dict[str, Dict[str, int]]):
+        if self._comm_ids_size is None:
+            # serialized once, then kept up to date by update_communication_id_cache
+            self._comm_ids_size = len(json.dumps(self._comm_ids_cache)) if self._comm_ids_cache else 0
+        self.cache_stats[COMMUNICATION_IDS_CACHE_KEY].serialized_size = max(2, self._comm_ids_size)
+        for name, counts in reports.items():
+            if not counts:
+                continue
+            stats = self.cache_stats[name]
+            hit_ratio = stats.hit_ratio(counts)
+            logging.info(
+                "%s %s cache: %d hits, %d misses, %d stale (hit ratio %s), %d imported, %d evicted, %s bytes serialized",
+                period, name, counts.get("hits", 0), counts.get("misses", 0), counts.get("stale", 0),
+                "-" if hit_ratio is None else "{:.0%}".format(hit_ratio),
+                counts.get("imports", 0), counts.get("evictions", 0), stats.serialized_size
+            )
+
+    def _run_in_background(self, task: asyncio.Future):
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_task_done)
+
+    def _background_task_done(self, task: asyncio.Future):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning("Background task failed: %r", task.exception())
+
+    def _start_warm_up(self, name: str, coro) -> asyncio.Future:
+        warm_up = _WarmUp(asyncio.ensure_future(coro), time.monotonic())
+
+        def finished(_):
+            warm_up.finished_at = time.monotonic()
+
+        warm_up.future.add_done_callback(finished)
+        self._warm_ups[name] = warm_up
+        return warm_up.future
+
+    async def _from_warm_up(self, name: str, fetch: Callable[[], Awaitable]):
+        """Result of the warm-up, or of fetch if there is none or it failed; every warm-up serves only the first call"""
+        warm_up = self._warm_ups.pop(name, None)
+        if warm_up is None:
+            return await fetch()
+        attached_at = time.monotonic()
+        try:
+            result = await asyncio.shield(warm_up.future)
+        except ApplicationError:
+            logging.warning("%s warm-up failed, fetching again", name)
+            return await fetch()
+        saved_time = warm_up.run_time() - (time.monotonic() - attached_at)
+        self.warm_up_savings[name] = saved_time
+        logging.info("Attached to %s warm-up, saved %.3fs", name, saved_time)
+        return result
 
-        return trophy_titles
+    async def _warm_up(self):
+        """Fetches data Galaxy asks for right after authentication"""
+        await self._authenticated.wait()
+        prewarm = asyncio.ensure_future(self._http_client.prewarm(WARM_UP_CONNECTIONS))
+        owned_games = self._start_warm_up(OWNED_GAMES_WARM_UP, self._get_owned_games())
+        trophy_titles = self._start_warm_up(
+            TROPHY_TITLES_WARM_UP,
+            self._trophy_titles_cache.get("trophy_titles", self._psn_client.get_trophy_titles)
+        )
+        await asyncio.gather(prewarm, owned_games, trophy_titles)
 
     def _process_trophies_cache(
         self,
@@ -190,7 +497,7 @@ class PSNPlugin(Plugin):
 
         return pending_cid_tids, pending_tid_cids, tid_trophies
 
-    def _get_game_trophies_from_cache(self, game_comm_ids, trophy_titles):
+    def _get_game_trophies_from_cache(self, game_comm_ids, trophy_titles, record: bool = True):
         """Process all communication ids for the game"""
         game_trophies: List[Achievement] = []
         pending_comm_ids: Set[CommunicationId] = set()
@@ -201,10 +508,16 @@ class PSNPlugin(Plugin):
             trophies = self._trophies_cache.get(comm_id, last_update_time)
             if trophies is None:
                 pending_comm_ids.add(comm_id)
+                # an entry older than the trophy title's last update is stale
+                if record:
+                    self.cache_stats[TROPHIES_CACHE_KEY].record("stale" if comm_id in self._trophies_cache else "misses")
             else:
                 game_trophies.extend(trophies)
+                if record:
+                    self.cache_stats[TROPHIES_CACHE_KEY].record("hits")
         return game_trophies, pending_comm_ids
 
+    @traced("plugin")
     async def _import_trophies(
         self,
         comm_id: CommunicationId,
@@ -219,6 +532,10 @@ class PSNPlugin(Plugin):
 
         try:
             trophies: List[Achievement] = await self._psn_client.async_get_earned_trophies(comm_id)
+            trophies_stats = self.cache_stats[TROPHIES_CACHE_KEY]
+            trophies_stats.record("imports")
+            if comm_id in self._trophies_cache:
+                trophies_stats.record("evictions")
             self._trophies_cache.update(comm_id, trophies, timestamp)
             while pending_tids:
                 tid = pending_tids.pop()
@@ -235,22 +552,56 @@ class PSNPlugin(Plugin):
             logging.exception("Unhandled exception. Please report it to the plugin developers")
             handle_error(UnknownError())
 
+    @traced("plugin")
+    @accounted
     async def prepare_user_presence_context(self, user_ids: List[str]) -> Any:
-        return await self._psn_client.async_get_friends_presences()
+        context = await self._psn_client.async_get_friends_presences()
+        self._memory_checkpoint("after_presence", presence_context=context)
+        return context
 
+    @traced("plugin")
     async def get_user_presence(self, user_id: str, context: Any) -> UserPresence:
         for user in context:
             if user_id in user:
                 return user[user_id]
         return UserPresence(PresenceState.Unknown)
 
+    @traced("plugin")
+    @accounted
     async def get_friends(self):
-        return await self._psn_client.async_get_friends()
+        return await self._friends_cache.get("friends", self._psn_client.async_get_friends)
 
+    def set_loop_monitoring(self, enabled: bool):
+        """Starts the event loop lag monitor, or stops it and logs its report"""
+        if enabled:
+            self.loop_monitor.start()
+        elif self.loop_monitor.running:
+            self.loop_monitor.stop()
+            self.loop_monitor.log()
+
+    @traced("plugin")
     async def shutdown(self):
+        pending = list(self._background_tasks) + [warm_up.future for warm_up in self._warm_ups.values()]
+        for task in pending:
+            task.cancel()
+        self._trophy_titles_cache.cancel()
+        self._friends_cache.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self.set_loop_monitoring(False)
+        self.request_accounting.log()
+        self._memory_checkpoint("shutdown")
+        self.memory_profiler.stop()
+        self._log_cache_stats("Session", {name: dict(stats.session) for name, stats in self.cache_stats.items()})
+        self._psn_client.close()
         await self._http_client.logout()
+        if self._trace_file:
+            tracer.export(self._trace_file)
 
+    @traced("plugin")
     def handshake_complete(self):
+        if os.environ.get(LOOP_MONITOR_ENV):
+            self.set_loop_monitoring(True)
+        self.memory_profiler.start()
         trophies_cache = self.persistent_cache.get(TROPHIES_CACHE_KEY)
         if trophies_cache is not None:
             try:
@@ -258,12 +609,17 @@ class PSNPlugin(Plugin):
             except (pickle.UnpicklingError, binascii.Error):
                 logging.exception("Can not deserialize trophies cache")
 
-        comm_ids_cache = self.persistent_cache.get(COMMUNICATION_IDS_CACHE_KEY)
-        if comm_ids_cache:
-            try:
-                self.persistent_cache[COMMUNICATION_IDS_CACHE_KEY] = json.loads(comm_ids_cache)
-            except json.JSONDecodeError:
-                logging.exception("Can not deserialize communication ids cache")
+        for key in (COMMUNICATION_IDS_CACHE_KEY, COMMUNICATION_IDS_TIMESTAMPS_CACHE_KEY):
+            cache = self.persistent_cache.get(key)
+            if cache:
+                try:
+                    self.persistent_cache[key] = json.loads(cache)
+                except json.JSONDecodeError:
+                    logging.exception("Can not deserialize %s cache", key)
+        self._stamp_legacy_comm_ids()
+        self._comm_ids_size = None
+
+        self._run_in_background(asyncio.ensure_future(self._warm_up()))
 
 
 def main():
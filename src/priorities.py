@@ -0,0 +1,94 @@
+import asyncio
+import heapq
+import itertools
+from collections import defaultdict
+from contextvars import ContextVar
+from enum import Enum
+from functools import wraps
+from typing import Dict, List, Tuple
+
+
+class Priority(Enum):
+    Interactive = "interactive"
+    Sync = "sync"
+    Backfill = "backfill"
+
+
+# share of freed connection slots each class gets while all of them are waiting
+PRIORITY_WEIGHTS = {
+    Priority.Interactive: 8,
+    Priority.Sync: 4,
+    Priority.Backfill: 1,
+}
+DEFAULT_PRIORITY = Priority.Sync
+
+_current_priority: ContextVar = ContextVar("priority", default=DEFAULT_PRIORITY)
+
+
+def current_priority() -> Priority:
+    return _current_priority.get()
+
+
+def priority(priority_class: Priority):
+    """Declares the priority class of the requests sent by a coroutine, including tasks it spawns"""
+    def decorator(coroutine):
+        @wraps(coroutine)
+        async def wrapper(*args, **kwargs):
+            token = _current_priority.set(priority_class)
+            try:
+                return await coroutine(*args, **kwargs)
+            finally:
+                _current_priority.reset(token)
+        return wrapper
+    return decorator
+
+
+class FairSemaphore:
+    """Semaphore handing freed slots to waiters by weighted fair queuing of their priority classes"""
+
+    def __init__(self, capacity: int, weights: Dict[Priority, float] = None):
+        self._capacity = capacity
+        self._weights = PRIORITY_WEIGHTS if weights is None else weights
+        self._in_use = 0
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._virtual_time = 0.0
+        self._last_tags: Dict[Priority, float] = defaultdict(float)
+
+    def locked(self) -> bool:
+        return self._in_use >= self._capacity
+
+    async def acquire(self, priority_class: Priority = None):
+        if priority_class is None:
+            priority_class = current_priority()
+        if not self.locked() and not self._waiters:
+            self._in_use += 1
+            return
+        # a class is served in proportion to its weight: its waiters get tags spaced by 1 / weight
+        tag = max(self._virtual_time, self._last_tags[priority_class]) + 1 / self._weights[priority_class]
+        self._last_tags[priority_class] = tag
+        waiter = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (tag, next(self._counter), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just before the cancellation
+                self.release()
+            raise
+
+    def release(self):
+        self._in_use -= 1
+        while self._waiters and not self.locked():
+            tag, _, waiter = heapq.heappop(self._waiters)
+            if waiter.cancelled():
+                continue
+            self._virtual_time = tag
+            self._in_use += 1
+            waiter.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc):
+        self.release()
@@ -1,59 +1,110 @@
 import asyncio
 import logging
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from functools import partial
-from typing import Dict, List, NewType, Tuple
+from functools import lru_cache, partial
+from typing import Dict, Iterable, List, NewType, Tuple
 
 from galaxy.api.errors import UnknownBackendResponse
 from galaxy.api.types import Achievement, Game, LicenseInfo, UserInfo, UserPresence, PresenceState, SubscriptionGame
 from galaxy.api.consts import LicenseType
+from endpoints import register_endpoint
+from priorities import Priority, priority
+from tracing import traced, tracer
 from http_client import paginate_url
+from log_events import Truncated, event_log
 from psn_store import PSNFreePlusStore, AccountUserInfo
 
+# Fields consumed by the parser of each PSNClient method; URLs request nothing more.
+# "fromUser" blocks of trophy resources are returned only as a part of @default.
+FIELDS = {
+    "async_get_own_user_info": ("accountId", "onlineId"),
+    "get_psplus_status": ("plus",),
+    "async_get_owned_games": ("titleId", "name"),
+    "async_get_game_communication_id_map": ("@default",),
+    "get_trophy_titles": ("@default",),
+    "async_get_earned_trophies": ("@default",),
+    "async_get_friends": ("accountId", "onlineId", "avatarUrls"),
+    "async_get_friends_presences": ("accountId", "primaryOnlineStatus", "presences(@titleInfo)"),
+}
+
+
+def fields(method: str) -> str:
+    return ",".join(FIELDS[method])
+
+
 # game_id_list is limited to 5 IDs per request
 GAME_DETAILS_URL = "https://pl-tpy.np.community.playstation.net/trophy/v1/apps/trophyTitles" \
     "?npTitleIds={game_id_list}" \
-    "&fields=@default" \
+    "&fields=" + fields("async_get_game_communication_id_map") + \
     "&npLanguage=en"
 
 GAME_LIST_URL = "https://gamelist.api.playstation.com/v1/users/{user_id}/titles" \
     "?type=owned,played" \
     "&app=richProfile" \
     "&sort=-lastPlayedDate" \
-    "&iw=240"\
-    "&ih=240"\
-    "&fields=@default"
+    "&fields=" + fields("async_get_owned_games")
 
 TROPHY_TITLES_URL = "https://pl-tpy.np.community.playstation.net/trophy/v1/trophyTitles" \
-    "?fields=@default" \
+    "?fields=" + fields("get_trophy_titles") + \
     "&platform=PS4" \
     "&npLanguage=en"
 
 EARNED_TROPHIES_PAGE = "https://pl-tpy.np.community.playstation.net/trophy/v1/" \
-    "trophyTitles/{communication_id}/trophyGroups/{trophy_group_id}/trophies?" \
-    "fields=@default,trophyRare,trophyEarnedRate,trophySmallIconUrl,groupId" \
+    "trophyTitles/{communication_id}/trophyGroups/{trophy_group_id}/trophies" \
+    "?fields=" + fields("async_get_earned_trophies") + \
     "&visibleType=1" \
     "&npLanguage=en"
 
 USER_INFO_URL = "https://pl-prof.np.community.playstation.net/userProfile/v1/users/{user_id}/profile2" \
-    "?fields=accountId,onlineId"
+    "?fields=" + fields("async_get_own_user_info")
 
 USER_INFO_PSPLUS_URL = "https://pl-prof.np.community.playstation.net/userProfile/v1/users/{user_id}/profile2" \
-    "?fields=plus"
+    "?fields=" + fields("get_psplus_status")
 
 DEFAULT_AVATAR_SIZE = "l"
 FRIENDS_URL = "https://us-prof.np.community.playstation.net/userProfile/v1/users/{user_id}/friends/profiles2" \
-    "?fields=accountId,onlineId,avatarUrls&avatarSizes={avatar_size_list}"
+    "?fields=" + fields("async_get_friends") + \
+    "&avatarSizes={avatar_size_list}"
 
 FRIENDS_WITH_PRESENCE_URL = "https://us-prof.np.community.playstation.net/userProfile/v1/users/{user_id}/friends/profiles2" \
-    "?fields=accountId,onlineId,primaryOnlineStatus,presences(@titleInfo,lastOnlineDate)"
+    "?fields=" + fields("async_get_friends_presences")
 
 ACCOUNTS_URL = "https://accounts.api.playstation.com/api/v1/accounts/{user_id}"
 
+for _name, _url in (
+    ("GAME_DETAILS_URL", GAME_DETAILS_URL),
+    ("GAME_LIST_URL", GAME_LIST_URL),
+    ("TROPHY_TITLES_URL", TROPHY_TITLES_URL),
+    ("EARNED_TROPHIES_PAGE", EARNED_TROPHIES_PAGE),
+    ("USER_INFO_URL", USER_INFO_URL),
+    ("USER_INFO_PSPLUS_URL", USER_INFO_PSPLUS_URL),
+    ("FRIENDS_URL", FRIENDS_URL),
+    ("FRIENDS_WITH_PRESENCE_URL", FRIENDS_WITH_PRESENCE_URL),
+    ("ACCOUNTS_URL", ACCOUNTS_URL),
+):
+    register_endpoint(_name, _url)
+
+# idempotent GETs fanned out in big numbers; a slow one holds up the whole gather
+HEDGED_ENDPOINTS = {"GAME_DETAILS_URL", "GAME_LIST_URL", "TROPHY_TITLES_URL", "EARNED_TROPHIES_PAGE"}
+
+# timeouts.TIMEOUT_POLICIES class of each endpoint, lists and trophy pages use the default "page" class
+TIMEOUT_CLASSES = {
+    "USER_INFO_URL": "small",
+    "USER_INFO_PSPLUS_URL": "small",
+    "ACCOUNTS_URL": "small",
+    **PSNFreePlusStore.TIMEOUT_CLASSES,
+}
+
 DEFAULT_LIMIT = 100
 MAX_TITLE_IDS_PER_REQUEST = 5
 
+# responses carrying more records than that are parsed in the worker pool instead of the event loop
+PARSE_OFFLOAD_THRESHOLD = 500
+PARSE_WORKERS = 2
+
 PLAYSTATION_PLUS = 'PlayStation PLUS'
 PLAYSTATION_NOW = 'PlayStation Now'
 
@@ -63,25 +114,113 @@ UnixTimestamp = NewType("UnixTimestamp", int)
 TrophyTitles = Dict[CommunicationId, UnixTimestamp]
 
 
-def parse_timestamp(earned_date) -> UnixTimestamp:
-    dt = datetime.strptime(earned_date, "%Y-%m-%dT%H:%M:%SZ")
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+TIMESTAMP_MEMO_SIZE = 4096
+
+
+def _parse_timestamp_slow(earned_date) -> UnixTimestamp:
+    dt = datetime.strptime(earned_date, TIMESTAMP_FORMAT)
     dt = datetime.combine(dt.date(), dt.time(), timezone.utc)
     return UnixTimestamp(int(dt.timestamp()))
 
 
+@lru_cache(maxsize=TIMESTAMP_MEMO_SIZE)
+def parse_timestamp(earned_date) -> UnixTimestamp:
+    # fast path for the only shape PSN sends: YYYY-MM-DDTHH:MM:SSZ
+    if (
+        len(earned_date) == 20
+        and earned_date[4] == "-" and earned_date[7] == "-" and earned_date[10] == "T"
+        and earned_date[13] == ":" and earned_date[16] == ":" and earned_date[19] == "Z"
+        and earned_date[0:4].isdigit() and earned_date[5:7].isdigit() and earned_date[8:10].isdigit()
+        and earned_date[11:13].isdigit() and earned_date[14:16].isdigit() and earned_date[17:19].isdigit()
+    ):
+        dt = datetime(
+            int(earned_date[0:4]), int(earned_date[5:7]), int(earned_date[8:10]),
+            int(earned_date[11:13]), int(earned_date[14:16]), int(earned_date[17:19]),
+            tzinfo=timezone.utc
+        )
+        return UnixTimestamp(int(dt.timestamp()))
+    return _parse_timestamp_slow(earned_date)
+
+
+def parse_timestamps(dates: Iterable[str]) -> List[UnixTimestamp]:
+    """Parses a whole page of timestamps; repeated values are served by parse_timestamp's cache"""
+    return [parse_timestamp(date) for date in dates]
+
+
 def date_today():
     return datetime.today()
 
 
+def payload_size(response) -> int:
+    """Cheap estimation of the response size: number of records in its top level lists;
+    endpoints nesting their records deeper pass their own size function to fetch_data
+    """
+    if not isinstance(response, dict):
+        return 0
+    return sum(len(value) for value in response.values() if isinstance(value, list))
+
+
+def psnow_catalog_size(response) -> int:
+    """PS Now games are grouped in categories: {"categories": [{"games": [...]}, ...]}"""
+    if not isinstance(response, dict):
+        return 0
+    return sum(len(category.get("games", ())) for category in response.get("categories", ()))
+
+
+def create_offload_executor() -> ThreadPoolExecutor:
+    """Bounded pool for the work taken off the event loop: JSON decoding and parsing of big payloads"""
+    return ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="psn-offload")
+
+
 class PSNClient:
-    def __init__(self, http_client):
+    def __init__(self, http_client, parse_offload_threshold=PARSE_OFFLOAD_THRESHOLD, executor=None):
         self._http_client = http_client
-
-    @staticmethod
-    async def _async(method, *args, **kwargs):
+        self._parse_offload_threshold = parse_offload_threshold
+        # shared with the JSON decoding of the http client by the plugin, which hands it to both
+        self._parse_executor = executor or create_offload_executor()
+        self.parse_blocking_time = 0.0
+
+    @property
+    def loop_blocking_time(self) -> float:
+        """Time the event loop spent decoding and parsing responses"""
+        return self.parse_blocking_time + self._http_client.json_blocking_time
+
+    def _async(self, method, *args, **kwargs) -> asyncio.Future:
+        """Schedules method in the offload executor, returns at once with its future"""
         loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, partial(method, *args, **kwargs))
+        return loop.run_in_executor(self._parse_executor, partial(method, *args, **kwargs))
+
+    def close(self):
+        self._parse_executor.shutdown(wait=False)
+
+    async def _parse(self, parser, responses, size):
+        """Runs parser over all responses, off the event loop if the payload is big enough"""
+        def parse_all():
+            return [parser(response) for response in responses]
 
+        offload = self._parse_offload_threshold is not None and size > self._parse_offload_threshold
+        start = time.perf_counter()
+        scheduled = None
+        try:
+            with tracer.span(getattr(parser, "__qualname__", "parse"), "parse", size=size, offloaded=offload):
+                if offload:
+                    job = self._async(parse_all)
+                    scheduled = time.perf_counter()
+                    return await job
+                return parse_all()
+        except Exception:
+            logging.exception("Cannot parse data")
+            raise UnknownBackendResponse()
+        finally:
+            # when offloaded, the loop is blocked only for scheduling the job
+            blocking_time = (scheduled or time.perf_counter()) - start
+            self.parse_blocking_time += blocking_time
+            event_log.debug(
+                "parse", getattr(parser, "__name__", parser), size=size, offloaded=offload, blocking=round(blocking_time, 4)
+            )
+
+    @traced("psn_client")
     async def fetch_paginated_data(
         self,
         parser,
@@ -105,24 +244,20 @@ class PSNClient:
             for offset in range(limit, total, limit)
         ])
 
-        try:
-            return [rec for res in responses for rec in parser(res)]
-        except Exception:
-            logging.exception("Cannot parse data")
-            raise UnknownBackendResponse()
+        parsed = await self._parse(parser, responses, sum(payload_size(res) for res in responses))
+        return [rec for records in parsed for rec in records]
 
-    async def fetch_data(self, parser, *args, **kwargs):
+    @traced("psn_client")
+    async def fetch_data(self, parser, *args, size=payload_size, **kwargs):
         response = await self._http_client.get(*args, **kwargs)
 
-        try:
-            return parser(response)
-        except Exception:
-            logging.exception("Cannot parse data")
-            raise UnknownBackendResponse()
+        return (await self._parse(parser, [response], size(response)))[0]
 
+    @traced("psn_client")
+    @priority(Priority.Interactive)
     async def async_get_own_user_info(self):
         def user_info_parser(response):
-            logging.debug(f'user profile data: {response}')
+            event_log.debug("parse.user_profile", profile=Truncated(response))
             return response["profile"]["accountId"], response["profile"]["onlineId"]
 
         return await self.fetch_data(
@@ -130,6 +265,8 @@ class PSNClient:
             USER_INFO_URL.format(user_id="me")
         )
 
+    @traced("psn_client")
+    @priority(Priority.Sync)
     async def get_psplus_status(self) -> bool:
         def user_subscription_parser(response):
             status = response["profile"]["plus"]
@@ -142,6 +279,8 @@ class PSNClient:
             USER_INFO_PSPLUS_URL.format(user_id="me")
         )
 
+    @traced("psn_client")
+    @priority(Priority.Sync)
     async def async_get_owned_games(self):
         def game_parser(title):
             return Game(
@@ -162,6 +301,8 @@ class PSNClient:
             "totalResults"
         )
 
+    @traced("psn_client")
+    @priority(Priority.Sync)
     async def async_get_game_communication_id_map(self, game_ids: List[TitleId]) \
             -> Dict[TitleId, List[CommunicationId]]:
         def communication_ids_parser(response):
@@ -191,14 +332,14 @@ class PSNClient:
             for game_id in game_ids
         }
 
+    @traced("psn_client")
+    @priority(Priority.Sync)
     async def get_trophy_titles(self) -> TrophyTitles:
-        def title_parser(title) -> Tuple[CommunicationId, UnixTimestamp]:
-            return (title["npCommunicationId"], parse_timestamp((title.get("fromUser") or {})["lastUpdateDate"]))
-
         def titles_parser(response) -> List[Tuple[CommunicationId, UnixTimestamp]]:
-            return [
-                title_parser(title) for title in response.get("trophyTitles", [])
-            ] if response else []
+            titles = response.get("trophyTitles", []) if response else []
+            comm_ids = [title["npCommunicationId"] for title in titles]
+            timestamps = parse_timestamps((title.get("fromUser") or {})["lastUpdateDate"] for title in titles)
+            return list(zip(comm_ids, timestamps))
 
         result = await self.fetch_paginated_data(
             parser=titles_parser,
@@ -207,24 +348,30 @@ class PSNClient:
         )
         return dict(result)
 
+    @traced("psn_client")
+    @priority(Priority.Backfill)
     async def async_get_earned_trophies(self, communication_id) -> List[Achievement]:
-        def trophy_parser(trophy) -> Achievement:
+        def trophy_parser(trophy, unlock_time) -> Achievement:
             return Achievement(
                 achievement_id="{}_{}".format(communication_id, trophy["trophyId"]),
                 achievement_name=str(trophy["trophyName"]),
-                unlock_time=parse_timestamp(trophy["fromUser"]["earnedDate"])
+                unlock_time=unlock_time
             )
 
         def trophies_parser(response) -> List[Achievement]:
-            return [
-                trophy_parser(trophy) for trophy in response.get("trophies", [])
+            earned = [
+                trophy for trophy in response.get("trophies", [])
                 if trophy.get("fromUser") and trophy["fromUser"].get("earned")
             ] if response else []
+            unlock_times = parse_timestamps(trophy["fromUser"]["earnedDate"] for trophy in earned)
+            return [trophy_parser(trophy, unlock_time) for trophy, unlock_time in zip(earned, unlock_times)]
 
         return await self.fetch_data(trophies_parser, EARNED_TROPHIES_PAGE.format(
             communication_id=communication_id,
             trophy_group_id="all"))
 
+    @traced("psn_client")
+    @priority(Priority.Sync)
     async def async_get_friends(self):
         def friend_info_parser(profile):
 
@@ -240,7 +387,6 @@ class PSNClient:
             )
 
         def friend_list_parser(response):
-            logging.info(response)
             return [
                 friend_info_parser(profile) for profile in response.get("profiles", [])
             ] if response else []
@@ -251,6 +397,8 @@ class PSNClient:
             "totalResults"
         )
 
+    @traced("psn_client")
+    @priority(Priority.Interactive)
     async def async_get_friends_presences(self):
         def friend_info_parser(profile):
 
@@ -283,6 +431,8 @@ class PSNClient:
             "totalResults"
         )
 
+    @traced("psn_client")
+    @priority(Priority.Sync)
     async def get_account_info(self) -> AccountUserInfo:
         def account_user_parser(data):
             td = date_today() - datetime.fromisoformat(data['dateOfBirth'])
@@ -291,6 +441,8 @@ class PSNClient:
 
         return await self.fetch_data(account_user_parser, ACCOUNTS_URL.format(user_id='me'), silent=True)
 
+    @traced("psn_client")
+    @priority(Priority.Backfill)
     async def get_psplus_games(self, account_info: AccountUserInfo) -> List[SubscriptionGame]:
         logging.debug("Getting PSPlus Games")
         def games_parser(data):
@@ -306,6 +458,8 @@ class PSNClient:
         store = PSNFreePlusStore(self._http_client, account_info)
         return await self.fetch_data(games_parser, store.games_container_url)
 
+    @traced("psn_client")
+    @priority(Priority.Backfill)
     async def get_psnow_games(self, account_info: AccountUserInfo) -> List[SubscriptionGame]:
         logging.debug("Getting PSNow Games")
         category_pattern = re.compile("^[A-Za-z0-9](?: - [A-Za-z0-9])?$")
@@ -321,4 +475,4 @@ class PSNClient:
             ]
 
         store = PSNFreePlusStore(self._http_client, account_info)
-        return await self.fetch_data(games_parser, store.psnow_games_url)
\ No newline at end of file
+        return await self.fetch_data(games_parser, store.psnow_games_url, size=psnow_catalog_size)
\ No newline at end of file
@@ -1,5 +1,7 @@
 from dataclasses import dataclass
 
+from endpoints import register_endpoint
+
 
 @dataclass
 class AccountUserInfo:
@@ -25,6 +27,19 @@ class PSNFreePlusStore:
         'SCEK': 'STORE-MSF86012-PLUS_FTT_KR'
     }
 
+    ENDPOINTS = {
+        "PSPLUS_GAMES_CONTAINER_URL": GAMES_CONTAINTER_URL,
+        "PSNOW_GAMES_URL": PSPLUS_URL,
+        "STORE_SESSION_URL": SESSION,
+        "STORE_SUBSCRIPTION_DETAILS_URL": SUBSCRIPTION_DETAILS,
+    }
+    TIMEOUT_CLASSES = {
+        "PSPLUS_GAMES_CONTAINER_URL": "large",
+        "PSNOW_GAMES_URL": "large",
+        "STORE_SESSION_URL": "small",
+        "STORE_SUBSCRIPTION_DETAILS_URL": "small",
+    }
+
     def __init__(self, http_client, user: AccountUserInfo):
         self._http_client = http_client
         self.id = self.PSPLUS_FREEGAMES_REGION_STORE[user.region]
@@ -54,3 +69,7 @@ class PSNFreePlusStore:
         body = 'code='  # + code
         res = await self._http_client.post(self.SESSION, data=body)
         return await res.json()
+
+
+for _name, _url in PSNFreePlusStore.ENDPOINTS.items():
+    register_endpoint(_name, _url)
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+# PSN hosts grouped by the API family they are throttled as
+API_FAMILIES = {
+    "pl-tpy.np.community.playstation.net": "trophy",
+    "gamelist.api.playstation.com": "gamelist",
+    "pl-prof.np.community.playstation.net": "profile",
+    "us-prof.np.community.playstation.net": "profile",
+    "accounts.api.playstation.com": "profile",
+    "store.playstation.com": "store",
+}
+# requests per second and burst size of each family
+RATE_LIMITS = {
+    "trophy": (10, 20),
+    "gamelist": (5, 5),
+    "profile": (5, 10),
+    "store": (2, 4),
+}
+# on 429 the rate is halved, then every successful request gives back a twentieth of the configured rate
+THROTTLED_RATE_FACTOR = 0.5
+RATE_RECOVERY_STEPS = 20
+MIN_RATE = 0.2
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self._configured_rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """Takes a token, returns the time waited for it"""
+        start = self._clock()
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return self._clock() - start
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def available(self) -> bool:
+        """Whether a token can be taken without waiting"""
+        self._refill()
+        return self._tokens >= 1
+
+    def throttled(self):
+        self.rate = max(MIN_RATE, self.rate * THROTTLED_RATE_FACTOR)
+        self._refill()
+        self._tokens = 0
+
+    def succeeded(self):
+        if self.rate < self._configured_rate:
+            self.rate = min(self._configured_rate, self.rate + self._configured_rate / RATE_RECOVERY_STEPS)
+
+
+class RateLimiters:
+    """One token bucket per PSN API family; hosts of no family are not limited"""
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]] = None, families: Dict[str, str] = None):
+        limits = RATE_LIMITS if limits is None else limits
+        self._families = API_FAMILIES if families is None else families
+        self._buckets = {family: TokenBucket(rate, burst) for family, (rate, burst) in limits.items()}
+        self.sync_wait_times: Counter = Counter()
+        self.session_wait_times: Counter = Counter()
+        self.throttled: Counter = Counter()
+
+    def family(self, url: str) -> Optional[str]:
+        family = self._families.get(urlsplit(url).hostname)
+        return family if family in self._buckets else None
+
+    async def acquire(self, family: str) -> float:
+        """Takes a token of the family, returns the time waited for it"""
+        waited = await self._buckets[family].acquire()
+        if waited:
+            self.sync_wait_times[family] += waited
+            self.session_wait_times[family] += waited
+        return waited
+
+    def available(self, family: str) -> bool:
+        return self._buckets[family].available()
+
+    def throttle(self, family: str):
+        self._buckets[family].throttled()
+        self.throttled[family] += 1
+        logging.warning("Throttled by %s API, rate lowered to %.2f/s", family, self._buckets[family].rate)
+
+    def succeeded(self, family: str):
+        self._buckets[family].succeeded()
+
+    def take_sync_report(self) -> Dict[str, float]:
+        """Time spent waiting on each limiter since the previous report"""
+        report = dict(self.sync_wait_times)
+        self.sync_wait_times.clear()
+        return report
@@ -0,0 +1,88 @@
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import aiohttp
+
+from latency import LatencyTracker
+
+TIMEOUT_PERCENTILE = 99
+TIMEOUT_MULTIPLIER = 3
+
+
+@dataclass
+class TimeoutPolicy:
+    """Deadlines of an endpoint class; first byte and total deadlines adapt between their min and max"""
+    connect: float
+    first_byte_min: float
+    first_byte_max: float
+    total_min: float
+    total_max: float
+
+
+TIMEOUT_POLICIES = {
+    # single profile lookups and auth
+    "small": TimeoutPolicy(connect=5, first_byte_min=3, first_byte_max=10, total_min=5, total_max=15),
+    # paginated lists and trophies
+    "page": TimeoutPolicy(connect=10, first_byte_min=5, first_byte_max=30, total_min=10, total_max=60),
+    # multi-megabyte store catalogs
+    "large": TimeoutPolicy(connect=10, first_byte_min=15, first_byte_max=60, total_min=30, total_max=180),
+}
+DEFAULT_TIMEOUT_CLASS = "page"
+
+
+def _clamp(value: Optional[float], low: float, high: float) -> float:
+    if value is None:
+        return high
+    return max(low, min(high, value))
+
+
+@dataclass
+class Deadlines:
+    connect: float
+    first_byte: float
+    total: float
+
+    def client_timeout(self) -> aiohttp.ClientTimeout:
+        # first byte deadline is enforced by the caller; sock_read would be an idle timeout of every body read
+        return aiohttp.ClientTimeout(total=self.total, connect=self.connect)
+
+
+def timeout_phase(error: Optional[BaseException], phase: str) -> str:
+    """Deadline which expired during the given phase of a request ("first_byte" or "total");
+    with sock_read unused, aiohttp raises ServerTimeoutError only when the connect deadline expires
+    """
+    if isinstance(error, aiohttp.ServerTimeoutError):
+        return "connect"
+    return phase
+
+
+class AdaptiveTimeouts:
+    """Per-endpoint deadlines derived from rolling latency percentiles of the endpoint"""
+
+    def __init__(self, first_byte_latency: LatencyTracker, total_latency: LatencyTracker):
+        self._first_byte_latency = first_byte_latency
+        self._total_latency = total_latency
+        self._classes: Dict[str, str] = {}
+        self.events: Counter = Counter()
+
+    def set_classes(self, classes: Dict[str, str]):
+        self._classes.update(classes)
+
+    def policy(self, endpoint: str) -> TimeoutPolicy:
+        return TIMEOUT_POLICIES[self._classes.get(endpoint, DEFAULT_TIMEOUT_CLASS)]
+
+    def deadlines(self, endpoint: str) -> Deadlines:
+        policy = self.policy(endpoint)
+        first_byte = self._first_byte_latency.percentile(endpoint, TIMEOUT_PERCENTILE)
+        total = self._total_latency.percentile(endpoint, TIMEOUT_PERCENTILE)
+        return Deadlines(
+            connect=policy.connect,
+            first_byte=_clamp(first_byte and first_byte * TIMEOUT_MULTIPLIER, policy.first_byte_min, policy.first_byte_max),
+            total=_clamp(total and total * TIMEOUT_MULTIPLIER, policy.total_min, policy.total_max)
+        )
+
+    def record_timeout(self, endpoint: str, phase: str):
+        self.events[(endpoint, phase)] += 1
+        logging.warning("Request to %s timed out (%s deadline)", endpoint, phase)
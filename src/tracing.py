@@ -0,0 +1,129 @@
+import asyncio
+import inspect
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional
+
+# path the plugin writes its trace to on shutdown; tracing is off when not set
+TRACE_FILE_ENV = "PSN_PLUGIN_TRACE_FILE"
+
+_current_span: ContextVar = ContextVar("span", default=None)
+
+
+def current_span() -> Optional[str]:
+    return _current_span.get()
+
+
+class Tracer:
+    """Records spans as Chrome trace events (chrome://tracing, Perfetto) while enabled;
+    each asyncio task gets its own track, so spans of concurrent tasks do not interleave
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._events: List[Dict] = []
+        self._tracks: Dict[int, int] = {}
+        # innermost open span of each task, for readers outside the task's context (loop_monitor)
+        self._task_spans: Dict[int, str] = {}
+        self._origin = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._events.clear()
+        self._tracks.clear()
+
+    @staticmethod
+    def _task_key() -> int:
+        try:
+            return id(asyncio.current_task())
+        except RuntimeError:
+            return id(None)
+
+    def _track(self) -> int:
+        return self._tracks.setdefault(self._task_key(), len(self._tracks) + 1)
+
+    def task_span(self, task: Optional[asyncio.Task]) -> Optional[str]:
+        return self._task_spans.get(id(task))
+
+    def _timestamp(self, perf_counter: float) -> float:
+        return (perf_counter - self._origin) * 1e6
+
+    @contextmanager
+    def span(self, name: str, category: str, **args):
+        if not self.enabled:
+            yield
+            return
+        parent = _current_span.get()
+        token = _current_span.set(name)
+        task_key = self._task_key()
+        outer = self._task_spans.get(task_key)
+        self._task_spans[task_key] = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            _current_span.reset(token)
+            if outer is None:
+                self._task_spans.pop(task_key, None)
+            else:
+                self._task_spans[task_key] = outer
+            if parent is not None:
+                args["parent"] = parent
+            self._events.append({
+                "name": name, "cat": category, "ph": "X", "pid": 1, "tid": self._track(),
+                "ts": self._timestamp(start), "dur": (end - start) * 1e6, "args": args
+            })
+
+    def trace_events(self) -> Dict:
+        return {"traceEvents": list(self._events), "displayTimeUnit": "ms"}
+
+    def export(self, path: str):
+        with open(path, "w") as trace_file:
+            json.dump(self.trace_events(), trace_file)
+
+
+tracer = Tracer()
+
+
+def traced(category: str):
+    """Wraps every call of a function or coroutine function in a span named after it;
+    for an async generator function every step up to the next yielded item gets its own span,
+    so the consumer's work between items is not attributed to the generator
+    """
+    def decorator(function):
+        name = function.__qualname__
+        if inspect.isasyncgenfunction(function):
+            @wraps(function)
+            async def wrapper(*args, **kwargs):
+                generator = function(*args, **kwargs)
+                try:
+                    while True:
+                        with tracer.span(name, category):
+                            try:
+                                item = await generator.__anext__()
+                            except StopAsyncIteration:
+                                return
+                        yield item
+                finally:
+                    await generator.aclose()
+        elif asyncio.iscoroutinefunction(function):
+            @wraps(function)
+            async def wrapper(*args, **kwargs):
+                with tracer.span(name, category):
+                    return await function(*args, **kwargs)
+        else:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with tracer.span(name, category):
+                    return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -5,6 +5,24 @@ from http_client import AuthenticatedHttpClient
 from tests.async_mock import AsyncMock
 
 
+class Clock:
+    """Fake monotonic clock; sleep advances it instead of waiting"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.now += delay
+
+
+@pytest.fixture()
+def clock():
+    return Clock()
+
+
 @pytest.fixture()
 def access_token():
     return "access_token"
@@ -61,6 +79,12 @@ def http_get(mocker):
     )
 
 
+@pytest.fixture(autouse=True)
+def mock_warm_up(mocker):
+    """Keeps the background warm-up started by handshake_complete from reaching the network"""
+    return mocker.patch("plugin.PSNPlugin._warm_up", new_callable=AsyncMock)
+
+
 @pytest.fixture()
 async def psn_plugin():
     plugin = PSNPlugin(MagicMock(), MagicMock(), None)
@@ -1,6 +1,7 @@
 import asyncio
 import pytest
-from galaxy.api.errors import AuthenticationRequired, UnknownBackendResponse
+from galaxy.api.errors import AuthenticationRequired, BackendTimeout, UnknownBackendResponse
+from plugin import TROPHIES_CACHE_KEY
 from psn_client import EARNED_TROPHIES_PAGE
 from tests.async_mock import AsyncMock
 from unittest.mock import MagicMock
@@ -230,3 +231,119 @@ async def test_get_trophy_titles_bad_format(
         await authenticated_psn_client.get_trophy_titles()
 
     http_get.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_prepare_achievements_context_imports_recent_titles_first(
+    authenticated_plugin,
+    mock_get_game_communication_ids,
+    mock_get_trophy_titles,
+    mock_async_get_earned_trophies,
+    mocker
+):
+    mocker.patch("plugin.TROPHY_IMPORT_WORKERS", 1)
+    trophy_titles = {"NPWR12784_00": 1, "NPWR10584_00": 3, "NPWR11243_00": 2}
+    mock_get_trophy_titles.return_value = trophy_titles
+    mock_async_get_earned_trophies.return_value = []
+
+    assert trophy_titles == await authenticated_plugin.prepare_achievements_context(
+        ["CUSA07917_00", "CUSA02000_00", "CUSA05603_00"]
+    )
+
+    assert [call[0][0] for call in mock_async_get_earned_trophies.call_args_list] == [
+        "NPWR10584_00", "NPWR11243_00", "NPWR12784_00"
+    ]
+    assert [record.key for record in authenticated_plugin.trophies_import.completed] == [
+        "NPWR10584_00", "NPWR11243_00", "NPWR12784_00"
+    ]
+    assert authenticated_plugin.trophies_import.report()["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_trophies_cache_stats(
+    authenticated_plugin,
+    mock_get_game_communication_ids,
+    mock_get_trophy_titles,
+    mock_async_get_earned_trophies
+):
+    trophy_titles = {"NPWR12784_00": 2, "NPWR10584_00": 3, "NPWR11243_00": 2}
+    mock_get_trophy_titles.return_value = trophy_titles
+    mock_async_get_earned_trophies.return_value = []
+    authenticated_plugin._trophies_cache.update("NPWR12784_00", [], 1)
+    authenticated_plugin._trophies_cache.update("NPWR11243_00", [], 2)
+
+    await authenticated_plugin.prepare_achievements_context(["CUSA07917_00", "CUSA02000_00", "CUSA05603_00"])
+    await asyncio.gather(*authenticated_plugin._background_tasks)
+
+    stats = authenticated_plugin.cache_stats[TROPHIES_CACHE_KEY]
+    assert stats.session == {"hits": 1, "stale": 1, "misses": 1, "imports": 2, "evictions": 1}
+    assert stats.serialized_size == len(authenticated_plugin.persistent_cache[TROPHIES_CACHE_KEY])
+
+    # per game lookups of Galaxy are not counted again
+    await authenticated_plugin.get_unlocked_achievements("CUSA07917_00", trophy_titles)
+    assert stats.session == {"hits": 1, "stale": 1, "misses": 1, "imports": 2, "evictions": 1}
+
+
+@pytest.mark.asyncio
+async def test_prepare_achievements_context_deadline(
+    authenticated_plugin,
+    mock_get_game_communication_ids,
+    mock_get_trophy_titles,
+    mocker
+):
+    mocker.patch("plugin.ACHIEVEMENTS_CONTEXT_DEADLINE", 0.05)
+    mocker.patch("plugin.TROPHY_IMPORT_WORKERS", 1)
+    trophy_titles = {"NPWR12784_00": 2, "NPWR11556_00": 1}
+    mock_get_trophy_titles.return_value = trophy_titles
+    import_slow_title = asyncio.Event()
+
+    async def get_earned_trophies(_self, comm_id):
+        if comm_id == COMMUNICATION_ID:
+            await import_slow_title.wait()
+            return UNLOCKED_ACHIEVEMENTS
+        return []
+    mocker.patch("plugin.PSNClient.async_get_earned_trophies", new=get_earned_trophies)
+
+    assert trophy_titles == await authenticated_plugin.prepare_achievements_context(
+        ["CUSA07917_00", GAME_ID]
+    )
+    assert [] == authenticated_plugin._trophies_cache.get("NPWR12784_00", 2)
+    assert authenticated_plugin._trophies_cache.get(COMMUNICATION_ID, 1) is None
+    with pytest.raises(BackendTimeout):
+        await authenticated_plugin.get_unlocked_achievements(GAME_ID, trophy_titles)
+
+    import_slow_title.set()
+    await asyncio.gather(*authenticated_plugin._background_tasks)
+
+    assert TROPHIES_CACHE_KEY in authenticated_plugin.persistent_cache
+    assert UNLOCKED_ACHIEVEMENTS == await authenticated_plugin.get_unlocked_achievements(GAME_ID, trophy_titles)
+
+
+@pytest.mark.asyncio
+async def test_prepare_achievements_context_attaches_to_import_in_flight(
+    authenticated_plugin,
+    mock_get_game_communication_ids,
+    mock_get_trophy_titles,
+    mocker
+):
+    mocker.patch("plugin.ACHIEVEMENTS_CONTEXT_DEADLINE", 0.05)
+    trophy_titles = {"NPWR11556_00": 1}
+    mock_get_trophy_titles.return_value = trophy_titles
+    import_slow_title = asyncio.Event()
+    imported = []
+
+    async def get_earned_trophies(_self, comm_id):
+        imported.append(comm_id)
+        await import_slow_title.wait()
+        return UNLOCKED_ACHIEVEMENTS
+    mocker.patch("plugin.PSNClient.async_get_earned_trophies", new=get_earned_trophies)
+
+    await authenticated_plugin.prepare_achievements_context([GAME_ID])
+    second_call = asyncio.ensure_future(authenticated_plugin.prepare_achievements_context([GAME_ID]))
+    await asyncio.sleep(0.01)
+    import_slow_title.set()
+    assert trophy_titles == await second_call
+
+    assert imported == [COMMUNICATION_ID]
+    assert UNLOCKED_ACHIEVEMENTS == await authenticated_plugin.get_unlocked_achievements(GAME_ID, trophy_titles)
+    assert not authenticated_plugin._trophies_imports
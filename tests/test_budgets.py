@@ -0,0 +1,98 @@
+import asyncio
+import logging
+
+import pytest
+
+from budgets import Budget, RequestAccounting, count_request, current_operation
+from plugin import TROPHIES_CACHE_KEY
+from tests.async_mock import AsyncMock
+from tests.test_data import UNLOCKED_ACHIEVEMENTS
+
+
+def test_requests_outside_operation_are_not_counted():
+    accounting = RequestAccounting({"sync": Budget(soft=1)})
+    count_request()
+    assert current_operation() is None
+    assert accounting.summary() == {}
+
+
+def test_soft_budget_logged(caplog):
+    accounting = RequestAccounting({"sync": Budget(soft=2)})
+    caplog.set_level(logging.WARNING)
+    with accounting.operation("sync"):
+        for _ in range(3):
+            count_request()
+    with accounting.operation("sync"):
+        count_request()
+
+    assert ["sync reached its budget of 2 requests"] == [record.getMessage() for record in caplog.records]
+    assert accounting.summary()["sync"] == {
+        "calls": 2,
+        "requests": 4,
+        "max_requests": 3,
+        "background_requests": 0,
+        "over_soft_budget": 1,
+        "over_hard_budget": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_background_requests_counted_apart():
+    accounting = RequestAccounting({"sync": Budget(hard=2)})
+    proceed = asyncio.Event()
+
+    async def background():
+        await proceed.wait()
+        count_request()
+
+    with accounting.operation("sync") as operation:
+        count_request()
+        count_request()
+        assert operation.exhausted.is_set()
+        task = asyncio.ensure_future(background())
+    proceed.set()
+    await task
+
+    summary = accounting.summary()["sync"]
+    assert summary["requests"] == 2
+    assert summary["background_requests"] == 1
+    assert summary["over_hard_budget"] == 1
+
+
+@pytest.mark.asyncio
+async def test_achievements_context_returns_at_hard_budget(
+    authenticated_plugin,
+    mocker
+):
+    mocker.patch(
+        "plugin.PSNPlugin.get_game_communication_ids",
+        new_callable=AsyncMock,
+        return_value={"CUSA07917_00": ["NPWR12784_00"], "CUSA07320_00": ["NPWR11556_00"]}
+    )
+    trophy_titles = {"NPWR12784_00": 2, "NPWR11556_00": 1}
+    mocker.patch("plugin.PSNClient.get_trophy_titles", new_callable=AsyncMock, return_value=trophy_titles)
+    mocker.patch("plugin.TROPHY_IMPORT_WORKERS", 1)
+    authenticated_plugin.request_accounting = RequestAccounting({"prepare_achievements_context": Budget(hard=1)})
+    import_second_title = asyncio.Event()
+
+    async def get_earned_trophies(_self, comm_id):
+        if comm_id == "NPWR11556_00":
+            await import_second_title.wait()
+        count_request()
+        return UNLOCKED_ACHIEVEMENTS
+    mocker.patch("plugin.PSNClient.async_get_earned_trophies", new=get_earned_trophies)
+
+    assert trophy_titles == await authenticated_plugin.prepare_achievements_context(
+        ["CUSA07917_00", "CUSA07320_00"]
+    )
+    assert UNLOCKED_ACHIEVEMENTS == authenticated_plugin._trophies_cache.get("NPWR12784_00", 2)
+    assert authenticated_plugin._trophies_cache.get("NPWR11556_00", 1) is None
+
+    import_second_title.set()
+    await asyncio.gather(*authenticated_plugin._background_tasks)
+
+    assert TROPHIES_CACHE_KEY in authenticated_plugin.persistent_cache
+    summary = authenticated_plugin.request_accounting.summary()["prepare_achievements_context"]
+    assert summary["requests"] == 1
+    assert summary["background_requests"] == 1
+    assert summary["over_hard_budget"] == 1
@@ -0,0 +1,105 @@
+import asyncio
+import pytest
+from cache import CacheStats, Freshness, FreshnessPolicy, StaleWhileRevalidateCache
+from tests.async_mock import AsyncMock
+
+POLICY = FreshnessPolicy(max_age=10, max_stale=20)
+
+
+@pytest.fixture
+def cache(clock):
+    return StaleWhileRevalidateCache(POLICY, clock)
+
+
+@pytest.mark.parametrize("age, freshness", [
+    (0, Freshness.Fresh),
+    (10, Freshness.Fresh),
+    (11, Freshness.Stale),
+    (30, Freshness.Stale),
+    (31, Freshness.Expired)
+])
+def test_freshness_policy(age, freshness):
+    assert freshness == POLICY.freshness(age)
+
+
+@pytest.mark.asyncio
+async def test_fresh_value_served_from_cache(cache, clock):
+    fetch = AsyncMock(return_value="value")
+    assert "value" == await cache.get("key", fetch)
+    clock.now += 10
+    assert "value" == await cache.get("key", fetch)
+    fetch.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_stale_value_served_and_revalidated(cache, clock):
+    fetch = AsyncMock(return_value="value")
+    await cache.get("key", fetch)
+
+    clock.now += 20
+    fetch.return_value = "new value"
+    assert "value" == await cache.get("key", fetch)
+    assert Freshness.Stale == cache.freshness("key")
+
+    await asyncio.sleep(0)
+    assert Freshness.Fresh == cache.freshness("key")
+    assert "new value" == await cache.get("key", fetch)
+    assert 2 == fetch.call_count
+
+
+@pytest.mark.asyncio
+async def test_expired_value_fetched(cache, clock):
+    fetch = AsyncMock(return_value="value")
+    await cache.get("key", fetch)
+
+    clock.now += 31
+    fetch.return_value = "new value"
+    assert "new value" == await cache.get("key", fetch)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_fetches_deduplicated(cache):
+    fetched = asyncio.Event()
+
+    async def fetch():
+        await fetched.wait()
+        return "value"
+
+    gets = asyncio.gather(cache.get("key", fetch), cache.get("key", fetch))
+    await asyncio.sleep(0)
+    assert cache.refresh("key", fetch) is cache.refresh("key", fetch)
+    fetched.set()
+    assert ["value", "value"] == await gets
+
+
+@pytest.mark.asyncio
+async def test_fetch_error_not_cached(cache):
+    fetch = AsyncMock(side_effect=ValueError())
+    with pytest.raises(ValueError):
+        await cache.get("key", fetch)
+    assert Freshness.Expired == cache.freshness("key")
+
+
+@pytest.mark.asyncio
+async def test_expired_value_served_on_listed_error(clock):
+    cache = StaleWhileRevalidateCache(POLICY, clock, serve_expired_on=(ConnectionError,))
+    await cache.get("key", AsyncMock(return_value="value"))
+    clock.now += 100
+
+    assert "value" == await cache.get("key", AsyncMock(side_effect=ConnectionError()))
+    with pytest.raises(ValueError):
+        await cache.get("key", AsyncMock(side_effect=ValueError()))
+    with pytest.raises(ConnectionError):
+        await cache.get("other key", AsyncMock(side_effect=ConnectionError()))
+
+
+def test_cache_stats_per_sync_and_session():
+    stats = CacheStats()
+    stats.record("hits", 3)
+    stats.record("stale")
+    assert stats.take_sync_report() == {"hits": 3, "stale": 1}
+    stats.record("misses")
+    assert stats.take_sync_report() == {"misses": 1}
+    assert stats.session == {"hits": 3, "stale": 1, "misses": 1}
+    assert CacheStats.hit_ratio(stats.session) == 0.6
+    assert CacheStats.hit_ratio({"imports": 2}) is None
@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from unittest.mock import Mock
+from galaxy.api.errors import BackendNotAvailable, BackendTimeout, UnknownBackendResponse
+from circuit_breaker import Admission, CircuitBreaker, CircuitState
+from http_client import AuthenticatedHttpClient
+from tests.async_mock import AsyncMock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("psn.com", failure_threshold=3, reset_timeout=30, clock=clock)
+
+
+def test_opens_after_consecutive_failures(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.Closed
+    breaker.record_failure()
+    assert breaker.state == CircuitState.Open
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_half_open_single_probe(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == CircuitState.HalfOpen
+    assert Admission.Probe == breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_failure(Admission.Probe)
+    assert breaker.state == CircuitState.Open
+
+    clock.now += 30
+    assert Admission.Probe == breaker.allow()
+    breaker.record_success(Admission.Probe)
+    assert breaker.state == CircuitState.Closed
+    assert breaker.allow()
+    assert breaker.opened == 2
+
+
+def test_cancelled_probe_released(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert Admission.Probe == breaker.allow()
+    breaker.release(Admission.Probe)
+    assert Admission.Probe == breaker.allow()
+
+
+def test_cancelled_request_keeps_probe_single(breaker, clock):
+    admission = breaker.allow()
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert Admission.Probe == breaker.allow()
+    # a request admitted before the circuit opened is cancelled while the probe is in flight
+    breaker.release(admission)
+    assert not breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_http_client_fails_fast(mocker):
+    http_client = AuthenticatedHttpClient(Mock, Mock)
+    http_client._access_token = "token"
+    session_request = mocker.patch.object(
+        http_client._session, "request", new_callable=AsyncMock, side_effect=BackendTimeout()
+    )
+    for _ in range(5):
+        with pytest.raises(BackendTimeout):
+            await http_client.request("GET", url="https://down.com/a")
+    with pytest.raises(BackendNotAvailable):
+        await http_client.request("GET", url="https://down.com/a")
+    assert session_request.call_count == 5
+
+    # other hosts and responses telling the host is up are not affected
+    session_request.side_effect = UnknownBackendResponse()
+    with pytest.raises(UnknownBackendResponse):
+        await http_client.request("GET", url="https://up.com/a")
+    assert http_client.circuit_breakers("https://up.com/").state == CircuitState.Closed
+    await http_client.logout()
+
+
+@pytest.mark.asyncio
+async def test_body_read_timeout_counts_as_failure(mocker):
+    http_client = AuthenticatedHttpClient(Mock, Mock)
+    http_client._access_token = "token"
+    response = Mock(read=AsyncMock(side_effect=asyncio.TimeoutError()))
+    mocker.patch.object(http_client._session, "request", new_callable=AsyncMock, return_value=response)
+    for _ in range(5):
+        with pytest.raises(BackendTimeout):
+            await http_client.get("https://slow.com/a")
+    assert http_client.circuit_breakers("https://slow.com/").state == CircuitState.Open
+    await http_client.logout()
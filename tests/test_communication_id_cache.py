@@ -1,10 +1,12 @@
+import asyncio
 import itertools
 import json
+import time
 
 import pytest
 from galaxy.api.jsonrpc import InvalidParams
 
-from plugin import COMMUNICATION_IDS_CACHE_KEY
+from plugin import COMMUNICATION_IDS_CACHE_KEY, COMMUNICATION_IDS_TIMESTAMPS_CACHE_KEY, FRESHNESS_POLICIES
 from psn_client import GAME_DETAILS_URL
 from tests.async_mock import AsyncMock
 from tests.test_data import GAMES, TITLE_TO_COMMUNICATION_ID, TITLES, UNLOCKED_ACHIEVEMENTS, CONTEXT, TROPHIES_CACHE
@@ -43,6 +45,12 @@ def mock_client_get_earned_trophies(mocker):
 def mock_persistent_cache(authenticated_plugin, mocker):
     return mocker.patch.object(type(authenticated_plugin), "persistent_cache", new_callable=mocker.PropertyMock)
 
+def fresh_cache(mapping):
+    return {
+        COMMUNICATION_IDS_CACHE_KEY: mapping,
+        COMMUNICATION_IDS_TIMESTAMPS_CACHE_KEY: {title_id: time.time() for title_id in mapping}
+    }
+
 def comm_id_getter():
     for x in [
         dict(itertools.islice(TITLE_TO_COMMUNICATION_ID.items(), 5, 10)),
@@ -80,7 +88,7 @@ async def test_full_cache_on_games_retrieval(
     mock_get_game_communication_id_map,
     mock_persistent_cache
 ):
-    mock_persistent_cache.return_value = {COMMUNICATION_IDS_CACHE_KEY: TITLE_TO_COMMUNICATION_ID.copy()}
+    mock_persistent_cache.return_value = fresh_cache(TITLE_TO_COMMUNICATION_ID.copy())
     assert GAMES == await authenticated_plugin.get_owned_games()
     assert TITLE_TO_COMMUNICATION_ID == authenticated_plugin.persistent_cache[COMMUNICATION_IDS_CACHE_KEY]
     assert not mock_get_game_communication_id_map.called
@@ -91,12 +99,13 @@ async def test_cache_miss_on_games_retrieval(
     authenticated_plugin,
     mock_client_get_owned_games,
     mock_get_game_communication_id_map,
-    mock_persistent_cache
+    mock_persistent_cache,
+    mocker
 ):
     border = int(len(TITLE_TO_COMMUNICATION_ID) / 2)
-    mock_persistent_cache.return_value = {
-        COMMUNICATION_IDS_CACHE_KEY: dict(itertools.islice(TITLE_TO_COMMUNICATION_ID.items(), border))
-    }
+    mock_persistent_cache.return_value = fresh_cache(
+        dict(itertools.islice(TITLE_TO_COMMUNICATION_ID.items(), border))
+    )
     not_cached = dict(itertools.islice(TITLE_TO_COMMUNICATION_ID.items(), border, len(TITLE_TO_COMMUNICATION_ID)))
 
     mock_get_game_communication_id_map.return_value = {
@@ -113,6 +122,19 @@ async def test_cache_miss_on_games_retrieval(
             mock_calls_args += a
 
     assert set(not_cached) == set(mock_calls_args)
+    stats = authenticated_plugin.cache_stats[COMMUNICATION_IDS_CACHE_KEY]
+    assert stats.session == {"hits": border, "misses": len(not_cached), "imports": len(not_cached)}
+    # the sync report was taken at the end of the sync
+    assert stats.take_sync_report() == {}
+    assert stats.serialized_size == len(json.dumps(TITLE_TO_COMMUNICATION_ID))
+
+    # kept up to date without serializing the cache again
+    dumps = mocker.patch("plugin.json.dumps", side_effect=json.dumps)
+    mock_get_game_communication_id_map.return_value = {GAME_ID: ["NPWR99999_00", "NPWR99998_00"], "CUSA99999_00": []}
+    await authenticated_plugin.update_communication_id_cache([GAME_ID, "CUSA99999_00"])
+    authenticated_plugin._log_cache_stats("Test", {})
+    assert not any(isinstance(call[0][0], dict) for call in dumps.call_args_list)
+    assert stats.serialized_size == len(json.dumps(authenticated_plugin._comm_ids_cache))
 
 
 @pytest.mark.asyncio
@@ -164,7 +186,7 @@ async def test_cached_on_dlc_achievements_retrieval(
     dlc_id = "some_dlc_id"
     mapping = {dlc_id: []}
 
-    mock_persistent_cache.return_value = {COMMUNICATION_IDS_CACHE_KEY: mapping}
+    mock_persistent_cache.return_value = fresh_cache(mapping)
     with pytest.raises(InvalidParams):
         await authenticated_plugin.get_unlocked_achievements(dlc_id, CONTEXT)
 
@@ -184,7 +206,7 @@ async def test_cached_on_game_achievements_retrieval(
     mapping = {GAME_ID: comm_ids}
 
     authenticated_plugin._trophies_cache = TROPHIES_CACHE
-    mock_persistent_cache.return_value = {COMMUNICATION_IDS_CACHE_KEY: mapping.copy()}
+    mock_persistent_cache.return_value = fresh_cache(mapping.copy())
 
     assert UNLOCKED_ACHIEVEMENTS == await authenticated_plugin.get_unlocked_achievements(GAME_ID, CONTEXT)
 
@@ -195,9 +217,16 @@ async def test_cached_on_game_achievements_retrieval(
 
 @pytest.mark.asyncio
 async def test_cache_parsing(authenticated_plugin, mock_persistent_cache):
-    mock_persistent_cache.return_value = {COMMUNICATION_IDS_CACHE_KEY: json.dumps(TITLE_TO_COMMUNICATION_ID)}
+    timestamps = dict.fromkeys(TITLE_TO_COMMUNICATION_ID, 1000)
+    mock_persistent_cache.return_value = {
+        COMMUNICATION_IDS_CACHE_KEY: json.dumps(TITLE_TO_COMMUNICATION_ID),
+        COMMUNICATION_IDS_TIMESTAMPS_CACHE_KEY: json.dumps(timestamps)
+    }
     authenticated_plugin.handshake_complete()
-    assert authenticated_plugin.persistent_cache == {COMMUNICATION_IDS_CACHE_KEY: TITLE_TO_COMMUNICATION_ID}
+    assert authenticated_plugin.persistent_cache == {
+        COMMUNICATION_IDS_CACHE_KEY: TITLE_TO_COMMUNICATION_ID,
+        COMMUNICATION_IDS_TIMESTAMPS_CACHE_KEY: timestamps
+    }
 
 
 @pytest.mark.asyncio
@@ -254,3 +283,46 @@ async def test_get_game_communication_id(
     http_get.return_value = backend_response
     assert mapping == await authenticated_psn_client.async_get_game_communication_id_map(mapping.keys())
     http_get.assert_called_once_with(GAME_DETAILS_URL.format(game_id_list=",".join(mapping.keys())))
+
+
+@pytest.mark.asyncio
+async def test_stale_cache_revalidated_in_background(
+    authenticated_plugin,
+    mock_get_game_communication_id_map,
+    mock_persistent_cache,
+    mocker
+):
+    comm_ids = TITLE_TO_COMMUNICATION_ID[GAME_ID]
+    stale_for = FRESHNESS_POLICIES["communication_ids"].max_age + 1
+    mocker.patch("plugin.time.time", return_value=stale_for)
+    mock_persistent_cache.return_value = {
+        COMMUNICATION_IDS_CACHE_KEY: {GAME_ID: comm_ids},
+        COMMUNICATION_IDS_TIMESTAMPS_CACHE_KEY: {GAME_ID: 0}
+    }
+    mock_get_game_communication_id_map.return_value = {GAME_ID: ["NPWR00000_00"]}
+
+    assert {GAME_ID: comm_ids} == await authenticated_plugin.get_game_communication_ids([GAME_ID])
+    await asyncio.gather(*authenticated_plugin._background_tasks)
+
+    mock_get_game_communication_id_map.assert_called_once_with([GAME_ID])
+    assert {GAME_ID: ["NPWR00000_00"]} == authenticated_plugin.persistent_cache[COMMUNICATION_IDS_CACHE_KEY]
+    assert {GAME_ID: stale_for} == authenticated_plugin.persistent_cache[COMMUNICATION_IDS_TIMESTAMPS_CACHE_KEY]
+
+
+@pytest.mark.asyncio
+async def test_cache_without_timestamps_stamped_on_load(
+    authenticated_plugin,
+    mock_get_game_communication_id_map,
+    mock_persistent_cache,
+    mocker
+):
+    mocker.patch("plugin.time.time", return_value=1000)
+    mock_persistent_cache.return_value = {COMMUNICATION_IDS_CACHE_KEY: json.dumps(TITLE_TO_COMMUNICATION_ID)}
+    authenticated_plugin.handshake_complete()
+
+    assert TITLE_TO_COMMUNICATION_ID == await authenticated_plugin.get_game_communication_ids(list(TITLE_TO_COMMUNICATION_ID))
+    await asyncio.gather(*authenticated_plugin._background_tasks)
+
+    mock_get_game_communication_id_map.assert_not_called()
+    assert dict.fromkeys(TITLE_TO_COMMUNICATION_ID, 1000) == \
+        authenticated_plugin.persistent_cache[COMMUNICATION_IDS_TIMESTAMPS_CACHE_KEY]
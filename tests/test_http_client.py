@@ -1,6 +1,14 @@
 import asyncio
+import json
 import pytest
+from types import SimpleNamespace
 from unittest.mock import Mock
+from yarl import URL
+from connection_pool import ConnectionStats, HostConnectionStats, HostSlots
+from latency import LatencyTracker
+from endpoints import endpoint_name
+from http_client import HttpClient, JSON_OFFLOAD_BYTES, paginate_url, rebase_url
+from psn_client import EARNED_TROPHIES_PAGE, GAME_LIST_URL, TROPHY_TITLES_URL, USER_INFO_PSPLUS_URL, create_offload_executor
 from galaxy.api.errors import AuthenticationRequired
 from http_client import AuthenticatedHttpClient
 from tests.async_mock import AsyncMockDelayed, AsyncMock
@@ -24,4 +32,264 @@ async def test_multiple_refreshing():
         http_client.request('url'),
     )
     for i in responses:
-        assert i == 'ok'
\ No newline at end of file
+        assert i == 'ok'
+
+@pytest.mark.asyncio
+async def test_late_401_replayed_without_another_refresh():
+    async def oauth_request(method, url):
+        sent_with = http_client._access_token
+        await asyncio.sleep(delays[url])
+        if sent_with == "old access token":
+            raise AuthenticationRequired()
+        return url
+
+    delays = {"fast": 0, "slow": 0.05}
+    http_client = AuthenticatedHttpClient(Mock, Mock)
+    http_client.can_refresh.set()
+    http_client._access_token = "old access token"
+    http_client.get_access_token = AsyncMock(return_value="refreshed access token")
+    http_client._oauth_request = oauth_request
+
+    # the slow request fails on the old token only after the refresh has finished
+    assert ["fast", "slow"] == await asyncio.gather(http_client.request("GET", "fast"), http_client.request("GET", "slow"))
+    assert http_client.get_access_token.call_count == 1
+    assert http_client.take_sync_auth_report() == {"refreshes": 1, "replays": 2}
+    assert http_client.take_sync_auth_report() == {}
+    assert http_client.session_auth_events == {"refreshes": 1, "replays": 2}
+
+@pytest.mark.asyncio
+async def test_host_slots_bound_requests_per_host():
+    host_slots = HostSlots({"limited.com": 2}, default_size=5)
+    assert host_slots("https://limited.com/a?b=c") is host_slots("https://limited.com/d")
+    running = 0
+    max_running = 0
+
+    async def request(url):
+        nonlocal running, max_running
+        async with host_slots(url):
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0)
+            running -= 1
+
+    await asyncio.gather(*[request("https://limited.com/") for _ in range(6)])
+    assert max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_connection_stats():
+    stats = ConnectionStats()
+    context = SimpleNamespace()
+    await stats._on_request_start(None, context, SimpleNamespace(url=URL("https://psn.com/path")))
+    await stats._on_dns_resolvehost_start(None, context, SimpleNamespace(host="psn.com"))
+    await stats._on_dns_resolvehost_end(None, context, SimpleNamespace(host="psn.com"))
+    await stats._on_connection_create_start(None, context, None)
+    await stats._on_connection_create_end(None, context, None)
+    await stats._on_connection_reuseconn(None, context, None)
+
+    report = stats.report()["psn.com"]
+    assert report["connections"] == 1
+    assert report["reused"] == 1
+    assert report["dns_resolves"] == 1
+    assert report["connect_time_max"] >= 0
+
+
+def test_host_connection_stats_running_totals():
+    stats = HostConnectionStats()
+    for duration in (0.1, 0.4, 0.1):
+        stats.record_connect(duration)
+    stats.record_dns(0.2)
+
+    report = stats.report()
+    assert report["connections"] == 3
+    assert report["connect_time_avg"] == pytest.approx(0.2)
+    assert report["connect_time_max"] == pytest.approx(0.4)
+    assert report["dns_resolves"] == 1
+    assert report["dns_time_avg"] == pytest.approx(0.2)
+
+
+@pytest.mark.asyncio
+async def test_prewarm(mocker):
+    http_client = AuthenticatedHttpClient(Mock, Mock)
+    head = mocker.patch.object(http_client._session, "head", new_callable=AsyncMock, return_value=Mock())
+    await http_client.prewarm({"a.com": 2, "b.com": 1})
+    assert sorted(call[0][0] for call in head.call_args_list) == ["https://a.com/", "https://a.com/", "https://b.com/"]
+    await http_client.logout()
+
+
+@pytest.mark.parametrize("url, endpoint", [
+    (EARNED_TROPHIES_PAGE.format(communication_id="NPWR11556_00", trophy_group_id="all"), "EARNED_TROPHIES_PAGE"),
+    (paginate_url(TROPHY_TITLES_URL, limit=100, offset=200), "TROPHY_TITLES_URL"),
+    (paginate_url(GAME_LIST_URL.format(user_id="me"), limit=100), "GAME_LIST_URL"),
+    (USER_INFO_PSPLUS_URL.format(user_id="me"), "USER_INFO_PSPLUS_URL"),
+    ("https://unknown.com/some/path?query=1", "unknown.com/some/path")
+])
+def test_endpoint_name(url, endpoint):
+    assert endpoint == endpoint_name(url)
+
+
+@pytest.fixture
+async def hedging_http_client():
+    http_client = AuthenticatedHttpClient(Mock, Mock)
+    http_client.enable_hedging({"EARNED_TROPHIES_PAGE"})
+    http_client.hedge_budget._tokens = http_client.hedge_budget._burst
+    for _ in range(20):
+        http_client.latency.record("EARNED_TROPHIES_PAGE", 0.01)
+    yield http_client
+    await http_client.logout()
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_first_response_wins(hedging_http_client):
+    url = EARNED_TROPHIES_PAGE.format(communication_id="NPWR11556_00", trophy_group_id="all")
+    calls = []
+
+    async def get(url, endpoint):
+        calls.append(endpoint)
+        try:
+            await asyncio.sleep(1 if len(calls) == 1 else 0)
+        except asyncio.CancelledError:
+            calls.append("cancelled")
+            raise
+        return len(calls)
+
+    hedging_http_client._fetch = get
+    assert 2 == await hedging_http_client.get(url)
+    await asyncio.sleep(0)
+    assert ["EARNED_TROPHIES_PAGE", "EARNED_TROPHIES_PAGE", "cancelled"] == calls
+    assert 1 == hedging_http_client.hedge_budget.hedged
+
+
+@pytest.mark.asyncio
+async def test_hedging_limited_by_budget(hedging_http_client):
+    url = EARNED_TROPHIES_PAGE.format(communication_id="NPWR11556_00", trophy_group_id="all")
+    hedging_http_client.hedge_budget._tokens = 0
+    hedging_http_client._fetch = AsyncMockDelayed(return_value="ok")
+
+    assert "ok" == await hedging_http_client.get(url)
+    hedging_http_client._fetch.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_not_hedged_endpoint(hedging_http_client):
+    hedging_http_client._fetch = AsyncMockDelayed(return_value="ok")
+    assert "ok" == await hedging_http_client.get(TROPHY_TITLES_URL)
+    hedging_http_client._fetch.assert_called_once_with(TROPHY_TITLES_URL, "TROPHY_TITLES_URL")
+
+
+@pytest.mark.asyncio
+async def test_hedge_delay_starts_once_slot_is_taken(hedging_http_client):
+    hedging_http_client._host_slots = HostSlots({}, default_size=2)
+    hedging_http_client.latency = LatencyTracker()
+    for _ in range(20):
+        hedging_http_client.latency.record("EARNED_TROPHIES_PAGE", 0.05)
+    url = EARNED_TROPHIES_PAGE.format(communication_id="NPWR11556_00", trophy_group_id="all")
+
+    async def fetch(url, endpoint):
+        await asyncio.sleep(0.03)
+        return "ok"
+
+    hedging_http_client._fetch = fetch
+    # the third request waits 0.03s for a slot, but is as fast as usual once sent
+    assert ["ok"] * 3 == await asyncio.gather(*[hedging_http_client.get(url) for _ in range(3)])
+    assert 0 == hedging_http_client.hedge_budget.hedged
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_when_host_slots_saturated(hedging_http_client):
+    hedging_http_client._host_slots = HostSlots({}, default_size=1)
+    url = EARNED_TROPHIES_PAGE.format(communication_id="NPWR11556_00", trophy_group_id="all")
+    hedging_http_client._fetch = AsyncMockDelayed(return_value="ok")
+
+    assert "ok" == await hedging_http_client.get(url)
+    hedging_http_client._fetch.assert_called_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size, offloaded", [(10, False), (JSON_OFFLOAD_BYTES, True)])
+async def test_json_decoding_offload(mocker, size, offloaded):
+    executor = create_offload_executor()
+    http_client = AuthenticatedHttpClient(Mock, Mock, executor=executor)
+    body = json.dumps({"name": "x" * size}).encode()
+    run_in_executor = mocker.spy(asyncio.get_running_loop(), "run_in_executor")
+
+    assert {"name": "x" * size} == await http_client._decode_json("endpoint", body)
+    assert run_in_executor.called == offloaded
+    if offloaded:
+        assert run_in_executor.call_args[0][0] is executor
+    # scheduling an offloaded job blocks the loop too
+    assert http_client.json_blocking_time > 0
+    await http_client.logout()
+    executor.shutdown()
+
+
+def _redirect(location, cookies=None):
+    from http.cookies import SimpleCookie
+    return Mock(status=302, headers={"Location": location}, cookies=SimpleCookie(cookies or {}))
+
+
+@pytest.mark.asyncio
+async def test_access_token_redirect_chain(mocker):
+    responses = [
+        _redirect("https://ca.account.sony.com/api/v1/oauth/authorize?step=2", {"session": "s"}),
+        _redirect("https://ca.account.sony.com/api/v1/oauth/authorize?step=3", {"npsso": "new npsso"}),
+        _redirect("https://remoteplay.dl.playstation.net/remoteplay/redirect#access_token=token&expires_in=3600"),
+    ]
+    sent_cookies = []
+
+    async def request(method, url, cookies, allow_redirects):
+        sent_cookies.append({key: morsel.value for key, morsel in cookies.items()})
+        return responses[len(sent_cookies) - 1]
+
+    mocker.patch("http_client.HttpClient.request", side_effect=request)
+    store_credentials = Mock()
+    http_client = AuthenticatedHttpClient(Mock(), store_credentials)
+
+    assert "token" == await http_client.get_access_token("npsso")
+
+    # cookies received on earlier hops are sent on later ones
+    assert sent_cookies == [
+        {"npsso": "npsso"},
+        {"npsso": "npsso", "session": "s"},
+        {"npsso": "new npsso", "session": "s"},
+    ]
+    store_credentials.assert_called_once_with({"npsso": "new npsso"})
+    assert [hop.status for hop in http_client.auth_hops] == [302, 302, 302]
+    assert http_client.auth_latency >= sum(hop.duration for hop in http_client.auth_hops)
+    for response in responses:
+        response.close.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_access_token_redirect_limit(mocker):
+    from http_client import MAX_AUTH_REDIRECTS
+    from galaxy.api.errors import UnknownBackendResponse
+    request = mocker.patch(
+        "http_client.HttpClient.request",
+        side_effect=AsyncMock(return_value=_redirect("https://ca.account.sony.com/api/v1/oauth/authorize"))
+    )
+    http_client = AuthenticatedHttpClient(Mock(), Mock())
+
+    with pytest.raises(UnknownBackendResponse):
+        await http_client.get_access_token("npsso")
+    assert request.call_count == MAX_AUTH_REDIRECTS
+    assert len(http_client.auth_hops) == MAX_AUTH_REDIRECTS
+
+
+def test_rebase_url():
+    assert rebase_url("http://127.0.0.1:8080/", GAME_LIST_URL.format(user_id="me")) == \
+        "http://127.0.0.1:8080/gamelist.api.playstation.com" + GAME_LIST_URL[len("https://gamelist.api.playstation.com"):].format(user_id="me")
+
+
+@pytest.mark.asyncio
+async def test_requests_sent_to_base_url(mocker):
+    http_client = HttpClient(base_url="http://127.0.0.1:8080")
+    response = Mock(status=200, read=AsyncMock(return_value=b"{}"), text=AsyncMock(return_value="{}"))
+    session_request = mocker.patch.object(http_client._session, "request", new_callable=AsyncMock, return_value=response)
+
+    await http_client.get(USER_INFO_PSPLUS_URL.format(user_id="me"))
+
+    assert session_request.call_args[0][1].startswith("http://127.0.0.1:8080/pl-prof.np.community.playstation.net/userProfile/")
+    # endpoints are still told apart by their PSN url
+    assert list(http_client.metrics.snapshot()) == ["USER_INFO_PSPLUS_URL"]
+    await http_client._session.close()
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from import_scheduler import ImportScheduler
+
+
+@pytest.mark.asyncio
+async def test_priority_order():
+    imported = []
+
+    async def job(key):
+        imported.append(key)
+
+    scheduler = ImportScheduler(max_workers=1)
+    for priority, key in [(10, "old"), (30, "newest"), (20, "recent"), (20, "recent too")]:
+        scheduler.put(priority, lambda key=key: job(key), key=key)
+    assert scheduler.queue_depth == 4
+
+    await scheduler.run()
+
+    assert imported == ["newest", "recent", "recent too", "old"]
+    assert scheduler.queue_depth == 0
+    assert [record.key for record in scheduler.completed] == imported
+
+
+@pytest.mark.asyncio
+async def test_bounded_workers():
+    running = 0
+    max_running = 0
+
+    async def job():
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0)
+        running -= 1
+
+    scheduler = ImportScheduler(max_workers=3)
+    for i in range(10):
+        scheduler.put(i, job, key=i)
+    await scheduler.run()
+
+    assert max_running == 3
+    assert len(scheduler.completed) == 10
+
+
+@pytest.mark.asyncio
+async def test_failed_job_does_not_stop_workers():
+    async def failing():
+        raise RuntimeError()
+
+    async def succeeding():
+        pass
+
+    scheduler = ImportScheduler(max_workers=1)
+    scheduler.put(2, failing, key="failing")
+    scheduler.put(1, succeeding, key="succeeding")
+    await scheduler.run()
+
+    assert [record.key for record in scheduler.completed] == ["failing", "succeeding"]
+
+
+@pytest.mark.asyncio
+async def test_report():
+    async def job():
+        await asyncio.sleep(0)
+
+    scheduler = ImportScheduler(max_workers=2)
+    assert scheduler.report()["completed"] == 0
+    for key in range(3):
+        scheduler.put(0, job, key=key)
+    await scheduler.run()
+
+    report = scheduler.report()
+    assert report["completed"] == 3
+    assert report["queue_depth"] == 0
+    assert report["duration_max"] >= report["duration_avg"] >= 0
@@ -0,0 +1,66 @@
+import logging
+from unittest.mock import Mock
+
+import pytest
+
+from http_client import HttpClient
+from log_events import EventLog, Truncated, event_log
+from tests.async_mock import AsyncMock
+
+
+class _Exploding:
+    def __repr__(self):
+        raise AssertionError("formatted although the record was not emitted")
+
+
+def test_truncated_body():
+    assert "abc" == str(Truncated(b"abc"))
+    assert "ab... (4 bytes in total)" == str(Truncated(b"abcd", limit=2))
+
+
+def test_truncated_payload_is_bounded():
+    text = str(Truncated({"profiles": list(range(1000))}, limit=1000))
+    assert text.startswith("{'profiles': [0, 1, 2,")
+    assert len(text) < 100
+
+
+def test_fields_formatted_only_when_emitted(caplog):
+    events = EventLog()
+    caplog.set_level(logging.INFO)
+    events.debug("http.response", payload=_Exploding())
+    events.log(logging.INFO, "http.response", "endpoint", status=200)
+    record, = caplog.records
+    assert "http.response key=endpoint status=200" == record.getMessage()
+    assert {"key": "endpoint", "status": 200} == record.fields
+
+
+def test_repeated_events_sampled(caplog):
+    events = EventLog(sample_first=2, sample_every=5)
+    caplog.set_level(logging.DEBUG)
+    for _ in range(10):
+        events.debug("parse", "friend_list_parser", size=1)
+    events.debug("parse", "trophies_parser", size=1)
+    assert [
+        "parse key=friend_list_parser size=1",
+        "parse key=friend_list_parser size=1",
+        "parse key=friend_list_parser size=1 suppressed=2",
+        "parse key=friend_list_parser size=1 suppressed=4",
+        "parse key=trophies_parser size=1",
+    ] == [record.getMessage() for record in caplog.records]
+
+
+@pytest.mark.asyncio
+async def test_get_reads_body_once_and_logs_it_truncated(mocker, caplog):
+    caplog.set_level(logging.DEBUG)
+    event_log.reset()
+    http_client = HttpClient()
+    body = b'{"a": "' + b"x" * 5000 + b'"}'
+    response = Mock(status=200, read=AsyncMock(return_value=body), text=AsyncMock())
+    mocker.patch.object(http_client._session, "request", new_callable=AsyncMock, return_value=response)
+    assert {"a": "x" * 5000} == await http_client.get("https://psn.com/large")
+    response.text.assert_not_called()
+    response.read.assert_called_once_with()
+    logged, = [record for record in caplog.records if getattr(record, "event", None) == "http.response"]
+    assert "(5009 bytes in total)" in logged.getMessage()
+    assert len(logged.getMessage()) < 1200
+    await http_client._session.close()
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from loop_monitor import LoopLagMonitor
+from plugin import PSNPlugin
+from tracing import tracer
+
+
+def _monitor(clock, lags=()):
+    """Monitor whose sampler wakes up late by each of lags in turn, then on time"""
+    lags = list(lags)
+
+    async def sleep(delay):
+        await clock.sleep(delay + (lags.pop(0) if lags else 0.0))
+        await asyncio.sleep(0)
+
+    return LoopLagMonitor(interval=0.01, threshold=0.05, clock=clock, sleep=sleep)
+
+
+@pytest.mark.asyncio
+async def test_lag_sampled(clock):
+    monitor = _monitor(clock, lags=[0.02, 0.2])
+    monitor.start()
+    for _ in range(5):
+        await asyncio.sleep(0)
+    monitor.stop()
+
+    report = monitor.report()
+    assert report["samples"] == 4
+    assert report["lag_max"] == pytest.approx(0.2)
+    assert report["blocked"] == pytest.approx(0.2)
+    event, = monitor.blocking_events
+    assert event.task == "unknown"
+
+
+@pytest.mark.asyncio
+async def test_blocking_attributed_to_span(clock):
+    monitor = _monitor(clock)
+    monitor._heartbeat = clock()
+    tracer.enable()
+    try:
+        with tracer.span("parse", "test"):
+            clock.now += 0.1
+            # what the watchdog thread does while the loop is blocked here
+            monitor._check(asyncio.get_event_loop(), threading.get_ident())
+    finally:
+        tracer.disable()
+        tracer.clear()
+    monitor._record_blocking(0.1)
+
+    event, = monitor.blocking_events
+    assert event.span == "parse"
+    assert event.task == "test_blocking_attributed_to_span"
+    assert event.stack[0].endswith(" _check")
+    assert set(monitor.report()["blocked_by"]) == {"parse"}
+
+
+@pytest.mark.asyncio
+async def test_stop_does_not_wait_for_watchdog(clock):
+    # the watchdog checks every 5s
+    monitor = LoopLagMonitor(interval=0.01, threshold=10, clock=clock, sleep=clock.sleep)
+    monitor.start()
+    watchdog, = [thread for thread in threading.enumerate() if thread.name == "loop-monitor"]
+    monitor.stop()
+    assert not monitor.running
+    await asyncio.get_event_loop().run_in_executor(None, watchdog.join, 1)
+    assert not watchdog.is_alive()
+
+
+@pytest.mark.asyncio
+async def test_switched_at_runtime(clock):
+    plugin = PSNPlugin(MagicMock(), MagicMock(), None)
+    plugin.loop_monitor = monitor = _monitor(clock)
+    plugin.set_loop_monitoring(True)
+    assert monitor.running
+    for _ in range(3):
+        await asyncio.sleep(0)
+    plugin.set_loop_monitoring(False)
+    assert not monitor.running
+    samples = monitor.samples
+    assert samples > 0
+    for _ in range(3):
+        await asyncio.sleep(0)
+    assert monitor.samples == samples
+    assert monitor.blocking_events == []
+    await plugin.shutdown()
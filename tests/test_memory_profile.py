@@ -0,0 +1,65 @@
+import sys
+import tracemalloc
+
+import pytest
+
+from cache import Cache
+from memory_profile import CHECKPOINTS, MemoryProfiler, deep_sizeof, parse_checkpoints
+from tests.async_mock import AsyncMock
+
+
+def test_parse_checkpoints():
+    assert [] == parse_checkpoints(None)
+    assert list(CHECKPOINTS) == parse_checkpoints("all")
+    assert ["after_sync", "after_import"] == parse_checkpoints("after_sync, after_import,unknown")
+
+
+def test_deep_sizeof_follows_containers_and_attributes():
+    value = "x" * 1000
+    cache = Cache()
+    cache.update("key", [value], 1)
+    assert deep_sizeof(cache) > sys.getsizeof(value)
+    # shared objects are counted once
+    assert deep_sizeof([value, value]) == sys.getsizeof([value, value]) + sys.getsizeof(value)
+
+
+def test_checkpoint_reports_growth():
+    profiler = MemoryProfiler(["after_sync"])
+    profiler.start()
+    try:
+        grown = [bytearray(1000) for _ in range(100)]
+        report = profiler.checkpoint("after_sync", {"grown": grown})
+        assert profiler.checkpoint("after_import", {}) is None
+    finally:
+        profiler.stop()
+
+    assert not tracemalloc.is_tracing()
+    assert report is profiler.reports["after_sync"]
+    assert report.structures["grown"] >= 100 * 1000
+    top = report.top_sites[0]
+    assert top.size_diff >= 100 * 1000
+    assert top.count_diff >= 100
+    assert top.site.startswith("{}:".format(__file__))
+
+
+def test_disabled_profiler_does_not_trace():
+    profiler = MemoryProfiler()
+    profiler.start()
+    assert not tracemalloc.is_tracing()
+    assert profiler.checkpoint("after_sync", {}) is None
+
+
+@pytest.mark.asyncio
+async def test_plugin_presence_checkpoint(psn_plugin, mocker):
+    presences = [{"1": "presence"}]
+    mocker.patch("plugin.PSNClient.async_get_friends_presences", new_callable=AsyncMock, return_value=presences)
+    psn_plugin.memory_profiler = MemoryProfiler(["after_presence"])
+    psn_plugin.memory_profiler.start()
+    try:
+        assert presences == await psn_plugin.prepare_user_presence_context(["1"])
+    finally:
+        psn_plugin.memory_profiler.stop()
+
+    structures = psn_plugin.memory_profiler.reports["after_presence"].structures
+    assert structures["presence_context"] == deep_sizeof(presences)
+    assert {"trophies_cache", "comm_ids_cache", "trophy_titles_cache", "friends_cache", "persistent_cache"} < set(structures)
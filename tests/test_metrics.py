@@ -0,0 +1,49 @@
+import aiohttp
+import pytest
+from unittest.mock import Mock
+from galaxy.api.errors import BackendError
+from http_client import HttpClient
+from metrics import Histogram, MetricsRegistry
+from tests.async_mock import AsyncMock
+
+
+def test_histogram_buckets():
+    histogram = Histogram((0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+    assert histogram.snapshot() == {"count": 4, "sum": 3.65, "buckets": {"0.1": 2, "1": 1, "inf": 1}}
+
+
+def test_registry_snapshot():
+    metrics = MetricsRegistry()
+    metrics.record_status("GAME_LIST_URL", 200)
+    metrics.record_status("GAME_LIST_URL", "BackendTimeout")
+    metrics.record_response("GAME_LIST_URL", 0.2, 1024)
+    metrics.record_retry("GAME_LIST_URL")
+    metrics.record_timeout("GAME_LIST_URL", "total")
+
+    snapshot = metrics.snapshot()["GAME_LIST_URL"]
+    assert snapshot["requests"] == 2
+    assert snapshot["statuses"] == {200: 1, "BackendTimeout": 1}
+    assert snapshot["bytes"] == 1024
+    assert snapshot["retries"] == 1
+    assert snapshot["timeouts"] == {"total": 1}
+    assert snapshot["latency"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_http_client_records_requests(mocker):
+    http_client = HttpClient()
+    response = Mock(status=200, read=AsyncMock(return_value=b'{"a": 1}'), text=AsyncMock(return_value='{"a": 1}'))
+    error = aiohttp.ClientResponseError(Mock(), (), status=500)
+    mocker.patch.object(http_client._session, "request", new_callable=AsyncMock, side_effect=[response, error])
+
+    assert {"a": 1} == await http_client.get("https://psn.com/a")
+    with pytest.raises(BackendError):
+        await http_client.get("https://psn.com/a")
+
+    snapshot = http_client.metrics.snapshot()["psn.com/a"]
+    assert snapshot["statuses"] == {200: 1, 500: 1}
+    assert snapshot["bytes"] == 8
+    assert snapshot["latency"]["count"] == 1
+    await http_client._session.close()
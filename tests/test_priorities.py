@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from priorities import FairSemaphore, Priority, current_priority, priority
+
+
+async def _fill(semaphore, order, classes):
+    async def request(priority_class, key):
+        await semaphore.acquire(priority_class)
+        order.append(key)
+        await asyncio.sleep(0)
+        semaphore.release()
+
+    await semaphore.acquire(Priority.Sync)
+    tasks = [asyncio.ensure_future(request(priority_class, key)) for priority_class, key in classes]
+    await asyncio.sleep(0)
+    semaphore.release()
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio
+async def test_weighted_fair_order():
+    semaphore = FairSemaphore(1, {Priority.Interactive: 4, Priority.Sync: 2, Priority.Backfill: 1})
+    order = []
+    classes = [(Priority.Backfill, "b%d" % i) for i in range(4)] + \
+        [(Priority.Interactive, "i%d" % i) for i in range(4)]
+
+    await _fill(semaphore, order, classes)
+
+    # interactive gets 4 slots for each backfill one, backfill is not starved
+    assert order == ["i0", "i1", "i2", "b0", "i3", "b1", "b2", "b3"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_hold_slot():
+    semaphore = FairSemaphore(1)
+    await semaphore.acquire()
+    waiter = asyncio.ensure_future(semaphore.acquire(Priority.Backfill))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    semaphore.release()
+    await asyncio.wait_for(semaphore.acquire(), 1)
+    assert semaphore.locked()
+
+
+@pytest.mark.asyncio
+async def test_priority_decorator():
+    @priority(Priority.Backfill)
+    async def backfill():
+        return current_priority(), await asyncio.ensure_future(spawned())
+
+    async def spawned():
+        return current_priority()
+
+    assert (Priority.Backfill, Priority.Backfill) == await backfill()
+    assert Priority.Sync == current_priority()
@@ -1,6 +1,11 @@
 import math
 import pytest
 from galaxy.api.errors import TooManyRequests, UnknownBackendResponse
+from galaxy.api.types import PresenceState, UserPresence
+from psn_client import (
+    EARNED_TROPHIES_PAGE, FIELDS, FRIENDS_URL, FRIENDS_WITH_PRESENCE_URL, GAME_LIST_URL,
+    _parse_timestamp_slow, parse_timestamp, parse_timestamps, payload_size, psnow_catalog_size
+)
 from tests.async_mock import AsyncMock
 
 TROPHIES = [
@@ -231,3 +236,141 @@ async def test_request_limit(
         await authenticated_psn_client.get_trophy_titles()
 
     http_request.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_offloaded_pagination(
+    http_get,
+    authenticated_psn_client,
+    mocker
+):
+    limit = 13
+    authenticated_psn_client._parse_offload_threshold = limit
+    offload = mocker.spy(authenticated_psn_client, "_async")
+
+    http_get.side_effect = create_backend_response_generator(limit)()
+    assert_all_games_fetched(await authenticated_psn_client.fetch_paginated_data(
+        parser, TROPHIES_PAGE, "totalResults", limit))
+    offload.assert_called_once()
+    # scheduling the job is counted
+    assert authenticated_psn_client.loop_blocking_time > 0
+
+
+@pytest.mark.asyncio
+async def test_small_payload_not_offloaded(
+    http_get,
+    authenticated_psn_client,
+    mocker
+):
+    authenticated_psn_client._parse_offload_threshold = len(TROPHIES)
+    offload = mocker.spy(authenticated_psn_client, "_async")
+
+    http_get.side_effect = create_backend_response_generator()()
+    assert_all_games_fetched(await authenticated_psn_client.fetch_data(parser, TROPHIES_PAGE))
+    assert not offload.called
+    assert authenticated_psn_client.loop_blocking_time > 0
+
+
+@pytest.mark.asyncio
+async def test_offloaded_parsing_error(
+    http_get,
+    authenticated_psn_client
+):
+    authenticated_psn_client._parse_offload_threshold = 0
+    http_get.return_value = {"trophyTitles": [{"no-id": None}]}
+
+    with pytest.raises(UnknownBackendResponse):
+        await authenticated_psn_client.fetch_data(parser, TROPHIES_PAGE)
+
+
+def test_psnow_catalog_size():
+    catalog = {"categories": [{"name": "A", "games": [{}] * 3000} for _ in range(30)]}
+    assert payload_size(catalog) == 30
+    assert psnow_catalog_size(catalog) == 90000
+
+
+@pytest.mark.parametrize("date", [
+    "1987-02-07T10:14:42Z",
+    "2018-03-28T19:29:51Z",
+    "2000-02-29T00:00:00Z",
+    "1970-01-01T00:00:00Z",
+    "2038-01-19T03:14:08Z",
+    "2019-12-31T23:59:59Z"
+])
+def test_parse_timestamp_matches_strptime(date):
+    assert _parse_timestamp_slow(date) == parse_timestamp(date)
+
+
+@pytest.mark.parametrize("date", [
+    None,
+    "",
+    "2018-03-28",
+    "2018-13-28T19:29:51Z",
+    "2018-03-28T19:29:51",
+    "2018-03-28 19:29:51Z",
+    "20a8-03-28T19:29:51Z"
+])
+def test_parse_timestamp_bad_format(date):
+    with pytest.raises((TypeError, ValueError)):
+        parse_timestamp(date)
+
+
+def test_parse_timestamps():
+    dates = ["2018-03-28T19:29:51Z", "1987-02-07T10:14:42Z", "2018-03-28T19:29:51Z"]
+    assert [1522265391, 539691282, 1522265391] == parse_timestamps(dates)
+
+
+@pytest.mark.parametrize("url", [
+    EARNED_TROPHIES_PAGE, GAME_LIST_URL, FRIENDS_URL, FRIENDS_WITH_PRESENCE_URL
+])
+@pytest.mark.parametrize("dropped", [
+    "trophyRare", "trophyEarnedRate", "trophySmallIconUrl", "groupId", "lastOnlineDate", "iw=", "ih="
+])
+def test_urls_request_projected_fields_only(url, dropped):
+    assert dropped not in url
+
+
+def project(record, fields):
+    return {key: value for key, value in record.items() if key in fields}
+
+
+@pytest.mark.asyncio
+async def test_owned_games_parser_on_projected_fields(http_get, authenticated_psn_client):
+    title = {"titleId": "CUSA07917_00", "name": "Tooth and Tail", "image": "url", "playCount": 21}
+    http_get.return_value = {"titles": [project(title, FIELDS["async_get_owned_games"])], "totalResults": 1}
+    games = await authenticated_psn_client.async_get_owned_games()
+    assert [(game.game_id, game.game_title) for game in games] == [("CUSA07917_00", "Tooth and Tail")]
+
+
+@pytest.mark.asyncio
+async def test_earned_trophies_parser_on_projected_fields(http_get, authenticated_psn_client):
+    # @default fields of a trophy
+    trophy = {
+        "trophyId": 1, "trophyHidden": False, "trophyType": "bronze", "trophyName": "Taking the Plunge",
+        "trophyDetail": "detail", "trophyIconUrl": "url",
+        "fromUser": {"onlineId": "user", "earned": True, "earnedDate": "2018-03-28T19:29:51Z"}
+    }
+    http_get.return_value = {"trophies": [trophy]}
+    achievements = await authenticated_psn_client.async_get_earned_trophies("NPWR1")
+    assert [(a.achievement_id, a.achievement_name, a.unlock_time) for a in achievements] == \
+        [("NPWR1_1", "Taking the Plunge", 1522265391)]
+
+
+@pytest.mark.asyncio
+async def test_friends_presences_parser_on_projected_fields(http_get, authenticated_psn_client):
+    # presences(@titleInfo) without lastOnlineDate
+    profile = {
+        "accountId": "123", "primaryOnlineStatus": "online",
+        "presences": [{"onlineStatus": "online", "platform": "PS4", "npTitleId": "CUSA1", "titleName": "Game"}]
+    }
+    http_get.return_value = {"profiles": [profile], "totalResults": 1}
+    assert await authenticated_psn_client.async_get_friends_presences() == \
+        [{"123": UserPresence(PresenceState.Online, "CUSA1", "Game")}]
+
+
+@pytest.mark.asyncio
+async def test_friends_parser_on_projected_fields(http_get, authenticated_psn_client):
+    profile = {"accountId": "123", "onlineId": "friend", "avatarUrls": [{"size": "l", "avatarUrl": "url"}]}
+    http_get.return_value = {"profiles": [project(profile, FIELDS["async_get_friends"])], "totalResults": 1}
+    friends = await authenticated_psn_client.async_get_friends()
+    assert [(f.user_id, f.user_name, f.avatar_url) for f in friends] == [("123", "friend", "url")]
@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from unittest.mock import Mock
+from galaxy.api.errors import TooManyRequests
+from http_client import AuthenticatedHttpClient
+from rate_limit import MIN_RATE, RateLimiters, TokenBucket
+from tests.async_mock import AsyncMock
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_burst_then_rate(mocker, clock):
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+    mocker.patch("rate_limit.asyncio.sleep", new=clock.sleep)
+
+    for _ in range(3):
+        assert 0 == await bucket.acquire()
+    assert 0.5 == await bucket.acquire()
+
+
+def test_throttled_rate_recovers(clock):
+    bucket = TokenBucket(rate=4, burst=4, clock=clock)
+    bucket.throttled()
+    assert bucket.rate == 2
+    for _ in range(100):
+        bucket.succeeded()
+    assert bucket.rate == 4
+    for _ in range(100):
+        bucket.throttled()
+    assert bucket.rate == MIN_RATE
+
+
+def test_families():
+    limiters = RateLimiters()
+    assert "trophy" == limiters.family("https://pl-tpy.np.community.playstation.net/trophy/v1/trophyTitles")
+    assert "profile" == limiters.family("https://us-prof.np.community.playstation.net/userProfile/v1/users/me")
+    assert limiters.family("https://auth.api.sonyentertainmentnetwork.com/2.0/oauth/authorize") is None
+
+
+@pytest.mark.asyncio
+async def test_too_many_requests_feeds_limiter(mocker):
+    http_client = AuthenticatedHttpClient(Mock, Mock, rate_limits={"trophy": (1000, 1)})
+    http_client._access_token = "token"
+    mocker.patch.object(http_client._session, "request", new_callable=AsyncMock, side_effect=TooManyRequests())
+    url = "https://pl-tpy.np.community.playstation.net/trophy/v1/trophyTitles"
+
+    with pytest.raises(TooManyRequests):
+        await http_client.request("GET", url=url)
+    assert http_client.rate_limiters.throttled == {"trophy": 1}
+
+    # the bucket was emptied, the next request waits for a token
+    with pytest.raises(TooManyRequests):
+        await asyncio.wait_for(http_client.request("GET", url=url), 1)
+    report = http_client.rate_limiters.take_sync_report()
+    assert report["trophy"] > 0
+    assert {} == http_client.rate_limiters.take_sync_report()
+    assert http_client.rate_limiters.session_wait_times["trophy"] == report["trophy"]
+    await http_client.logout()
+
+
+@pytest.mark.asyncio
+async def test_latency_excludes_rate_limit_wait(mocker, clock):
+    http_client = AuthenticatedHttpClient(Mock, Mock, rate_limits={"trophy": (1, 1)})
+    http_client._access_token = "token"
+    http_client.rate_limiters._buckets["trophy"] = TokenBucket(rate=1, burst=1, clock=clock)
+    mocker.patch("http_client.time.perf_counter", new=clock)
+    mocker.patch("rate_limit.asyncio.sleep", new=clock.sleep)
+
+    async def request(*args, **kwargs):
+        clock.now += 0.1
+        return Mock(status=200, read=AsyncMock(return_value=b"{}"))
+    mocker.patch.object(http_client._session, "request", new=request)
+    record = mocker.patch.object(http_client.latency, "record")
+    url = "https://pl-tpy.np.community.playstation.net/trophy/v1/trophyTitles"
+
+    await http_client.get(url)
+    await http_client.get(url)
+
+    assert http_client.rate_limiters.session_wait_times["trophy"] == pytest.approx(0.9)
+    assert [call[0][1] for call in record.call_args_list] == [pytest.approx(0.1), pytest.approx(0.1)]
+    await http_client.logout()
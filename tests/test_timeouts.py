@@ -0,0 +1,84 @@
+import asyncio
+import aiohttp
+import pytest
+from unittest.mock import Mock
+from galaxy.api.errors import BackendTimeout
+from http_client import AuthenticatedHttpClient
+from latency import LatencyTracker
+from timeouts import AdaptiveTimeouts, Deadlines, TIMEOUT_POLICIES, timeout_phase
+from tests.async_mock import AsyncMock
+
+
+@pytest.fixture
+def timeouts():
+    timeouts = AdaptiveTimeouts(LatencyTracker(min_samples=5), LatencyTracker(min_samples=5))
+    timeouts.set_classes({"USER_INFO_URL": "small"})
+    return timeouts
+
+
+def test_policy_max_without_samples(timeouts):
+    policy = TIMEOUT_POLICIES["small"]
+    deadlines = timeouts.deadlines("USER_INFO_URL")
+    assert deadlines.connect == policy.connect
+    assert deadlines.first_byte == policy.first_byte_max
+    assert deadlines.total == policy.total_max
+    client_timeout = deadlines.client_timeout()
+    assert (client_timeout.total, client_timeout.connect, client_timeout.sock_read) == \
+        (policy.total_max, policy.connect, None)
+
+
+def test_adapts_to_latency(timeouts):
+    for _ in range(10):
+        timeouts._first_byte_latency.record("USER_INFO_URL", 1.5)
+        timeouts._total_latency.record("USER_INFO_URL", 2)
+        timeouts._total_latency.record("GAME_LIST_URL", 0.01)
+    deadlines = timeouts.deadlines("USER_INFO_URL")
+    assert deadlines.first_byte == 4.5
+    assert deadlines.total == 6
+    assert timeouts.deadlines("GAME_LIST_URL").total == TIMEOUT_POLICIES["page"].total_min
+
+
+@pytest.mark.parametrize("error, during, phase", [
+    (aiohttp.ServerTimeoutError(), "first_byte", "connect"),
+    (asyncio.TimeoutError(), "first_byte", "first_byte"),
+    (asyncio.TimeoutError(), "total", "total"),
+    (None, "total", "total"),
+])
+def test_timeout_phase(error, during, phase):
+    assert timeout_phase(error, during) == phase
+
+
+@pytest.mark.asyncio
+async def test_request_timeout_recorded(mocker):
+    http_client = AuthenticatedHttpClient(Mock, Mock)
+    http_client._access_token = "token"
+    session_request = mocker.patch.object(
+        http_client._session, "request", new_callable=AsyncMock,
+        side_effect=aiohttp.ServerTimeoutError("Connection timeout to host https://psn.com")
+    )
+    with pytest.raises(BackendTimeout):
+        await http_client._get("https://psn.com/a", "psn.com/a")
+    assert session_request.call_args[1]["timeout"].total == TIMEOUT_POLICIES["page"].total_max
+    assert http_client.timeouts.events == {("psn.com/a", "connect"): 1}
+    await http_client.logout()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("delay, phase", [(1, "first_byte"), (0, "total")])
+async def test_first_byte_and_total_deadlines(mocker, delay, phase):
+    http_client = AuthenticatedHttpClient(Mock, Mock)
+    http_client._access_token = "token"
+    http_client.timeouts.deadlines = Mock(return_value=Deadlines(connect=1, first_byte=0.01, total=1))
+
+    async def read():
+        raise asyncio.TimeoutError()  # aiohttp enforcing the total deadline
+
+    async def request(*args, **kwargs):
+        await asyncio.sleep(delay)
+        return Mock(read=read)
+
+    mocker.patch.object(http_client._session, "request", new=request)
+    with pytest.raises(BackendTimeout):
+        await http_client.get("https://psn.com/a")
+    assert http_client.timeouts.events == {("psn.com/a", phase): 1}
+    await http_client.logout()
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import pytest
+from tracing import Tracer, current_span, traced, tracer
+
+
+@pytest.fixture
+def enabled_tracer():
+    tracer.enable()
+    yield tracer
+    tracer.disable()
+    tracer.clear()
+
+
+def test_disabled_tracer_records_nothing():
+    disabled = Tracer()
+    with disabled.span("name", "test"):
+        assert current_span() is None
+    assert disabled.trace_events()["traceEvents"] == []
+
+
+@pytest.mark.asyncio
+async def test_spans_of_concurrent_tasks(enabled_tracer):
+    @traced("test")
+    async def child(delay):
+        await asyncio.sleep(delay)
+        return current_span()
+
+    @traced("test")
+    async def parent():
+        return await asyncio.gather(child(0.01), child(0))
+
+    assert await parent() == [child.__qualname__] * 2
+
+    events = {event["ts"]: event for event in enabled_tracer.trace_events()["traceEvents"]}
+    parent_event, *children = sorted(events.values(), key=lambda event: event["ts"])
+    assert parent_event["name"] == parent.__qualname__
+    assert all(event["args"]["parent"] == parent.__qualname__ for event in children)
+    # gathered coroutines run in their own tasks, so each gets a track
+    assert len({event["tid"] for event in events.values()}) == 3
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events.values())
+
+
+@pytest.mark.asyncio
+async def test_async_generator_steps_traced(enabled_tracer):
+    @traced("test")
+    async def pages():
+        yield current_span()
+        yield current_span()
+
+    items = []
+    async for item in pages():
+        # the consumer runs outside the generator's span
+        assert current_span() is None
+        items.append(item)
+
+    assert items == [pages.__qualname__] * 2
+    events = enabled_tracer.trace_events()["traceEvents"]
+    # one span per item and one for the step that finds the generator exhausted
+    assert [event["name"] for event in events] == [pages.__qualname__] * 3
+
+
+def test_export(enabled_tracer, tmp_path):
+    @traced("test")
+    def parse():
+        pass
+
+    parse()
+    path = str(tmp_path / "trace.json")
+    enabled_tracer.export(path)
+    with open(path) as trace_file:
+        trace = json.load(trace_file)
+    assert [event["name"] for event in trace["traceEvents"]] == [parse.__qualname__]
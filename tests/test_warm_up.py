@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+from plugin import OWNED_GAMES_WARM_UP, TROPHY_TITLES_WARM_UP, WARM_UP_CONNECTIONS
+from tests.async_mock import AsyncMock
+from tests.test_data import GAMES, TITLES, TITLE_TO_COMMUNICATION_ID, CONTEXT
+
+
+@pytest.fixture(autouse=True)
+def mock_warm_up():
+    """Overrides the conftest fixture, warm-up is what is tested here"""
+
+
+@pytest.fixture(autouse=True)
+def mock_prewarm(mocker):
+    return mocker.patch("plugin.AuthenticatedHttpClient.prewarm", new_callable=AsyncMock)
+
+
+@pytest.fixture
+def mock_client_get_owned_games(mocker):
+    return mocker.patch("plugin.PSNClient.async_get_owned_games", new_callable=AsyncMock, return_value=TITLES)
+
+
+@pytest.fixture
+def mock_get_game_communication_id_map(mocker):
+    return mocker.patch(
+        "plugin.PSNClient.async_get_game_communication_id_map",
+        new_callable=AsyncMock,
+        side_effect=lambda title_ids: {title_id: TITLE_TO_COMMUNICATION_ID[title_id] for title_id in title_ids}
+    )
+
+
+@pytest.fixture
+def mock_get_trophy_titles(mocker):
+    return mocker.patch("plugin.PSNClient.get_trophy_titles", new_callable=AsyncMock, return_value=CONTEXT)
+
+
+@pytest.fixture
+def mock_client_get_earned_trophies(mocker):
+    return mocker.patch("plugin.PSNClient.async_get_earned_trophies", new_callable=AsyncMock, return_value=[])
+
+
+async def _finish_warm_up(plugin):
+    await asyncio.sleep(0)
+    await asyncio.gather(*plugin._background_tasks)
+
+
+@pytest.mark.asyncio
+async def test_galaxy_calls_attach_to_warm_up(
+    authenticated_plugin,
+    mock_client_get_owned_games,
+    mock_get_game_communication_id_map,
+    mock_get_trophy_titles,
+    mock_client_get_earned_trophies,
+    mock_prewarm
+):
+    authenticated_plugin.handshake_complete()
+    await _finish_warm_up(authenticated_plugin)
+    mock_prewarm.assert_called_once_with(WARM_UP_CONNECTIONS)
+
+    assert GAMES == await authenticated_plugin.get_owned_games()
+    assert CONTEXT == await authenticated_plugin.prepare_achievements_context([GAMES[0].game_id])
+
+    mock_client_get_owned_games.assert_called_once_with()
+    mock_get_trophy_titles.assert_called_once_with()
+    assert {OWNED_GAMES_WARM_UP, TROPHY_TITLES_WARM_UP} == set(authenticated_plugin.warm_up_savings)
+
+
+@pytest.mark.asyncio
+async def test_warm_up_serves_only_first_call(
+    authenticated_plugin,
+    mock_client_get_owned_games,
+    mock_get_game_communication_id_map,
+    mock_get_trophy_titles
+):
+    authenticated_plugin.handshake_complete()
+    await _finish_warm_up(authenticated_plugin)
+
+    await authenticated_plugin.get_owned_games()
+    await authenticated_plugin.get_owned_games()
+
+    assert 2 == mock_client_get_owned_games.call_count
+
+
+@pytest.mark.asyncio
+async def test_warm_up_waits_for_authentication(
+    psn_plugin,
+    mock_client_get_owned_games,
+    mock_get_trophy_titles
+):
+    psn_plugin.handshake_complete()
+    await asyncio.sleep(0)
+
+    assert not mock_client_get_owned_games.called
+    assert not mock_get_trophy_titles.called
+
+
+@pytest.mark.asyncio
+async def test_achievements_context_awaits_trophy_titles_warm_up(
+    authenticated_plugin,
+    mock_client_get_owned_games,
+    mock_get_game_communication_id_map,
+    mock_client_get_earned_trophies,
+    mocker
+):
+    titles_requested = asyncio.Event()
+    release_titles = asyncio.Event()
+
+    async def get_trophy_titles(_self):
+        titles_requested.set()
+        await release_titles.wait()
+        return CONTEXT
+    mocker.patch("plugin.PSNClient.get_trophy_titles", new=get_trophy_titles)
+
+    authenticated_plugin.handshake_complete()
+    await titles_requested.wait()
+    await asyncio.sleep(0.05)
+    # the warm-up result does not depend on the cache it was stored in
+    authenticated_plugin._trophy_titles_cache.get = AsyncMock(side_effect=AssertionError)
+
+    context = asyncio.ensure_future(authenticated_plugin.prepare_achievements_context([GAMES[0].game_id]))
+    await asyncio.sleep(0.02)
+    release_titles.set()
+    assert CONTEXT == await context
+
+    # the call waited for about 0.02s of the 0.07s the warm-up ran
+    assert 0.03 < authenticated_plugin.warm_up_savings[TROPHY_TITLES_WARM_UP] < 0.07
+    await _finish_warm_up(authenticated_plugin)